@@ -1,5 +1,15 @@
+from collections import Counter
+
 from django.contrib import admin
-from .models import Profile, Classroom, GradeScale, HomeworkTemplate, StudentSubmission
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from .models import (
+    Profile, Classroom, GradeScale, HomeworkTemplate, StudentSubmission, NotificationOutbox, Notification,
+    PerformanceSnapshot, GradingEvent, UserTenant, RequestProfile,
+)
 
 
 @admin.register(Profile)
@@ -28,3 +38,128 @@ class HomeworkTemplateAdmin(admin.ModelAdmin):
 class StudentSubmissionAdmin(admin.ModelAdmin):
     list_display = ("student", "homework_template", "graded", "grade", "submitted_at")
     list_filter = ("graded", "grade")
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ("recipient", "kind", "created_at", "processed_at", "delivered", "attempts")
+    list_filter = ("kind", "processed_at")
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ("user", "title", "is_read", "created_at")
+    list_filter = ("is_read",)
+
+
+@admin.register(PerformanceSnapshot)
+class PerformanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("classroom", "student", "period_label", "submissions", "avg_percent", "on_time_rate")
+    list_filter = ("period", "classroom")
+
+
+@admin.register(GradingEvent)
+class GradingEventAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "student", "homework_template", "source", "old_score", "new_score", "actor")
+    list_filter = ("source", "partition")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UserTenant)
+class UserTenantAdmin(admin.ModelAdmin):
+    list_display = ("user", "tenant")
+    list_filter = ("tenant",)
+    search_fields = ("user__username",)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    TOP_FUNCTIONS = 30
+
+    list_display = (
+        "created_at", "user", "method", "path", "status", "duration_ms", "query_count", "query_ms", "memory_peak_kb",
+    )
+    list_filter = ("method", "status", "view_name")
+    search_fields = ("path", "user__username")
+    exclude = ("stacks", "queries", "allocations")
+    readonly_fields = ("stacks_link", "top_functions", "sql", "memory")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/stacks/",
+                self.admin_site.admin_view(self.stacks_view),
+                name="homework_requestprofile_stacks",
+            ),
+            *super().get_urls(),
+        ]
+
+    def stacks_view(self, request, pk):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        obj = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(obj.stacks, content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="profile-{obj.pk}.folded"'
+        return response
+
+    @admin.display(description="Стеки")
+    def stacks_link(self, obj):
+        url = reverse("admin:homework_requestprofile_stacks", args=[obj.pk])
+        return format_html(
+            '<a href="{}">Скачать</a> ({} выборок; для flamegraph.pl или speedscope.app)', url, obj.samples
+        )
+
+    @admin.display(description="Функции")
+    def top_functions(self, obj):
+        # Доля выборок, где функция была в стеке (всего) и на вершине (сама).
+        total = Counter()
+        own = Counter()
+        samples = 0
+        for line in obj.stacks.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            frames = stack.split(";")
+            count = int(count)
+            samples += count
+            own[frames[-1]] += count
+            for frame in set(frames[1:]):
+                total[frame] += count
+        if not samples:
+            return "—"
+        rows = format_html_join(
+            "", "<tr><td>{}%</td><td>{}%</td><td>{}</td></tr>",
+            (
+                (round(count * 100 / samples, 1), round(own[frame] * 100 / samples, 1), frame)
+                for frame, count in total.most_common(self.TOP_FUNCTIONS)
+            ),
+        )
+        return format_html("<table><tr><th>Всего</th><th>Сама</th><th>Функция</th></tr>{}</table>", rows)
+
+    @admin.display(description="SQL")
+    def sql(self, obj):
+        rows = format_html_join(
+            "", "<tr><td>{}</td><td>{}</td><td><code>{}</code></td></tr>",
+            ((q["db"], q["ms"], q["sql"]) for q in obj.queries),
+        )
+        return format_html("<table><tr><th>База</th><th>мс</th><th>Запрос</th></tr>{}</table>", rows)
+
+    @admin.display(description="Память (оставшиеся выделения)")
+    def memory(self, obj):
+        rows = format_html_join(
+            "", "<tr><td>{}</td><td>{}</td><td>{}</td></tr>",
+            ((a["size_kb"], a["count"], a["where"]) for a in obj.allocations),
+        )
+        return format_html("<table><tr><th>КБ</th><th>Блоков</th><th>Где</th></tr>{}</table>", rows)
@@ -0,0 +1,251 @@
+import datetime
+import math
+from collections import defaultdict
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Ceil, RowNumber
+
+from homework import metrics, replicas, tenants
+from homework.caching import homework_data_tokens
+from homework.grading import GRADE_STEPS, grades_for
+from homework.models import HomeworkTemplate, PerformanceSnapshot, RollupCheckpoint, StudentSubmission
+
+CHECKPOINT = "performance"
+PERIODS = ("week", "term")
+GRADES = (1, 2, 3, 4, 5)
+BAND_PERCENTILES = (0.25, 0.5, 0.75)
+
+
+def school_year(day):
+    month, first_day = settings.SCHOOL_TERM_STARTS[0]
+    return day.year if day >= datetime.date(day.year, month, first_day) else day.year - 1
+
+
+def _term_starts(year):
+    first_month = settings.SCHOOL_TERM_STARTS[0][0]
+    return [
+        datetime.date(year if month >= first_month else year + 1, month, day)
+        for month, day in settings.SCHOOL_TERM_STARTS
+    ]
+
+
+def school_year_bounds(year):
+    # [начало учебного года year/year+1, начало следующего)
+    return _term_starts(year)[0], _term_starts(year + 1)[0]
+
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def term_start(day):
+    return max(start for start in _term_starts(school_year(day)) if start <= day)
+
+
+def period_start(period, day):
+    return week_start(day) if period == "week" else term_start(day)
+
+
+def period_end(period, start):
+    if period == "week":
+        return start + datetime.timedelta(days=7)
+    year = school_year(start)
+    later = [s for s in _term_starts(year) + _term_starts(year + 1)[:1] if s > start]
+    return later[0]
+
+
+def period_label(period, start):
+    if period == "week":
+        return f"Неделя с {start:%d.%m.%Y}"
+    year = school_year(start)
+    number = _term_starts(year).index(start) + 1
+    return f"{number} четверть {year}/{str(year + 1)[-2:]}"
+
+
+def _load(classroom_ranges):
+    # Все сдачи по ДЗ затронутых классов с дедлайном в пересчитываемых
+    # периодах: одна выборка ДЗ и одна выборка сдач, дальше всё в pandas.
+    hw_filter = Q(pk__in=[])
+    for classroom_id, (start, end) in classroom_ranges.items():
+        hw_filter |= Q(classroom_id=classroom_id, deadline__gte=start, deadline__lt=end)
+
+    homeworks = pd.DataFrame.from_records(
+        HomeworkTemplate.objects.filter(hw_filter).values_list(
+            "id", "classroom_id", "deadline", "max_score", "questions",
+            "grade_scale__threshold_2", "grade_scale__threshold_3",
+            "grade_scale__threshold_4", "grade_scale__threshold_5",
+        ),
+        columns=["hw_id", "classroom_id", "deadline", "max_score", "questions", "t2", "t3", "t4", "t5"],
+    )
+    if homeworks.empty:
+        return None
+    points = homeworks["questions"].map(lambda q: len(q or []))
+    homeworks["max_points"] = homeworks["max_score"].where(homeworks["max_score"] > 0, points)
+    homeworks = homeworks.drop(columns=["questions", "max_score"])
+
+    submissions = pd.DataFrame.from_records(
+        StudentSubmission.objects
+        .filter(homework_template_id__in=homeworks["hw_id"].tolist())
+        .values_list("homework_template_id", "student_id", "final_score", "grade", "submitted_at"),
+        columns=["hw_id", "student_id", "final_score", "grade", "submitted_at"],
+    )
+    if submissions.empty:
+        return None
+    return submissions.merge(homeworks, on="hw_id")
+
+
+def _prepare(df):
+    max_points = df["max_points"].where(df["max_points"] > 0)
+    df["percent"] = df["final_score"] * 100 / max_points
+
+    submitted = pd.to_datetime(df["submitted_at"], utc=True).dt.tz_convert(settings.TIME_ZONE)
+    submitted_day = submitted.dt.tz_localize(None).dt.normalize()
+    df["on_time"] = submitted_day <= pd.to_datetime(df["deadline"])
+
+    # Оценка, выставленная учителем, важнее вычисленной по шкале ДЗ.
+    computed = pd.Series(grades_for(df["percent"].fillna(0), {g: df[f"t{g}"] for g in GRADE_STEPS}), index=df.index)
+    df["grade"] = pd.to_numeric(df["grade"]).fillna(computed).astype(int)
+
+    deadlines = df["deadline"].unique()
+    for period in PERIODS:
+        starts = {day: period_start(period, day) for day in deadlines}
+        df[f"{period}_start"] = df["deadline"].map(starts)
+    return df
+
+
+def _rollup(df, keys):
+    grouped = df.groupby(keys, sort=False)
+    summary = grouped.agg(
+        submissions=("hw_id", "size"),
+        avg_percent=("percent", "mean"),
+        on_time_rate=("on_time", "mean"),
+    )
+    grades = df.groupby(keys + ["grade"], sort=False).size().unstack(fill_value=0)
+    return summary.join(grades)
+
+
+def _snapshots(df, affected):
+    rows = []
+    for period in PERIODS:
+        start_col = f"{period}_start"
+        for keys in (["classroom_id", start_col], ["classroom_id", "student_id", start_col]):
+            table = _rollup(df, keys)
+            for index, values in table.to_dict("index").items():
+                key = dict(zip(keys, index))
+                start = key[start_col]
+                if affected is not None and start not in affected[key["classroom_id"], period]:
+                    continue
+                avg_percent = values["avg_percent"]
+                rows.append(PerformanceSnapshot(
+                    classroom_id=key["classroom_id"],
+                    student_id=key.get("student_id"),
+                    period=period,
+                    period_start=start,
+                    period_label=period_label(period, start),
+                    submissions=int(values["submissions"]),
+                    avg_percent=None if pd.isna(avg_percent) else round(float(avg_percent), 1),
+                    on_time_rate=round(float(values["on_time_rate"]), 3),
+                    grade_counts={str(g): int(values[g]) for g in GRADES if values.get(g)},
+                ))
+    return rows
+
+
+def refresh(full=False):
+    checkpoint, _ = RollupCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    # Сдачи читаются с реплики, если она настроена. Контрольная точка
+    # берётся из прочитанных данных, поэтому отставание реплики лишь
+    # откладывает свежие сдачи до следующего прохода.
+    with replicas.reads():
+        changes = StudentSubmission.objects.all()
+        if not full and checkpoint.updated_at is not None:
+            changes = changes.filter(
+                Q(updated_at__gt=checkpoint.updated_at)
+                | Q(updated_at=checkpoint.updated_at, id__gt=checkpoint.last_id)
+            )
+        last = changes.order_by("-updated_at", "-id").values("updated_at", "id").first()
+        if last is None and not full:
+            return 0
+
+        if full:
+            affected = None
+            classroom_ranges = {
+                classroom_id: (datetime.date.min, datetime.date.max)
+                for classroom_id in HomeworkTemplate.objects.values_list("classroom_id", flat=True).distinct()
+            }
+        else:
+            # Пересчитываются только группы (класс, период), в которые попали
+            # изменённые с прошлого прохода сдачи.
+            changed_hw_ids = (
+                changes
+                .filter(Q(updated_at__lt=last["updated_at"]) | Q(updated_at=last["updated_at"], id__lte=last["id"]))
+                .values("homework_template_id")
+            )
+            affected = defaultdict(set)
+            classroom_ranges = {}
+            for classroom_id, deadline in (
+                HomeworkTemplate.objects.filter(pk__in=changed_hw_ids).values_list("classroom_id", "deadline").distinct()
+            ):
+                for period in PERIODS:
+                    start = period_start(period, deadline)
+                    affected[classroom_id, period].add(start)
+                    low, high = classroom_ranges.get(classroom_id, (start, start))
+                    classroom_ranges[classroom_id] = (min(low, start), max(high, period_end(period, start)))
+
+        df = _load(classroom_ranges)
+        rows = _snapshots(_prepare(df), affected) if df is not None else []
+
+    with tenants.atomic():
+        stale = PerformanceSnapshot.objects.all()
+        if affected is not None:
+            stale_filter = Q(pk__in=[])
+            for (classroom_id, period), starts in affected.items():
+                stale_filter |= Q(classroom_id=classroom_id, period=period, period_start__in=starts)
+            stale = stale.filter(stale_filter)
+        stale.delete()
+        PerformanceSnapshot.objects.bulk_create(rows, batch_size=500)
+
+        if last is not None:
+            checkpoint.updated_at = last["updated_at"]
+            checkpoint.last_id = last["id"]
+            checkpoint.save(update_fields=["updated_at", "last_id"])
+
+    return len(rows)
+
+
+def _bands_query(hw_ids):
+    # Процентиль по методу ближайшего ранга: строка с номером ceil(p * n)
+    # внутри ДЗ. Нумерация и фильтр считаются в базе, наружу уходят
+    # не больше трёх строк на ДЗ.
+    ranked = StudentSubmission.objects.filter(homework_template_id__in=hw_ids).annotate(
+        rank=Window(RowNumber(), partition_by=F("homework_template_id"), order_by=F("final_score").asc()),
+        total=Window(Count("id"), partition_by=F("homework_template_id")),
+    )
+    wanted = Q(pk__in=[])
+    for p in BAND_PERCENTILES:
+        wanted |= Q(rank=Ceil(F("total") * p))
+    return ranked.filter(wanted).values_list("homework_template_id", "rank", "total", "final_score")
+
+
+async def ascore_bands(hw_ids):
+    tokens = homework_data_tokens(hw_ids)
+    keys = {f"score_bands:{pk}:{tokens[pk]}": pk for pk in hw_ids}
+    bands = {keys[key]: value for key, value in (await cache.aget_many(keys)).items()}
+
+    missing = [pk for pk in hw_ids if pk not in bands]
+    metrics.cache_lookup("score_bands", True, len(bands))
+    metrics.cache_lookup("score_bands", False, len(missing))
+    if missing:
+        fresh = {pk: [None] * len(BAND_PERCENTILES) for pk in missing}
+        async for hw_id, rank, total, score in _bands_query(missing):
+            for i, p in enumerate(BAND_PERCENTILES):
+                if rank == math.ceil(total * p):
+                    fresh[hw_id][i] = score
+        await cache.aset_many(
+            {f"score_bands:{pk}:{tokens[pk]}": tuple(value) for pk, value in fresh.items()},
+            replicas.cache_timeout(settings.ITEM_ANALYSIS_CACHE_TIMEOUT),
+        )
+        bands.update((pk, tuple(value)) for pk, value in fresh.items())
+    return bands
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from homework import metrics
+
+# Разметка листа ответов зависит только от структуры вопросов, поэтому она
+# рендерится один раз на версию шаблона ДЗ и кешируется с «дырками» под
+# ответы ученика; на каждый запрос остаётся только подставить значения.
+SLOT = "\x00"
+
+MANAGEMENT_FORM_ERROR = "Данные формы повреждены. Обновите страницу и попробуйте ещё раз."
+
+
+def _fragments(hw, prefix):
+    key = f"answer_sheet:{hw.pk}:{hw.questions_version}:{prefix}"
+    fragments = cache.get(key)
+    metrics.cache_lookup("answer_sheet", fragments is not None)
+    if fragments is None:
+        html = render_to_string("homework/_answer_sheet_rows.html", {
+            "prefix": prefix,
+            "questions": hw.questions or [],
+            "slot": SLOT,
+        })
+        fragments = html.split(SLOT)
+        cache.set(key, fragments, settings.ANSWER_SHEET_CACHE_TIMEOUT)
+    return fragments
+
+
+def render_rows(hw, prefix, values, errors=None):
+    fragments = _fragments(hw, prefix)
+    errors = errors or {}
+    parts = [fragments[0]]
+    for i in range(len(fragments) // 2):
+        value = values[i] if i < len(values) else ""
+        parts.append(conditional_escape(value or ""))
+        parts.append(fragments[2 * i + 1])
+        if i in errors:
+            parts.append(format_html('<div class="form__error">{}</div>', errors[i]))
+        parts.append(fragments[2 * i + 2])
+    return mark_safe("".join(parts))
+
+
+def management_form(hw, prefix):
+    total = len(hw.questions or [])
+    return mark_safe(
+        f'<input type="hidden" name="{prefix}-TOTAL_FORMS" value="{total}" id="id_{prefix}-TOTAL_FORMS">'
+        f'<input type="hidden" name="{prefix}-INITIAL_FORMS" value="{total}" id="id_{prefix}-INITIAL_FORMS">'
+    )
+
+
+def stored_values(hw, submission):
+    if submission is None:
+        return [""] * len(hw.questions or [])
+    return submission.answer_values(hw)
+
+
+def posted_values(hw, data, prefix):
+    return [data.get(f"{prefix}-{i}-answer", "") for i in range(len(hw.questions or []))]
+
+
+def build(hw, prefix, values, errors=None):
+    errors = errors or {}
+    return {
+        "management_form": management_form(hw, prefix),
+        "rows": render_rows(hw, prefix, values, errors),
+        "non_form_error": errors.get(None),
+    }
+
+
+def check_format(fmt, value):
+    if not value:
+        return None
+    if fmt == "int":
+        try:
+            int(value)
+        except ValueError:
+            return "Введите целое число."
+    elif fmt == "float":
+        try:
+            float(value.replace(",", "."))
+        except ValueError:
+            return "Введите число."
+    return None
+
+
+def _check_formats(hw, answers, numbers, errors):
+    formats = {str(q["number"]): q.get("answer_format", "text") for q in (hw.questions or [])}
+    for i, num in enumerate(numbers):
+        if i in errors:
+            continue
+        message = check_format(formats.get(num, "text"), answers[num])
+        if message:
+            errors[i] = message
+
+
+def parse(hw, data, prefix, validate=True):
+    # Быстрый путь для больших листов: читает a-N-number/a-N-answer напрямую,
+    # без создания Form на каждый вопрос, и возвращает то же, что clean_formset.
+    errors = {}
+    try:
+        total = int(data[f"{prefix}-TOTAL_FORMS"])
+        int(data[f"{prefix}-INITIAL_FORMS"])
+    except (KeyError, ValueError):
+        return {}, {None: MANAGEMENT_FORM_ERROR}
+    if total > settings.ANSWER_SHEET_MAX_ROWS:
+        return {}, {None: MANAGEMENT_FORM_ERROR}
+
+    answers = {}
+    numbers = []
+    for i in range(total):
+        raw_number = (data.get(f"{prefix}-{i}-number") or "").strip()
+        if not raw_number:
+            errors[i] = "Обязательное поле."
+            continue
+        try:
+            num = str(int(raw_number))
+        except ValueError:
+            errors[i] = "Введите целое число."
+            continue
+        answers[num] = (data.get(f"{prefix}-{i}-answer") or "").strip()
+        numbers.append(num)
+
+    if validate and not errors:
+        _check_formats(hw, answers, numbers, errors)
+    return answers, errors
+
+
+def clean_formset(hw, formset, validate=True):
+    if not formset.is_valid():
+        errors = {}
+        if formset.non_form_errors():
+            errors[None] = MANAGEMENT_FORM_ERROR
+        for i, form_errors in enumerate(formset.errors):
+            if form_errors:
+                errors[i] = next(iter(form_errors.values()))[0]
+        return {}, errors
+
+    answers = {}
+    numbers = []
+    for row in formset.cleaned_data:
+        num = str(row["number"])
+        answers[num] = (row["answer"] or "").strip()
+        numbers.append(num)
+
+    errors = {}
+    if validate:
+        _check_formats(hw, answers, numbers, errors)
+    return answers, errors
+
+
+def clean(hw, data, prefix, formset_class, validate=True):
+    if len(hw.questions or []) >= settings.ANSWER_SHEET_FAST_PATH_THRESHOLD:
+        return parse(hw, data, prefix, validate)
+    return clean_formset(hw, formset_class(data, prefix=prefix), validate)
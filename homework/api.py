@@ -0,0 +1,231 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+
+from homework.models import HomeworkTemplate, StudentSubmission
+from homework.replicas import replica_reads
+from homework.permissions import (
+    get_profile, homework_role, visible_classrooms, visible_homeworks, visible_submissions
+)
+
+# Имя поля в API -> поле модели для values(). Второй набор — поля по
+# умолчанию, если клиент не передал fields=.
+CLASSROOM_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "teacher_id": "teacher_id",
+    "updated_at": "updated_at",
+}
+CLASSROOM_DEFAULT = ("id", "name", "teacher_id", "updated_at")
+
+HOMEWORK_FIELDS = {
+    "id": "id",
+    "classroom_id": "classroom_id",
+    "title": "title",
+    "description": "description",
+    "assigned_date": "assigned_date",
+    "deadline": "deadline",
+    "max_score": "max_score",
+    "questions": "questions",
+    "questions_version": "questions_version",
+    "closed_at": "closed_at",
+    "updated_at": "updated_at",
+}
+HOMEWORK_TEACHER_FIELDS = {**HOMEWORK_FIELDS, "correct_answers": "correct_answers"}
+HOMEWORK_DEFAULT = ("id", "classroom_id", "title", "assigned_date", "deadline", "max_score", "updated_at")
+
+SUBMISSION_FIELDS = {
+    "id": "id",
+    "homework_id": "homework_template_id",
+    "student_id": "student_id",
+    # Хранимый формат ответов зависит от answers_schema и layout_version;
+    # в API — всегда {номер вопроса: ответ} (см. _answer_map).
+    "answers": ("answers", "answers_schema", "layout_version"),
+    "auto_score": "auto_score",
+    "final_score": "final_score",
+    "grade": "grade",
+    "graded": "graded",
+    "teacher_comment": "teacher_comment",
+    "is_missing": "is_missing",
+    "submitted_at": "submitted_at",
+    "updated_at": "updated_at",
+}
+SUBMISSION_DEFAULT = ("id", "student_id", "auto_score", "final_score", "grade", "graded", "submitted_at", "updated_at")
+
+GRADE_FIELDS = {
+    name: SUBMISSION_FIELDS[name]
+    for name in ("id", "homework_id", "student_id", "final_score", "grade", "graded", "updated_at")
+}
+GRADE_DEFAULT = tuple(GRADE_FIELDS)
+
+
+def _error(status, message):
+    return JsonResponse({"error": message}, status=status)
+
+
+def api_view(view):
+    @require_GET
+    @wraps(view)
+    @replica_reads
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _error(401, "Требуется вход")
+        profile = get_profile(request.user)
+        if profile is None:
+            return _error(403, "Нет профиля")
+        try:
+            return view(request, profile, *args, **kwargs)
+        except ValueError as exc:
+            return _error(400, str(exc))
+    return wrapper
+
+
+def _projection(request, fields, default):
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(default)
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+    return names
+
+
+def _int_param(request, name, default=None):
+    value = request.GET.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Параметр {name} должен быть числом")
+
+
+def _etag(request, *parts):
+    # Сильный ETag: маркер данных (максимальный updated_at и число строк),
+    # пользователь и всё, что влияет на тело ответа.
+    digest = hashlib.sha256(repr((request.path, request.user.pk, *parts)).encode()).hexdigest()
+    return quote_etag(digest[:32])
+
+
+def _conditional(request, etag, build):
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _rows(qs, fields, names, convert=None):
+    # pk и updated_at нужны для курсора и ETag, даже если их не запросили.
+    # Поле из нескольких столбцов (кортеж) собирает convert[имя](row).
+    convert = convert or {}
+    paths = []
+    for name in names:
+        for path in fields[name] if isinstance(fields[name], tuple) else (fields[name],):
+            if path not in paths:
+                paths.append(path)
+    extra = [path for path in ("pk", "updated_at") if path not in paths]
+    for row in qs.values(*paths, *extra):
+        yield row, {name: convert[name](row) if name in convert else row[fields[name]] for name in names}
+
+
+def _answer_map(hw, row):
+    submission = StudentSubmission(
+        answers=row["answers"], answers_schema=row["answers_schema"], layout_version=row["layout_version"],
+    )
+    return submission.answer_map(hw)
+
+
+def _list(request, qs, fields, default, *etag_parts, convert=None):
+    names = _projection(request, fields, default)
+    after = _int_param(request, "cursor", 0)
+    limit = min(_int_param(request, "limit", settings.API_PAGE_SIZE), settings.API_MAX_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError("Параметр limit должен быть положительным")
+
+    marker = qs.aggregate(updated=Max("updated_at"), total=Count("id"))
+    etag = _etag(request, names, after, limit, marker["updated"], marker["total"], *etag_parts)
+
+    def build():
+        page = list(_rows(qs.filter(pk__gt=after).order_by("pk")[:limit + 1], fields, names, convert))
+        has_more = len(page) > limit
+        page = page[:limit]
+        return {
+            "results": [item for _, item in page],
+            "next_cursor": str(page[-1][0]["pk"]) if has_more else None,
+        }
+
+    return _conditional(request, etag, build)
+
+
+def _detail(request, qs, pk, fields, default, *etag_parts):
+    names = _projection(request, fields, default)
+    found = next(_rows(qs.filter(pk=pk), fields, names), None)
+    if found is None:
+        return _error(404, "Не найдено")
+    row, item = found
+    return _conditional(request, _etag(request, names, row["updated_at"], *etag_parts), lambda: item)
+
+
+@api_view
+def classroom_list(request, profile):
+    return _list(request, visible_classrooms(request.user, profile), CLASSROOM_FIELDS, CLASSROOM_DEFAULT)
+
+
+@api_view
+def classroom_detail(request, profile, pk):
+    return _detail(request, visible_classrooms(request.user, profile), pk, CLASSROOM_FIELDS, CLASSROOM_DEFAULT)
+
+
+def _homework_fields(profile):
+    return HOMEWORK_TEACHER_FIELDS if profile.role == "teacher" else HOMEWORK_FIELDS
+
+
+@api_view
+def homework_list(request, profile):
+    qs = visible_homeworks(request.user, profile)
+    classroom_id = _int_param(request, "classroom")
+    if classroom_id is not None:
+        qs = qs.filter(classroom_id=classroom_id)
+    return _list(request, qs, _homework_fields(profile), HOMEWORK_DEFAULT, profile.role)
+
+
+@api_view
+def homework_detail(request, profile, pk):
+    qs = visible_homeworks(request.user, profile)
+    return _detail(request, qs, pk, _homework_fields(profile), HOMEWORK_DEFAULT, profile.role)
+
+
+@api_view
+def homework_submissions(request, profile, pk):
+    hw = HomeworkTemplate.objects.select_related("classroom").filter(pk=pk).first()
+    if hw is None:
+        return _error(404, "Не найдено")
+    if homework_role(request.user, profile, hw) is None:
+        return _error(403, "Нет доступа")
+    qs = visible_submissions(request.user, profile).filter(homework_template=hw)
+    # Ответы раскладываются по текущим вопросам ДЗ: их версия входит в ETag.
+    return _list(
+        request, qs, SUBMISSION_FIELDS, SUBMISSION_DEFAULT, hw.questions_version,
+        convert={"answers": lambda row: _answer_map(hw, row)},
+    )
+
+
+@api_view
+def grade_list(request, profile):
+    qs = visible_submissions(request.user, profile)
+    classroom_id = _int_param(request, "classroom")
+    if classroom_id is not None:
+        qs = qs.filter(homework_template__classroom_id=classroom_id)
+    student_id = _int_param(request, "student")
+    if student_id is not None:
+        qs = qs.filter(student_id=student_id)
+    return _list(request, qs, GRADE_FIELDS, GRADE_DEFAULT)
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import api
+
+app_name = "api"
+
+urlpatterns = [
+    path("classrooms/", api.classroom_list, name="classroom_list"),
+    path("classrooms/<int:pk>/", api.classroom_detail, name="classroom_detail"),
+    path("homeworks/", api.homework_list, name="homework_list"),
+    path("homeworks/<int:pk>/", api.homework_detail, name="homework_detail"),
+    path("homeworks/<int:pk>/submissions/", api.homework_submissions, name="homework_submissions"),
+    path("grades/", api.grade_list, name="grade_list"),
+]
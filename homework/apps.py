@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class HomeworkConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'homework'
+
+    def ready(self):
+        from homework import signals  # noqa: F401
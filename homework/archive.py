@@ -0,0 +1,170 @@
+import gzip
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.utils import timezone
+
+from homework import tenants
+from homework.caching import bump_homework_data
+from homework.models import (
+    Classroom,
+    GradeScale,
+    GradingEvent,
+    HomeworkTemplate,
+    PerformanceSnapshot,
+    StudentSubmission,
+)
+
+# Архив — gzip-файл в формате JSON Lines (сериализатор Django "jsonl"),
+# один на класс и учебный год. Строки идут в порядке зависимостей:
+# шкалы, класс, ДЗ, сдачи, журнал проверки — при восстановлении каждая
+# строка ссылается только на уже восстановленные.
+
+
+def year_directory(year):
+    return os.path.join(settings.ARCHIVE_ROOT, f"{year}-{year + 1}")
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _collect(qs, ids):
+    # Запоминает первичные ключи по мере выгрузки: удалять потом можно
+    # только то, что действительно попало в архив.
+    for obj in qs.iterator(chunk_size=2000):
+        ids.append(obj.pk)
+        yield obj
+
+
+def export_classroom(classroom, hw_ids, path):
+    # Сначала во временный файл: неполный архив не должен выглядеть готовым.
+    # Возвращает ключи выгруженных строк по моделям.
+    submissions = StudentSubmission.objects.filter(homework_template_id__in=hw_ids).order_by("pk")
+    events = GradingEvent.objects.filter(homework_template_id__in=hw_ids).order_by("pk")
+    homeworks = HomeworkTemplate.objects.filter(pk__in=hw_ids).order_by("pk")
+    scales = GradeScale.objects.filter(pk__in=homeworks.values("grade_scale_id"))
+
+    serializer = serializers.get_serializer("jsonl")()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.part"
+    exported = {}
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for qs in (scales, Classroom.objects.filter(pk=classroom.pk), homeworks, submissions, events):
+            ids = exported.setdefault(qs.model, [])
+            serializer.serialize(_collect(qs, ids), stream=f)
+    os.replace(tmp, path)
+    return exported
+
+
+def purge(model, ids, chunk_size=None, pause=None):
+    # Удаление короткими транзакциями по chunk_size строк: запись в базу
+    # у остальных блокируется только на время одной пачки, а не всего архива.
+    chunk_size = chunk_size or settings.ARCHIVE_CHUNK_SIZE
+    pause = settings.ARCHIVE_CHUNK_PAUSE if pause is None else pause
+    total = 0
+    for chunk in _chunks(ids, chunk_size):
+        with tenants.atomic():
+            model.objects.filter(pk__in=chunk).delete()
+        total += len(chunk)
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def archive_classroom(classroom, start, end, chunk_size=None, pause=None):
+    hw_ids = list(
+        classroom.homeworks.filter(deadline__gte=start, deadline__lt=end).values_list("pk", flat=True)
+    )
+    stamp = timezone.localtime().strftime("%Y%m%d%H%M%S")
+    path = os.path.join(year_directory(start.year), f"classroom-{classroom.pk}-{stamp}.jsonl.gz")
+    exported = export_classroom(classroom, hw_ids, path)
+
+    # Удаляются только выгруженные строки: сдачи и события, появившиеся
+    # во время выгрузки, остаются в базе (а с ними и их ДЗ — каскад
+    # ниже не сработает, удаление ДЗ с новыми сдачами пропускается).
+    purge(GradingEvent, exported[GradingEvent], chunk_size, pause)
+    purge(StudentSubmission, exported[StudentSubmission], chunk_size, pause)
+    kept = set()
+    for model in (StudentSubmission, GradingEvent):
+        kept.update(
+            model.objects.filter(homework_template_id__in=hw_ids).values_list("homework_template_id", flat=True)
+        )
+    purge(HomeworkTemplate, [pk for pk in exported[HomeworkTemplate] if pk not in kept], chunk_size, pause)
+
+    # Класс удаляется, только если в нём не осталось ни ДЗ, ни учеников.
+    # Сводки успеваемости не архивируются (их можно пересчитать) и
+    # удаляются пачками заранее, чтобы каскад не держал одну длинную транзакцию.
+    dropped = False
+    if not classroom.homeworks.exists() and not classroom.students_profiles.exists():
+        snapshots = list(classroom.performance_snapshots.order_by("pk").values_list("pk", flat=True))
+        purge(PerformanceSnapshot, snapshots, chunk_size, pause)
+        classroom.delete()
+        dropped = True
+    return {
+        "path": path,
+        "homeworks": len(exported[HomeworkTemplate]),
+        "submissions": len(exported[StudentSubmission]),
+        "events": len(exported[GradingEvent]),
+        "classroom_deleted": dropped,
+    }
+
+
+def restore(path, batch_size=None):
+    # Повторное восстановление безопасно: строки с уже существующими
+    # первичными ключами (и повторные сдачи ученика) пропускаются.
+    batch_size = batch_size or settings.ARCHIVE_CHUNK_SIZE
+    counts = {}
+    skipped = 0
+    hw_ids = set()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        objects = (item.object for item in serializers.deserialize("jsonl", f, ignorenonexistent=True))
+        for batch in _chunks(objects, batch_size):
+            for model, group in _by_model(batch):
+                if model is Classroom:
+                    missing = {obj.teacher_id for obj in group} - set(
+                        User.objects.filter(pk__in={obj.teacher_id for obj in group}).values_list("pk", flat=True)
+                    )
+                    if missing:
+                        raise ValueError(f"Нет учителя с id {', '.join(map(str, sorted(missing)))}")
+                if model is StudentSubmission:
+                    # Ученики, удалённые после архивации, восстановить нельзя.
+                    existing = set(
+                        User.objects.filter(pk__in={obj.student_id for obj in group}).values_list("pk", flat=True)
+                    )
+                    skipped += len(group)
+                    group = [obj for obj in group if obj.student_id in existing]
+                    skipped -= len(group)
+                if model is HomeworkTemplate:
+                    hw_ids.update(obj.pk for obj in group)
+                _insert(model, group)
+                counts[model._meta.verbose_name_plural] = counts.get(model._meta.verbose_name_plural, 0) + len(group)
+    if hw_ids:
+        bump_homework_data(hw_ids)
+    return counts, skipped
+
+
+def _by_model(objects):
+    groups = {}
+    for obj in objects:
+        groups.setdefault(type(obj), []).append(obj)
+    return groups.items()
+
+
+def _insert(model, objects):
+    # bulk_create проставляет auto_now_add заново, поэтому время отправки
+    # возвращается отдельным bulk_update. updated_at остаётся текущим —
+    # восстановленные сдачи попадут в ближайший пересчёт сводок.
+    submitted = {obj.pk: obj.submitted_at for obj in objects} if model is StudentSubmission else None
+    with tenants.atomic():
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        if submitted:
+            for obj in objects:
+                obj.submitted_at = submitted[obj.pk]
+            StudentSubmission.objects.bulk_update(objects, ["submitted_at"])
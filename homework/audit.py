@@ -0,0 +1,90 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from homework import tenants
+from homework.models import GradingEvent, partition_for
+from homework.permissions import attach_users
+
+logger = logging.getLogger(__name__)
+
+# События копятся в памяти процесса и пишутся одним bulk_create после
+# ответа (request_finished), когда набралась пачка или прошло
+# GRADING_EVENT_FLUSH_INTERVAL секунд с первого несохранённого события.
+_lock = threading.Lock()
+_pending = []
+_oldest = None
+
+
+def _append(tenant, event):
+    global _oldest
+    with _lock:
+        if not _pending:
+            _oldest = time.monotonic()
+        _pending.append((tenant, event))
+
+
+def record(source, hw, student_id, new_score, auto_score, old_score=None, actor=None):
+    now = timezone.now()
+    event = GradingEvent(
+        student_id=student_id,
+        homework_template_id=hw.pk,
+        actor_id=getattr(actor, "pk", None),
+        source=source,
+        old_score=old_score,
+        new_score=new_score,
+        auto_score=auto_score,
+        answer_key_version=hw.answer_key_version,
+        created_at=now,
+        partition=partition_for(now),
+    )
+    # При откате транзакции изменения оценки не было — и события тоже.
+    tenant = tenants.current()
+    tenants.on_commit(lambda: _append(tenant, event))
+
+
+def flush():
+    global _pending
+    with _lock:
+        batch, _pending = _pending, []
+    if not batch:
+        return 0
+    by_tenant = {}
+    for tenant, event in batch:
+        by_tenant.setdefault(tenant, []).append(event)
+    written = set()
+    try:
+        for tenant, events in by_tenant.items():
+            with tenants.use_tenant(tenant):
+                GradingEvent.objects.bulk_create(events, batch_size=settings.GRADING_EVENT_BATCH_SIZE)
+            written.add(tenant)
+    except Exception:
+        with _lock:
+            _pending = [item for item in batch if item[0] not in written] + _pending
+        raise
+    return len(batch)
+
+
+def flush_if_due():
+    with _lock:
+        due = _pending and (
+            len(_pending) >= settings.GRADING_EVENT_BATCH_SIZE
+            or time.monotonic() - _oldest >= settings.GRADING_EVENT_FLUSH_INTERVAL
+        )
+    if due:
+        try:
+            flush()
+        except Exception:
+            logger.exception("Не удалось записать журнал проверки, повтор после следующего запроса")
+
+
+atexit.register(flush)
+
+
+def history(hw, student_id, limit=20):
+    events = GradingEvent.objects.filter(student_id=student_id, homework_template_id=hw.pk)
+    return attach_users(list(events.order_by("-created_at")[:limit]), "actor")
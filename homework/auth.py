@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from homework import metrics, tenants
+from homework.models import Profile
+
+
+def _cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def forget_cached_users(user_ids, using=None):
+    # В режиме школ ключ получает префикс текущей школы (make_cache_key),
+    # а сброс бывает из контекста другой школы или вовсе без неё — поэтому
+    # ключ строится в контексте школы пользователя: из базы экземпляра
+    # (using) или по UserTenant.
+    if not settings.TENANTS:
+        cache.delete_many([_cache_key(pk) for pk in user_ids])
+        return
+    by_tenant = defaultdict(list)
+    for pk in user_ids:
+        tenant = using if using is not None else tenants.for_user(pk)
+        if tenant in settings.TENANTS:
+            by_tenant[tenant].append(pk)
+        else:
+            # Без школы пользователь кешируется в той школе, по хосту
+            # которой зашёл, — сбрасываем во всех.
+            for name in (None, *settings.TENANTS):
+                by_tenant[name].append(pk)
+    for tenant, ids in by_tenant.items():
+        with tenants.use_tenant(tenant):
+            cache.delete_many([_cache_key(pk) for pk in ids])
+
+
+class ProfileModelBackend(ModelBackend):
+    # Пользователь грузится одним запросом вместе с профилем и классом
+    # и кешируется; сигналы сбрасывают кеш при изменении User/Profile/Classroom.
+
+    def get_user(self, user_id):
+        key = _cache_key(user_id)
+        user = cache.get(key)
+        metrics.cache_lookup("auth_user", user is not None)
+        if user is None:
+            user = self._load(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+    def _load(self, user_id):
+        if not settings.TENANTS:
+            return (
+                User._default_manager
+                .select_related("profile", "profile__classroom")
+                .filter(pk=user_id)
+                .first()
+            )
+        # Профиль лежит в базе школы, пользователь — в общей: два запроса.
+        user = User._default_manager.filter(pk=user_id).first()
+        if user is not None:
+            profile = Profile.objects.select_related("classroom").filter(user_id=user_id).first()
+            User.profile.related.set_cached_value(user, profile)
+        return user
@@ -0,0 +1,35 @@
+import time
+
+from django.core.cache import cache
+
+# Производные от сдач данные (анализ заданий, перцентили и т.п.) кешируются
+# с токеном версии ДЗ в ключе. Любая запись сдачи меняет токен, и старые
+# записи кеша просто перестают читаться.
+
+
+def _token_key(hw_id):
+    return f"homework_data:{hw_id}"
+
+
+def homework_data_token(hw_id):
+    token = cache.get(_token_key(hw_id))
+    if token is None:
+        token = time.time_ns()
+        if not cache.add(_token_key(hw_id), token, None):
+            token = cache.get(_token_key(hw_id), token)
+    return token
+
+
+def homework_data_tokens(hw_ids):
+    keys = {_token_key(pk): pk for pk in hw_ids}
+    found = cache.get_many(keys)
+    tokens = {keys[key]: token for key, token in found.items()}
+    for pk in hw_ids:
+        if pk not in tokens:
+            tokens[pk] = homework_data_token(pk)
+    return tokens
+
+
+def bump_homework_data(hw_ids):
+    token = time.time_ns()
+    cache.set_many({_token_key(pk): token for pk in set(hw_ids)}, None)
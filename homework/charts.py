@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from matplotlib.figure import Figure
+
+from homework import metrics
+
+# pyplot хранит глобальное состояние и не потокобезопасен, поэтому графики
+# строятся через Figure напрямую и рендерятся в отдельном ограниченном пуле.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.CHART_RENDER_WORKERS,
+    thread_name_prefix="homework-charts",
+)
+
+
+def _timed(chart, *args):
+    with metrics.CHART_LATENCY.time(chart=chart.__name__):
+        return chart(*args)
+
+
+async def render(chart, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _timed, chart, *args)
+
+
+def _to_png(fig):
+    buf = BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def _empty(ax):
+    ax.text(0.5, 0.5, "Нет сданных работ", ha="center", va="center")
+    ax.set_xticks([])
+    ax.set_yticks([])
+
+
+def progress_png(title, labels, scores, max_scores, bands=None):
+    fig = Figure(figsize=(10, 3))
+    ax = fig.subplots()
+
+    if scores:
+        if bands:
+            x = range(len(bands))
+            low, median, high = (
+                [float("nan") if b[i] is None else b[i] for b in bands] for i in range(3)
+            )
+            ax.fill_between(x, low, high, alpha=0.2, color="tab:gray", label="25–75% класса")
+            ax.plot(x, median, linestyle=":", color="tab:gray", label="Медиана класса")
+        ax.plot(range(len(scores)), scores, marker="o", label="Итог")
+        ax.plot(range(len(max_scores)), max_scores, linestyle="--", label="Макс.")
+        ax.set_xticks(range(len(labels)))
+        ax.set_xticklabels(labels, rotation=20, ha="right")
+    else:
+        _empty(ax)
+
+    ax.set_title(title)
+    ax.set_ylabel("Баллы")
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+    return _to_png(fig)
+
+
+def homework_stats_png(hw_title, max_score, mode, scores, names):
+    fig = Figure(figsize=(10, 3.5))
+    ax = fig.subplots()
+
+    if not scores:
+        _empty(ax)
+    else:
+        if mode == "hist":
+            bins = min(10, max(3, max_score or 10))
+            ax.hist(scores, bins=bins)
+            ax.set_title(f"Распределение итоговых баллов: {hw_title}")
+            ax.set_xlabel("Итоговый балл")
+            ax.set_ylabel("Количество работ")
+        else:
+            ax.bar(range(len(scores)), scores)
+            ax.set_title(f"Кто сколько набрал: {hw_title}")
+            ax.set_ylabel("Итоговый балл")
+            ax.set_xticks(range(len(names)))
+            ax.set_xticklabels(names, rotation=25, ha="right")
+
+        ax.grid(True, axis="y", alpha=0.25)
+
+    return _to_png(fig)
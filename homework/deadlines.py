@@ -0,0 +1,91 @@
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from homework import audit, notifications, tenants
+from homework.caching import bump_homework_data
+from homework.models import HomeworkTemplate, Profile, StudentSubmission
+
+# Планировщик может работать на нескольких узлах сразу: каждое ДЗ
+# «захватывается» условным UPDATE ... WHERE closed_at IS NULL (или
+# reminders_sent_at IS NULL), и всё остальное делает только тот, чей
+# UPDATE изменил строку. Захват, нулевые сдачи и очередь уведомлений
+# пишутся в одной транзакции.
+
+
+def _claim(hw, field, now):
+    return HomeworkTemplate.objects.filter(pk=hw.pk, **{f"{field}__isnull": True}).update(
+        **{field: now, "updated_at": now}
+    )
+
+
+def _students_without_submission(hw):
+    return list(
+        Profile.objects
+        .filter(role="student", classroom_id=hw.classroom_id)
+        .exclude(user_id__in=StudentSubmission.objects.filter(homework_template=hw).values("student_id"))
+        .values_list("user_id", flat=True)
+    )
+
+
+def close_due(today=None, limit=None):
+    today = today or timezone.localdate()
+    due = list(
+        HomeworkTemplate.objects
+        .filter(deadline__lt=today, closed_at__isnull=True)
+        .order_by("deadline", "pk")[:limit or settings.DEADLINE_BATCH_SIZE]
+    )
+    closed = []
+    for hw in due:
+        now = timezone.now()
+        with tenants.atomic():
+            if not _claim(hw, "closed_at", now):
+                continue
+            candidates = _students_without_submission(hw)
+            # ignore_conflicts: ученик мог успеть сдать между выборкой и вставкой.
+            StudentSubmission.objects.bulk_create(
+                [
+                    StudentSubmission(
+                        student_id=student_id, homework_template=hw, answers=[], is_missing=True,
+                        layout_version=hw.questions_version,
+                    )
+                    for student_id in candidates
+                ],
+                batch_size=settings.DEADLINE_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            # Журнал и уведомления — только тем, чья нулевая сдача
+            # действительно записана, а не всем кандидатам.
+            missing = list(
+                StudentSubmission.objects
+                .filter(homework_template=hw, student_id__in=candidates, is_missing=True)
+                .values_list("student_id", flat=True)
+            )
+            for student_id in missing:
+                audit.record("deadline", hw, student_id, 0, 0)
+            notifications.enqueue_deadline("missing", hw, missing)
+        closed.append((hw, len(missing)))
+    if closed:
+        bump_homework_data(hw.pk for hw, _ in closed)
+        audit.flush()
+    return closed
+
+
+def send_reminders(today=None, limit=None):
+    today = today or timezone.localdate()
+    horizon = today + datetime.timedelta(days=settings.DEADLINE_REMINDER_DAYS)
+    due = list(
+        HomeworkTemplate.objects
+        .filter(deadline__gte=today, deadline__lte=horizon, reminders_sent_at__isnull=True)
+        .order_by("deadline", "pk")[:limit or settings.DEADLINE_BATCH_SIZE]
+    )
+    sent = []
+    for hw in due:
+        with tenants.atomic():
+            if not _claim(hw, "reminders_sent_at", timezone.now()):
+                continue
+            students = _students_without_submission(hw)
+            notifications.enqueue_deadline("deadline_reminder", hw, students)
+        sent.append((hw, len(students)))
+    return sent
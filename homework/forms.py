@@ -2,9 +2,11 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
 from django.forms import formset_factory
 
 from homework.models import Classroom, HomeworkTemplate
+from homework.search import describe, free_students
 
 
 ANSWER_FORMATS = (
@@ -78,41 +80,61 @@ class SubmissionScoreForm(forms.Form):
     final_score = forms.IntegerField(min_value=0, required=True, label="Итоговые баллы")
 
 
-class StudentMultipleChoiceField(forms.ModelMultipleChoiceField):
-    def label_from_instance(self, obj):
-        p = getattr(obj, "profile", None)
-        last = (getattr(p, "last_name", "") or "").strip()
-        first = (getattr(p, "first_name", "") or "").strip()
-        patro = (getattr(p, "patronymic", "") or "").strip()
-        fio = " ".join(x for x in (last, first, patro) if x)
-        if fio:
-            return f"{fio} (@{obj.username})"
-        return f"@{obj.username}"
-
-
-class AddStudentsToClassForm(forms.Form):
-    students = StudentMultipleChoiceField(
-        queryset=User.objects.none(),
-        required=False,
-        widget=forms.CheckboxSelectMultiple,
-        label="Свободные ученики",
+class BulkReviewRowForm(forms.Form):
+    GRADE_CHOICES = [("", "по шкале")] + [(g, str(g)) for g in (5, 4, 3, 2, 1)]
+
+    student_id = forms.IntegerField(widget=forms.HiddenInput())
+    final_score = forms.IntegerField(min_value=0, label="Итог")
+    grade = forms.TypedChoiceField(
+        choices=GRADE_CHOICES, coerce=int, empty_value=None, required=False, label="Оценка"
     )
+    teacher_comment = forms.CharField(required=False, label="Комментарий")
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, max_score=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields["students"].queryset = User.objects.filter(
-            profile__role="student",
-            profile__classroom__isnull=True,
-        ).order_by("profile__last_name", "profile__first_name")
-
-
-class ClassroomCreateForm(forms.ModelForm):
-    students = StudentMultipleChoiceField(
-        queryset=User.objects.filter(profile__role="student", profile__classroom__isnull=True),
-        required=False,
-        widget=forms.CheckboxSelectMultiple,
-        label="Ученики (свободные)",
-    )
+        if max_score:
+            self.fields["final_score"].max_value = max_score
+            self.fields["final_score"].validators.append(MaxValueValidator(max_score))
+            self.fields["final_score"].widget.attrs["max"] = max_score
+
+
+BulkReviewFormSet = formset_factory(BulkReviewRowForm, extra=0)
+
+
+class StudentPickerField(forms.ModelMultipleChoiceField):
+    # Выбранные в поиске (homework.search) ученики приходят скрытыми полями
+    # с id. Принимаются только ученики этой школы без класса.
+    widget = forms.MultipleHiddenInput
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=User.objects.all(), required=False, **kwargs)
+
+    def clean(self, value):
+        users = super().clean(value)
+        free = set(free_students().filter(user_id__in=[u.pk for u in users]).values_list("user_id", flat=True))
+        taken = [u.username for u in users if u.pk not in free]
+        if taken:
+            raise ValidationError(f"Эти ученики уже в классе или не найдены: {', '.join(taken)}")
+        return users
+
+
+class StudentPickerMixin:
+    def selected_students(self):
+        if not self.is_bound:
+            return []
+        try:
+            ids = [int(pk) for pk in self.data.getlist(self.add_prefix("students"))]
+        except ValueError:
+            return []
+        return describe(ids)
+
+
+class AddStudentsToClassForm(StudentPickerMixin, forms.Form):
+    students = StudentPickerField(label="Ученики")
+
+
+class ClassroomCreateForm(StudentPickerMixin, forms.ModelForm):
+    students = StudentPickerField(label="Ученики")
 
     class Meta:
         model = Classroom
@@ -135,3 +157,23 @@ class HomeworkTemplateCreateForm(forms.ModelForm):
             "deadline": forms.DateInput(attrs={"type": "date"}),
             "description": forms.Textarea(attrs={"rows": 3}),
         }
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single(d, initial) for d in data]
+        return [single(data, initial)]
+
+
+class ScanUploadForm(forms.Form):
+    scans = MultipleFileField(label="Сканы бланков (изображения, многостраничный TIFF или ZIP)")
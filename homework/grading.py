@@ -0,0 +1,82 @@
+import time
+from itertools import zip_longest
+
+import numpy as np
+
+from homework import metrics
+from homework.models import pack_answers
+
+GRADE_STEPS = (2, 3, 4, 5)
+
+
+def get_correct(hw, num):
+    correct_map = hw.correct_answers or {}
+    if isinstance(correct_map, dict):
+        return correct_map.get(str(num)) or correct_map.get(num) or ""
+    return ""
+
+
+def is_correct(fmt, stud, corr):
+    if fmt == "text":
+        return stud.casefold() == corr.casefold()
+    if fmt == "int":
+        try:
+            return int(stud) == int(corr)
+        except (TypeError, ValueError):
+            return False
+    if fmt == "float":
+        try:
+            s = float(stud.replace(",", "."))
+            c = float(corr.replace(",", "."))
+            return abs(s - c) < 1e-6
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def answer_key(hw):
+    return [
+        (q.get("answer_format", "text"), (get_correct(hw, q["number"]) or "").strip())
+        for q in (hw.questions or [])
+    ]
+
+
+def calc_auto_score(hw, answers):
+    started = time.perf_counter()
+    questions = hw.questions or []
+    if isinstance(answers, dict):
+        answers = pack_answers(questions, answers)
+
+    auto_score = 0
+    for (fmt, corr), stud in zip_longest(answer_key(hw), answers[:len(questions)], fillvalue=""):
+        if is_correct(fmt, (stud or "").strip(), corr):
+            auto_score += 1
+
+    elapsed = time.perf_counter() - started
+    metrics.GRADED.inc()
+    metrics.GRADING_LATENCY.observe(elapsed)
+    if questions:
+        metrics.GRADING_QUESTION_LATENCY.observe(elapsed / len(questions))
+    return auto_score
+
+
+def grades_for(percent, thresholds):
+    # Общая для одной работы и для столбцов pandas/numpy: percent и пороги
+    # {оценка: порог} — числа или массивы одной длины.
+    grade = 1
+    for g in GRADE_STEPS:
+        grade = np.where(percent >= thresholds[g], g, grade)
+    return grade
+
+
+def grade_for(scale, percent):
+    return int(grades_for(percent, {g: getattr(scale, f"threshold_{g}") for g in GRADE_STEPS}))
+
+
+def max_points(hw):
+    return hw.max_score or len(hw.questions or [])
+
+
+def grade_for_score(hw, score):
+    points = max_points(hw)
+    return grade_for(hw.grade_scale, score * 100 / points if points else 0)
@@ -0,0 +1,228 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router
+from django.utils import timezone
+
+from homework import audit, metrics, replicas, tenants
+from homework.caching import bump_homework_data
+from homework.models import HomeworkTemplate, StudentSubmission
+
+logger = logging.getLogger(__name__)
+
+UPSERT_FIELDS = [
+    "answers", "answers_schema", "layout_version", "auto_score", "final_score", "graded", "is_missing",
+    "answered_at", "updated_at",
+]
+
+
+def upsert(submissions, batch_size=None, keep_graded=False):
+    # INSERT ... ON CONFLICT DO UPDATE с условием: существующая строка
+    # заменяется, только если её ответы получены раньше и после их
+    # получения работу не проверял учитель. Так пачка, пролежавшая в памяти
+    # другого процесса, не затрёт ни более новую сдачу, ни проверку.
+    # С keep_graded проверенная учителем работа не заменяется вовсе.
+    # Возвращает число вставленных или обновлённых строк.
+    if not submissions:
+        return 0
+    batch_size = batch_size or settings.SUBMISSION_BATCH_SIZE
+    connection = connections[router.db_for_write(StudentSubmission)]
+    qn = connection.ops.quote_name
+    opts = StudentSubmission._meta
+    fields = [f for f in opts.concrete_fields if not f.primary_key]
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, submissions))
+    table = qn(opts.db_table)
+    column = {f.name: qn(f.column) for f in fields}
+    answered, graded, updated = column["answered_at"], column["graded"], column["updated_at"]
+    sql_head = f"INSERT INTO {table} ({', '.join(column[f.name] for f in fields)}) VALUES "
+    sql_tail = (
+        f" ON CONFLICT ({column['student']}, {column['homework_template']}) DO UPDATE SET "
+        + ", ".join(f"{column[name]} = excluded.{column[name]}" for name in UPSERT_FIELDS)
+        + f" WHERE ({table}.{answered} IS NULL OR {table}.{answered} < excluded.{answered})"
+        + (
+            f" AND NOT {table}.{graded}" if keep_graded
+            else f" AND (NOT {table}.{graded} OR {table}.{updated} < excluded.{answered})"
+        )
+    )
+    row_sql = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+    now = timezone.now()
+    written = 0
+    with tenants.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(submissions), batch_size):
+            chunk = submissions[start:start + batch_size]
+            params = []
+            for submission in chunk:
+                submission.submitted_at = submission.updated_at = now
+                if submission.answered_at is None:
+                    submission.answered_at = now
+                params.extend(f.get_db_prep_save(getattr(submission, f.attname), connection) for f in fields)
+            cursor.execute(sql_head + ", ".join([row_sql] * len(chunk)) + sql_tail, params)
+            written += max(cursor.rowcount, 0)
+    return written
+
+
+def _realign(submissions):
+    # Пока ответы лежали в буфере, вопросы ДЗ могли измениться: ответы
+    # перекладываются под текущую раскладку под блокировкой строк ДЗ, чтобы
+    # HomeworkTemplate.save() не вклинился до записи. Сдачи удалённых ДЗ
+    # отбрасываются.
+    homeworks = (
+        HomeworkTemplate.objects.select_for_update()
+        .only("id", "questions", "questions_version", "answer_key_version")
+        .in_bulk({s.homework_template_id for s in submissions})
+    )
+    current = []
+    for submission in submissions:
+        hw = homeworks.get(submission.homework_template_id)
+        if hw is None:
+            continue
+        if submission.layout_version != hw.questions_version:
+            submission.realign(submission.homework_template.questions, hw)
+        submission.homework_template = hw
+        current.append(submission)
+    return current
+
+
+def _scores(submissions):
+    # {(ученик, ДЗ): (final_score, answered_at)} для строк этих сдач в базе.
+    rows = StudentSubmission.objects.filter(
+        student_id__in={s.student_id for s in submissions},
+        homework_template_id__in={s.homework_template_id for s in submissions},
+    ).values_list("student_id", "homework_template_id", "final_score", "answered_at")
+    return {(student_id, hw_id): (score, answered) for student_id, hw_id, score, answered in rows}
+
+
+def _write(submissions, batch_size):
+    # upsert и журнал проверки в одной транзакции. Записанной считается
+    # строка, у которой после upsert стоит answered_at этой сдачи: строку,
+    # отброшенную условием upsert (устаревшая сдача, проверенная работа),
+    # журнал не видит.
+    submissions = _realign(submissions)
+    before = _scores(submissions)
+    upsert(submissions, batch_size)
+    after = _scores(submissions)
+    for submission in submissions:
+        key = (submission.student_id, submission.homework_template_id)
+        if key in after and after[key][1] == submission.answered_at:
+            old = before.get(key)
+            audit.record(
+                "auto", submission.homework_template, submission.student_id,
+                submission.final_score, submission.auto_score, old_score=old[0] if old else None,
+            )
+    return submissions
+
+
+class SubmissionBuffer:
+    # Ответы копятся в памяти по ключу (ученик, ДЗ): повторная отправка
+    # до сброса просто заменяет предыдущую, поэтому в базу всегда попадает
+    # последняя версия. Сброс идёт одним upsert'ом раз в interval секунд
+    # или как только набралось max_rows строк. Между процессами порядок
+    # держит условие в upsert(), а не сам буфер.
+
+    def __init__(self, max_rows, interval):
+        self.max_rows = max_rows
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def put(self, submission):
+        key = (tenants.current(), submission.student_id, submission.homework_template_id)
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = submission
+            size = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="submission-ingest", daemon=True)
+                self._thread.start()
+        if size >= self.max_rows:
+            self._wakeup.set()
+
+    def get(self, student_id, hw_id):
+        with self._lock:
+            return self._pending.get((tenants.current(), student_id, hw_id))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Не удалось записать пачку ответов, повтор при следующем сбросе")
+                time.sleep(self.interval)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            by_tenant = {}
+            for (tenant, _, _), submission in batch.items():
+                by_tenant.setdefault(tenant, []).append(submission)
+            written = set()
+            try:
+                for tenant, submissions in by_tenant.items():
+                    with tenants.use_tenant(tenant):
+                        with tenants.atomic():
+                            submissions = _write(submissions, self.max_rows)
+                        bump_homework_data(s.homework_template_id for s in submissions)
+                    written.add(tenant)
+            except Exception:
+                with self._lock:
+                    for key, submission in batch.items():
+                        if key[0] not in written:
+                            self._pending.setdefault(key, submission)
+                raise
+            audit.flush_if_due()
+            return len(batch)
+
+
+_buffer = SubmissionBuffer(
+    max_rows=settings.SUBMISSION_BATCH_SIZE,
+    interval=settings.SUBMISSION_FLUSH_INTERVAL_MS / 1000,
+)
+atexit.register(_buffer.flush)
+
+
+def enqueue(student, hw, answers, auto_score):
+    submission = StudentSubmission(
+        student=student,
+        homework_template=hw,
+        auto_score=auto_score,
+        final_score=auto_score,
+        graded=False,
+    )
+    submission.set_answers(hw, answers)
+    _buffer.put(submission)
+    # Запись в базу будет позже, но читать ученику уже надо с основной.
+    replicas.mark_written()
+
+
+def pending(student_id, hw_id):
+    return _buffer.get(student_id, hw_id)
+
+
+def flush():
+    return _buffer.flush()
+
+
+def queue_depth():
+    return len(_buffer)
+
+
+@metrics.collector
+def _report_queue_depth():
+    metrics.INGEST_QUEUE.set(queue_depth())
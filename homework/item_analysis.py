@@ -0,0 +1,109 @@
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from homework import metrics, replicas
+from homework.caching import homework_data_token
+from homework.grading import answer_key, is_correct
+from homework.models import StudentSubmission, pack_answers
+
+DISTRACTORS_PER_QUESTION = 5
+
+
+def answer_matrix(hw, rows):
+    # Строки приводятся к одной длине, чтобы numpy собрал матрицу
+    # ученики × вопросы фиксированной ширины, а не массив объектов.
+    questions = hw.questions or []
+    width = len(questions)
+    matrix = []
+    for answers in rows:
+        if isinstance(answers, dict):
+            answers = pack_answers(questions, answers)
+        answers = list(answers[:width])
+        matrix.append(answers + [""] * (width - len(answers)))
+    return np.strings.strip(np.array(matrix, dtype=str).reshape(len(matrix), width))
+
+
+def _point_biserial(correct):
+    # Корреляция ответа на вопрос с суммой по остальным вопросам
+    # (без самого вопроса, иначе дискриминация завышается).
+    x = correct.astype(float)
+    rest = x.sum(axis=1, keepdims=True) - x
+    xc = x - x.mean(axis=0)
+    rc = rest - rest.mean(axis=0)
+    num = (xc * rc).sum(axis=0)
+    den = np.sqrt((xc ** 2).sum(axis=0) * (rc ** 2).sum(axis=0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def answer_columns(hw, answers):
+    # Для каждого вопроса: различные (нормализованные) ответы, индекс ответа
+    # каждого ученика в этом списке, частоты и правильность каждого варианта.
+    # Проверка идёт по уникальным ответам, а не по каждой ячейке: в классе
+    # обычно лишь несколько вариантов на вопрос.
+    for j, (fmt, corr) in enumerate(answer_key(hw)):
+        column = answers[:, j]
+        if fmt == "text":
+            column = np.strings.lower(column)
+        values, inverse, counts = np.unique(column, return_inverse=True, return_counts=True)
+        ok = np.fromiter((is_correct(fmt, str(v), corr) for v in values), dtype=bool, count=len(values))
+        yield values, inverse.reshape(-1), counts, ok
+
+
+def analyze(hw, rows):
+    key = answer_key(hw)
+    answers = answer_matrix(hw, rows)
+    n_students, n_questions = answers.shape
+
+    correct = np.zeros((n_students, n_questions), dtype=bool)
+    blanks = np.zeros(n_questions, dtype=int)
+    distractors = []
+
+    for j, (values, inverse, counts, ok) in enumerate(answer_columns(hw, answers)):
+        correct[:, j] = ok[inverse]
+
+        empty = values == ""
+        blanks[j] = counts[empty].sum()
+        wrong = ~ok & ~empty
+        order = np.argsort(-counts[wrong], kind="stable")[:DISTRACTORS_PER_QUESTION]
+        distractors.append([
+            {"answer": str(v), "count": int(c), "percent": round(c * 100 / n_students)}
+            for v, c in zip(values[wrong][order], counts[wrong][order])
+        ])
+
+    if n_students:
+        difficulty = correct.mean(axis=0)
+        discrimination = _point_biserial(correct)
+    else:
+        difficulty = np.full(n_questions, np.nan)
+        discrimination = np.full(n_questions, np.nan)
+
+    items = []
+    for j, q in enumerate(hw.questions or []):
+        p = difficulty[j]
+        r = discrimination[j]
+        items.append({
+            "number": q["number"],
+            "answer_format": key[j][0],
+            "correct_answer": key[j][1],
+            "difficulty": None if np.isnan(p) else round(float(p) * 100, 1),
+            "discrimination": None if np.isnan(r) else round(float(r), 2),
+            "blanks": int(blanks[j]),
+            "distractors": distractors[j],
+        })
+
+    return {"students": n_students, "items": items}
+
+
+def item_analysis(hw):
+    key = f"item_analysis:{hw.pk}:{hw.questions_version}:{homework_data_token(hw.pk)}"
+    report = cache.get(key)
+    metrics.cache_lookup("item_analysis", report is not None)
+    if report is None:
+        rows = StudentSubmission.objects.filter(
+            homework_template=hw, is_missing=False, layout_version=hw.questions_version,
+        ).values_list("answers", flat=True)
+        report = analyze(hw, rows.iterator(chunk_size=2000))
+        cache.set(key, report, replicas.cache_timeout(settings.ITEM_ANALYSIS_CACHE_TIMEOUT))
+    return report
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from homework import archive
+from homework.analytics import school_year, school_year_bounds
+from homework.models import Classroom
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает ДЗ и сдачи закончившегося учебного года в архив (по файлу на класс) "
+        "и удаляет их из базы небольшими транзакциями. Файлы заданий в media не трогаются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("year", type=int, help="Год начала учебного года, например 2024 для 2024/25")
+        parser.add_argument("--classroom", type=int, action="append", help="Только указанные классы (id)")
+        parser.add_argument("--chunk-size", type=int, help="Строк в одной транзакции удаления")
+        parser.add_argument("--pause", type=float, help="Пауза между транзакциями, сек")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        year = options["year"]
+        if year >= school_year(timezone.localdate()):
+            raise CommandError(f"Учебный год {year}/{year + 1} ещё не закончился")
+        start, end = school_year_bounds(year)
+
+        classrooms = Classroom.objects.filter(homeworks__deadline__gte=start, homeworks__deadline__lt=end)
+        if options["classroom"]:
+            classrooms = classrooms.filter(pk__in=options["classroom"])
+        classrooms = classrooms.annotate(homework_count=Count("homeworks")).order_by("pk")
+
+        for classroom in classrooms:
+            name = f"{classroom} (id {classroom.pk})"
+            if options["dry_run"]:
+                self.stdout.write(f"{name}: ДЗ {classroom.homework_count}")
+                continue
+            result = archive.archive_classroom(classroom, start, end, options["chunk_size"], options["pause"])
+            self.stdout.write(
+                f"{name}: ДЗ {result['homeworks']}, сдач {result['submissions']}, "
+                f"событий {result['events']} -> {result['path']}"
+                + (" (класс удалён)" if result["classroom_deleted"] else "")
+            )
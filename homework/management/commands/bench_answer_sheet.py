@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+
+from homework import answer_sheet
+from homework.forms import AnswerFormSet
+from homework.models import HomeworkTemplate
+
+FORMATS = ("int", "float", "text")
+
+
+class Command(BaseCommand):
+    help = "Сравнивает разбор листа ответов через formset и быстрым парсером при разном числе вопросов."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--counts", type=int, nargs="+", default=[20, 100, 200, 500])
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        for count in options["counts"]:
+            hw = HomeworkTemplate(
+                questions=[{"number": i, "answer_format": FORMATS[i % 3]} for i in range(1, count + 1)],
+            )
+            data = QueryDict(mutable=True)
+            data["a-TOTAL_FORMS"] = str(count)
+            data["a-INITIAL_FORMS"] = str(count)
+            for i, q in enumerate(hw.questions):
+                data[f"a-{i}-number"] = str(q["number"])
+                data[f"a-{i}-answer"] = str(i)
+
+            slow = self._time(options["repeat"], lambda: answer_sheet.clean_formset(hw, AnswerFormSet(data, prefix="a")))
+            fast = self._time(options["repeat"], lambda: answer_sheet.parse(hw, data, "a"))
+            assert answer_sheet.clean_formset(hw, AnswerFormSet(data, prefix="a")) == answer_sheet.parse(hw, data, "a")
+
+            self.stdout.write(
+                f"{count:>5} вопросов: formset {slow * 1000:8.2f} мс, "
+                f"быстрый парсер {fast * 1000:7.2f} мс, ускорение x{slow / fast:.0f}"
+            )
+
+    def _time(self, repeat, func):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat
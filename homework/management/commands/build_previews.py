@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from homework.models import HomeworkTemplate
+from homework.previews import build_previews
+
+
+class Command(BaseCommand):
+    help = "Строит превью (WebP/JPEG) для файлов домашних заданий."
+
+    def add_arguments(self, parser):
+        parser.add_argument("hw_ids", nargs="*", type=int, help="ID домашних заданий (по умолчанию все без превью)")
+        parser.add_argument("--force", action="store_true", help="Перестроить уже существующие превью")
+
+    def handle(self, *args, **options):
+        qs = HomeworkTemplate.objects.exclude(homework_file="").exclude(homework_file__isnull=True)
+        if options["hw_ids"]:
+            qs = qs.filter(pk__in=options["hw_ids"])
+        elif not options["force"]:
+            qs = qs.filter(file_previews={})
+
+        built = 0
+        for hw_id in qs.values_list("pk", flat=True).iterator():
+            if build_previews(hw_id):
+                built += 1
+        self.stdout.write(self.style.SUCCESS(f"Построено превью: {built}"))
@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from homework import scans
+from homework.models import HomeworkTemplate
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет отсканированные бланки ДЗ (изображения, многостраничные TIFF, ZIP или каталоги) "
+        "и сохраняет сдачи учеников. Страницы читаются параллельно на всех ядрах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("hw_id", type=int)
+        parser.add_argument("paths", nargs="+")
+
+    def handle(self, *args, **options):
+        hw = HomeworkTemplate.objects.select_related("classroom").filter(pk=options["hw_id"]).first()
+        if hw is None:
+            raise CommandError(f"Нет ДЗ с id {options['hw_id']}")
+
+        files = []
+        for path in options["paths"]:
+            if os.path.isdir(path):
+                files += sorted(os.path.join(path, name) for name in os.listdir(path))
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                raise CommandError(f"Нет такого файла: {path}")
+
+        pages, budget = [], {"pages": 0, "bytes": 0}
+        for path in files:
+            with open(path, "rb") as f:
+                try:
+                    pages.extend(scans.iter_pages(path, f.read(), budget))
+                except scans.ScanError as exc:
+                    raise CommandError(str(exc))
+
+        started = time.monotonic()
+        report = scans.grade(hw, pages)
+        elapsed = time.monotonic() - started
+
+        for profile, score in report["saved"]:
+            self.stdout.write(f"{profile.last_name} {profile.first_name}: {score}")
+        for profile in report["skipped"]:
+            self.stdout.write(f"{profile.last_name} {profile.first_name}: уже проверено учителем, пропущено")
+        for name, message in report["errors"] + report["issues"]:
+            self.stderr.write(f"{name}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Страниц: {report['pages']} за {elapsed:.1f} с, сохранено работ: {len(report['saved'])}, "
+            f"не прочитано страниц: {len(report['errors'])}"
+        ))
@@ -0,0 +1,76 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест запущенного сервера: N параллельных клиентов запрашивают страницы. "
+        "Позволяет сравнить WSGI (runserver/gunicorn) и ASGI (uvicorn) на одних и тех же URL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Пути, например /homework_list/ /homeworks/1/stats.png")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=200, help="Всего запросов на каждый путь")
+        parser.add_argument("--as-user", help="Выполнять запросы от имени пользователя (создаётся сессия)")
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options["as_user"]:
+            headers["Cookie"] = f"{settings.SESSION_COOKIE_NAME}={self._session_for(options['as_user'])}"
+
+        for path in options["paths"]:
+            url = options["base_url"].rstrip("/") + path
+            self._run(url, headers, options["concurrency"], options["requests"])
+
+    def _session_for(self, username):
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f"Пользователь {username} не найден")
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def _run(self, url, headers, concurrency, total):
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers), timeout=60) as resp:
+                    resp.read()
+                    status = resp.status
+            except HTTPError as exc:
+                status = exc.code
+            except OSError:
+                # Отказ соединения, сброс, таймаут: считается ошибкой,
+                # а не роняет весь прогон.
+                status = None
+            return status, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(r[1] for r in results)
+        errors = sum(1 for status, _ in results if status is None or status >= 400)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+        self.stdout.write(
+            f"{url}: {total / elapsed:.1f} req/s, "
+            f"p50 {statistics.median(latencies) * 1000:.0f} ms, "
+            f"p95 {p95 * 1000:.0f} ms, ошибок {errors}/{total}"
+        )
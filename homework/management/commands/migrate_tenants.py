@@ -0,0 +1,30 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Применяет миграции к общей базе и к базе каждой школы из TENANTS. "
+        "Какие таблицы где создаются, решает homework.tenants.TenantRouter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenant", action="append", help="Только указанные школы")
+        parser.add_argument("--skip-default", action="store_true", help="Не трогать общую базу")
+
+    def handle(self, *args, **options):
+        names = options["tenant"] or list(settings.TENANTS)
+        unknown = [name for name in names if name not in settings.TENANTS]
+        if unknown:
+            raise CommandError(f"Неизвестные школы: {', '.join(unknown)}")
+
+        aliases = names if options["skip_default"] else ["default", *names]
+        for alias in aliases:
+            if connections[alias].vendor == "sqlite":
+                os.makedirs(os.path.dirname(os.path.abspath(connections[alias].settings_dict["NAME"])), exist_ok=True)
+            self.stdout.write(f"База {alias}")
+            call_command("migrate", database=alias, interactive=False, verbosity=options["verbosity"], stdout=self.stdout)
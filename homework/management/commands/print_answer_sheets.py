@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from homework import scans
+from homework.models import HomeworkTemplate
+
+
+class Command(BaseCommand):
+    help = "Сохраняет PDF с бумажными бланками ответов на весь класс для проверки сканов (grade_scans)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("hw_id", type=int)
+        parser.add_argument("-o", "--output", help="Файл PDF (по умолчанию sheets-<id ДЗ>.pdf)")
+
+    def handle(self, *args, **options):
+        hw = HomeworkTemplate.objects.select_related("classroom").filter(pk=options["hw_id"]).first()
+        if hw is None:
+            raise CommandError(f"Нет ДЗ с id {options['hw_id']}")
+        pdf = scans.sheets_pdf(hw)
+        if pdf is None:
+            raise CommandError("В классе нет учеников")
+        output = options["output"] or f"sheets-{hw.pk}.pdf"
+        with open(output, "wb") as f:
+            f.write(pdf)
+        self.stdout.write(self.style.SUCCESS(f"Бланки сохранены в {output}"))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from homework import deadlines
+
+
+class Command(BaseCommand):
+    help = (
+        "Закрывает приём ответов по ДЗ с прошедшим дедлайном, ставит 0 баллов не сдавшим "
+        "и ставит в очередь напоминания о скором сроке. Можно запускать на нескольких узлах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно")
+        parser.add_argument("--interval", type=float, default=60.0, help="Пауза между проходами, сек")
+
+    def handle(self, *args, **options):
+        while True:
+            while reminded := deadlines.send_reminders():
+                for hw, count in reminded:
+                    self.stdout.write(f"«{hw}»: напоминаний {count}")
+            while closed := deadlines.close_due():
+                for hw, count in closed:
+                    self.stdout.write(f"«{hw}» закрыто, не сдали: {count}")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
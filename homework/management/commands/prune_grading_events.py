@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from homework.models import GradingEvent
+
+
+class Command(BaseCommand):
+    help = "Удаляет месячные разделы журнала проверки старше срока хранения."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=settings.GRADING_EVENT_RETENTION_MONTHS,
+            help="Сколько последних месяцев хранить",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        months = today.year * 12 + today.month - 1 - options["months"]
+        cutoff = (months // 12) * 100 + months % 12 + 1
+
+        partitions = list(
+            GradingEvent.objects
+            .filter(partition__lt=cutoff)
+            .values_list("partition", flat=True)
+            .distinct()
+            .order_by("partition")
+        )
+        total = 0
+        for partition in partitions:
+            events = GradingEvent.objects.filter(partition=partition)
+            if options["dry_run"]:
+                deleted = events.count()
+            else:
+                deleted, _ = events.delete()
+            total += deleted
+            self.stdout.write(f"Раздел {partition}: {deleted}")
+        verb = "Будет удалено" if options["dry_run"] else "Всего удалено"
+        self.stdout.write(f"{verb} событий: {total}")
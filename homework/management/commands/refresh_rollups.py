@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from homework import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет сводки успеваемости по неделям и четвертям. "
+        "По умолчанию пересчитывает только периоды, в которых появились новые или изменённые сдачи."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Пересчитать все сводки заново")
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно")
+        parser.add_argument("--interval", type=float, default=60.0, help="Пауза между проходами, сек")
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            started = time.perf_counter()
+            rows = analytics.refresh(full=full)
+            if rows or full:
+                self.stdout.write(f"Обновлено строк сводки: {rows} за {time.perf_counter() - started:.2f} с")
+            if not options["loop"]:
+                break
+            full = False
+            time.sleep(options["interval"])
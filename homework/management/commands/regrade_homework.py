@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from homework import audit, tenants
+from homework.caching import bump_homework_data
+from homework.grading import calc_auto_score
+from homework.models import HomeworkTemplate, StudentSubmission
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Перепроверяет все работы по ДЗ текущим ключом ответов. У непроверенных учителем работ "
+        "итоговый балл меняется вместе с автоматическим; каждое изменение пишется в журнал проверки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("hw_id", type=int)
+
+    def handle(self, *args, **options):
+        hw = HomeworkTemplate.objects.filter(pk=options["hw_id"]).first()
+        if hw is None:
+            raise CommandError(f"ДЗ {options['hw_id']} не найдено")
+
+        changed = 0
+        batch = []
+        qs = StudentSubmission.objects.filter(homework_template=hw, layout_version=hw.questions_version).order_by("pk")
+        for submission in qs.iterator(chunk_size=BATCH_SIZE):
+            auto_score = calc_auto_score(hw, submission.answer_values(hw))
+            if auto_score == submission.auto_score:
+                continue
+            old_score = submission.final_score
+            submission.auto_score = auto_score
+            if not submission.graded:
+                submission.final_score = auto_score
+            submission.updated_at = timezone.now()
+            audit.record("regrade", hw, submission.student_id, submission.final_score, auto_score, old_score=old_score)
+            batch.append(submission)
+            if len(batch) >= BATCH_SIZE:
+                changed += self._save(batch)
+                batch = []
+        if batch:
+            changed += self._save(batch)
+
+        if changed:
+            bump_homework_data([hw.pk])
+        audit.flush()
+        self.stdout.write(f"Перепроверено работ с изменённым баллом: {changed}")
+
+    def _save(self, batch):
+        with tenants.atomic():
+            StudentSubmission.objects.bulk_update(batch, ["auto_score", "final_score", "updated_at"])
+        return len(batch)
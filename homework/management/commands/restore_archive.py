@@ -0,0 +1,34 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from homework import archive
+
+
+class Command(BaseCommand):
+    help = "Восстанавливает классы, ДЗ и сдачи из архивов archive_year (файлы или каталоги)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+")
+
+    def handle(self, *args, **options):
+        files = []
+        for path in options["paths"]:
+            if os.path.isdir(path):
+                files += sorted(
+                    os.path.join(path, name) for name in os.listdir(path) if name.endswith(".jsonl.gz")
+                )
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                raise CommandError(f"Нет такого файла: {path}")
+
+        for path in files:
+            try:
+                counts, skipped = archive.restore(path)
+            except ValueError as exc:
+                raise CommandError(f"{path}: {exc}")
+            summary = ", ".join(f"{name}: {count}" for name, count in counts.items())
+            self.stdout.write(f"{path}: прочитано {summary}")
+            if skipped:
+                self.stdout.write(f"  пропущено сдач удалённых учеников: {skipped}")
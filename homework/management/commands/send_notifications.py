@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from homework import notifications
+
+
+class Command(BaseCommand):
+    help = "Разбирает очередь уведомлений пачками и рассылает дайджесты по каналам."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно")
+        parser.add_argument("--interval", type=float, default=5.0, help="Пауза между проходами, сек")
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = 0
+            while processed := notifications.drain(options["batch_size"]):
+                sent += processed
+            if sent:
+                self.stdout.write(f"Отправлено уведомлений: {sent}")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
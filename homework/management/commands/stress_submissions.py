@@ -0,0 +1,110 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import Client, override_settings
+
+from homework import ingest
+from homework.models import Classroom, GradeScale, HomeworkTemplate, Profile, StudentSubmission
+
+PREFIX = "stress_"
+
+
+class Command(BaseCommand):
+    help = (
+        "Стресс-тест сдачи ДЗ перед дедлайном: весь класс одновременно отправляет ответы. "
+        "Сравнивает пропускную способность режимов sync и batched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=200)
+        parser.add_argument("--questions", type=int, default=20)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--rounds", type=int, default=3, help="Сколько раз каждый ученик пересдаёт работу")
+
+    def handle(self, *args, **options):
+        hw, clients = self._setup(options["students"], options["questions"])
+        try:
+            for mode in ("sync", "batched"):
+                StudentSubmission.objects.filter(homework_template=hw).delete()
+                self._run(mode, hw, clients, options["concurrency"], options["rounds"])
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+            GradeScale.objects.filter(pk=hw.grade_scale_id).delete()
+
+    def _setup(self, n_students, n_questions):
+        User.objects.filter(username__startswith=PREFIX).delete()
+
+        teacher = User.objects.create_user(f"{PREFIX}teacher")
+        Profile.objects.create(user=teacher, role="teacher")
+        classroom = Classroom.objects.create(name=f"{PREFIX}class", teacher=teacher)
+
+        today = datetime.date.today()
+        hw = HomeworkTemplate.objects.create(
+            title=f"{PREFIX}hw",
+            description="",
+            classroom=classroom,
+            questions=[{"number": i, "answer_format": "int"} for i in range(1, n_questions + 1)],
+            correct_answers={str(i): str(i) for i in range(1, n_questions + 1)},
+            assigned_date=today,
+            deadline=today,
+            max_score=n_questions,
+            grade_scale=GradeScale.objects.create(),
+        )
+
+        clients = []
+        for i in range(n_students):
+            user = User.objects.create_user(f"{PREFIX}{i}")
+            Profile.objects.create(user=user, role="student", classroom=classroom)
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        return hw, clients
+
+    def _payload(self, hw, round_no):
+        data = {
+            "a-TOTAL_FORMS": len(hw.questions),
+            "a-INITIAL_FORMS": len(hw.questions),
+        }
+        for i, q in enumerate(hw.questions):
+            data[f"a-{i}-number"] = q["number"]
+            data[f"a-{i}-answer"] = str(q["number"] + round_no)
+        return data
+
+    def _run(self, mode, hw, clients, concurrency, rounds):
+        url = f"/homework/{hw.id}/submit/"
+
+        def post(args):
+            client, round_no = args
+            try:
+                return client.post(url, self._payload(hw, round_no)).status_code
+            finally:
+                close_old_connections()
+
+        with override_settings(SUBMISSION_INGEST_MODE=mode, ALLOWED_HOSTS=["testserver"]):
+            statuses = []
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for round_no in range(rounds):
+                    statuses += pool.map(post, [(c, round_no) for c in clients])
+            acked = time.perf_counter() - started
+            ingest.flush()
+            stored = time.perf_counter() - started
+
+        total = len(statuses)
+        errors = sum(1 for s in statuses if s != 302)
+        expected = str(rounds)
+        last_round_ok = sum(
+            1 for answers in
+            StudentSubmission.objects.filter(homework_template=hw).values_list("answers", flat=True)
+            if answers and answers[0] == expected
+        )
+
+        self.stdout.write(
+            f"{mode:>8}: {total} отправок, ответ за {acked:.2f} с ({total / acked:.0f}/с), "
+            f"в базе за {stored:.2f} с ({total / stored:.0f}/с), ошибок {errors}, "
+            f"последняя версия сохранена у {last_round_ok}/{len(clients)}"
+        )
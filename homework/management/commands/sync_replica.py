@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет копии баз SQLite для чтения из READ_REPLICAS. Копия собирается "
+        "во временном файле и подменяет старую целиком. Для PostgreSQL/MySQL "
+        "используйте репликацию самой СУБД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно")
+        parser.add_argument("--interval", type=float, default=5.0, help="Пауза между копиями, сек")
+
+    def handle(self, *args, **options):
+        if not settings.READ_REPLICAS:
+            raise CommandError("READ_REPLICAS не заданы")
+        for primary, replica in settings.READ_REPLICAS.items():
+            if connections[primary].vendor != "sqlite" or connections[replica].vendor != "sqlite":
+                raise CommandError(f"{primary} -> {replica}: копирование поддерживается только для SQLite")
+
+        while True:
+            for primary, replica in settings.READ_REPLICAS.items():
+                started = time.monotonic()
+                self.copy(primary, replica)
+                self.stdout.write(f"{primary} -> {replica}: {time.monotonic() - started:.2f} с")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def copy(self, primary, replica):
+        source = connections[primary]
+        source.ensure_connection()
+        path = os.path.abspath(connections[replica].settings_dict["NAME"])
+        tmp = f"{path}.part"
+        target = sqlite3.connect(tmp)
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
+        # Открытые соединения дочитывают старый файл, новые видят новый.
+        os.replace(tmp, path)
+        connections[replica].close()
@@ -0,0 +1,32 @@
+import argparse
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from homework import tenants
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет команду в базе каждой школы по очереди (или только указанных), например: "
+        "tenant_command process_deadlines, tenant_command --tenant school1 refresh_rollups --full. "
+        "Команды с --loop стоит запускать отдельно для каждой школы."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenant", action="append", help="Только указанные школы")
+        parser.add_argument("command_name")
+        parser.add_argument("command_args", nargs=argparse.REMAINDER)
+
+    def handle(self, *args, **options):
+        names = options["tenant"] or list(settings.TENANTS)
+        if not names:
+            raise CommandError("TENANTS пуст: команду можно запускать напрямую")
+        unknown = [name for name in names if name not in settings.TENANTS]
+        if unknown:
+            raise CommandError(f"Неизвестные школы: {', '.join(unknown)}")
+        for name in names:
+            self.stdout.write(f"Школа {name}")
+            with tenants.use_tenant(name):
+                call_command(options["command_name"], *options["command_args"], stdout=self.stdout)
@@ -0,0 +1,245 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Простой реестр метрик в формате Prometheus без внешних зависимостей.
+# Каждый процесс копит значения у себя в памяти и периодически сбрасывает
+# их в файл METRICS_DIR/<pid>.json; /metrics складывает файлы всех
+# процессов, так что при нескольких воркерах счётчики не теряются.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_registry = {}
+_collectors = []
+_last_flush = 0.0
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        with _lock:
+            _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    # Значение процесса; при сборке суммируется по живым процессам.
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with _lock:
+            # счётчики по корзинам (последняя — +Inf), сумма, количество
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def collector(func):
+    # Функция, обновляющая gauge-метрики перед сбросом/сборкой.
+    _collectors.append(func)
+    return func
+
+
+def _snapshot():
+    for func in _collectors:
+        func()
+    with _lock:
+        return {
+            name: {
+                "kind": metric.kind,
+                "values": [[list(key), value] for key, value in metric.values.items()],
+            }
+            for name, metric in _registry.items()
+        }
+
+
+def flush(force=False):
+    global _last_flush
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"pid": os.getpid(), "metrics": _snapshot()}, f)
+    os.replace(tmp, path)
+
+
+atexit.register(flush, force=True)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load_all():
+    if not settings.METRICS_DIR:
+        return [_snapshot()]
+    flush(force=True)
+    snapshots = []
+    for name in os.listdir(settings.METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        metrics = data["metrics"]
+        if not _alive(data["pid"]):
+            # счётчики умерших воркеров остаются, их текущие gauge — нет
+            metrics = {n: m for n, m in metrics.items() if m["kind"] != "gauge"}
+        snapshots.append(metrics)
+    return snapshots
+
+
+def _merge(snapshots):
+    merged = {}
+    for metrics in snapshots:
+        for name, data in metrics.items():
+            values = merged.setdefault(name, {})
+            for key, value in data["values"]:
+                key = tuple(key)
+                if isinstance(value, list):
+                    current = values.get(key)
+                    values[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    values[key] = values.get(key, 0) + value
+    return merged
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, key, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, key)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    merged = _merge(_load_all())
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(merged.get(name, {}).items()):
+            if metric.kind == "histogram":
+                cumulative = 0
+                bounds = [*metric.buckets, float("inf")]
+                for bound, count in zip(bounds, value):
+                    cumulative += count
+                    le = "+Inf" if math.isinf(bound) else _number(float(bound))
+                    lines.append(f"{name}_bucket{_labels(metric.labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(metric.labelnames, key)} {_number(float(value[-2]))}")
+                lines.append(f"{name}_count{_labels(metric.labelnames, key)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_labels(metric.labelnames, key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_LATENCY = Histogram(
+    "homework_http_request_duration_seconds", "Время обработки запроса", ["view", "method"]
+)
+REQUESTS = Counter("homework_http_requests_total", "Запросы по статусу ответа", ["view", "method", "status"])
+REQUEST_QUERIES = Histogram(
+    "homework_http_request_db_queries", "SQL-запросов на один HTTP-запрос", ["view"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+GRADED = Counter("homework_grading_submissions_total", "Автоматически проверенные работы")
+GRADING_LATENCY = Histogram(
+    "homework_grading_duration_seconds", "Время автопроверки одной работы",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
+GRADING_QUESTION_LATENCY = Histogram(
+    "homework_grading_question_seconds", "Среднее время проверки одного вопроса",
+    buckets=(0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005, 0.001),
+)
+CHART_LATENCY = Histogram("homework_chart_render_seconds", "Время построения графика", ["chart"])
+CACHE_REQUESTS = Counter("homework_cache_requests_total", "Обращения к кешу", ["cache", "result"])
+INGEST_QUEUE = Gauge("homework_submission_ingest_queue_depth", "Ответы в буфере пакетной записи")
+
+
+def cache_lookup(cache_name, hit, amount=1):
+    if amount:
+        CACHE_REQUESTS.inc(amount, cache=cache_name, result="hit" if hit else "miss")
+
+
+def gauge_lines(name, documentation, value):
+    # Значения, которые считаются при сборке (например, запросом к базе)
+    # и не должны суммироваться по процессам.
+    return f"# HELP {name} {documentation}\n# TYPE {name} gauge\n{name} {_number(value)}\n"
@@ -0,0 +1,157 @@
+import mimetypes
+import os
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.decorators import sync_and_async_middleware
+
+from homework import metrics, queries
+
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{12}\.")
+
+ENCODINGS = (
+    ("br", ".br"),
+    ("gzip", ".gz"),
+)
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+
+@sync_and_async_middleware
+class StaticFilesMiddleware:
+    # Отдаёт собранную collectstatic статику прямо из STATIC_ROOT: выбирает
+    # заранее сжатый .br/.gz вариант по Accept-Encoding, а файлам с хешем
+    # в имени ставит immutable-кеширование на год.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.prefix = "/" + settings.STATIC_URL.lstrip("/")
+        self.root = str(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+        self._files = None
+
+    def _static_name(self, request):
+        if self.root and request.path.startswith(self.prefix) and request.method in ("GET", "HEAD"):
+            return request.path[len(self.prefix):]
+        return None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        name = self._static_name(request)
+        if name is not None:
+            response = self.serve(request, name)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        name = self._static_name(request)
+        if name is not None:
+            # Обход каталога и stat — блокирующие, их место в потоке.
+            response = await sync_to_async(self.serve, thread_sensitive=False)(request, name)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    @property
+    def files(self):
+        if self._files is None or settings.DEBUG:
+            self._files = self._scan()
+        return self._files
+
+    def _scan(self):
+        files = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                files[name] = path
+        return files
+
+    def serve(self, request, name):
+        path = self.files.get(name)
+        if path is None or name.endswith((".gz", ".br")):
+            return None
+
+        immutable = bool(HASHED_NAME_RE.search(os.path.basename(name)))
+        accept = request.headers.get("Accept-Encoding", "")
+        encoding = None
+        for candidate, suffix in ENCODINGS:
+            if candidate in accept and name + suffix in self.files:
+                path, encoding = self.files[name + suffix], candidate
+                break
+
+        # У каждого варианта сжатия свой ETag: иначе кеш или If-None-Match
+        # отдадут байты одной кодировки вместо другой.
+        etag = f'"{int(os.path.getmtime(path))}-{os.path.getsize(path)}{ETAG_SUFFIXES.get(encoding, "")}"'
+        headers = {
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": (
+                f"public, max-age={settings.STATIC_MAX_AGE}, immutable" if immutable else "public, max-age=60"
+            ),
+        }
+        if request.headers.get("If-None-Match") == etag:
+            # RFC 9110 15.4.5: 304 повторяет Cache-Control, ETag и Vary.
+            return HttpResponseNotModified(headers=headers)
+
+        content_type, _ = mimetypes.guess_type(name)
+        response = FileResponse(open(path, "rb"), content_type=content_type or "application/octet-stream")
+        if encoding:
+            response["Content-Encoding"] = encoding
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+
+@sync_and_async_middleware
+class MetricsMiddleware:
+    # Время ответа и число SQL-запросов (по всем базам и потокам запроса)
+    # по имени URL. Стоит первым в списке, чтобы учитывать и остальные
+    # middleware.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        queries.install_open()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        with queries.observe(counter):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        with queries.observe(counter):
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    def record(self, request, response, elapsed, query_count):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+        metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        metrics.REQUEST_QUERIES.observe(query_count, view=view)
+        metrics.flush()
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, alias, sql, seconds):
+        self.count += 1
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0008_subject_remove_gradescale_teacher'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeworktemplate',
+            name='file_previews',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Превью файла'),
+        ),
+    ]
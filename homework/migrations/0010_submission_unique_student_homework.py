@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-19 13:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_submissions(apps, schema_editor):
+    StudentSubmission = apps.get_model("homework", "StudentSubmission")
+    duplicates = (
+        StudentSubmission.objects
+        .values("student_id", "homework_template_id")
+        .annotate(n=Count("id"), last_id=Max("id"))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        (
+            StudentSubmission.objects
+            .filter(student_id=row["student_id"], homework_template_id=row["homework_template_id"])
+            .exclude(id=row["last_id"])
+            .delete()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0009_homeworktemplate_file_previews'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_submissions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='studentsubmission',
+            constraint=models.UniqueConstraint(fields=('student', 'homework_template'), name='unique_submission_per_student'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-19 13:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    StudentSubmission = apps.get_model("homework", "StudentSubmission")
+    StudentSubmission.objects.update(updated_at=F("submitted_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0011_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Время изменения'),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='studentsubmission',
+            index=models.Index(fields=['homework_template', 'updated_at', 'id'], name='submission_changes_idx'),
+        ),
+    ]
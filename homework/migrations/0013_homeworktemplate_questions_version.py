@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0012_submission_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeworktemplate',
+            name='questions_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия структуры вопросов'),
+        ),
+    ]
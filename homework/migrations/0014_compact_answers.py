@@ -0,0 +1,75 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:01
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def to_positional(apps, schema_editor):
+    HomeworkTemplate = apps.get_model("homework", "HomeworkTemplate")
+    StudentSubmission = apps.get_model("homework", "StudentSubmission")
+
+    for hw in HomeworkTemplate.objects.only("id", "questions", "questions_version").iterator():
+        numbers = [str(q["number"]) for q in (hw.questions or [])]
+        qs = StudentSubmission.objects.filter(homework_template_id=hw.id, answers_schema=1).only("id", "answers")
+        batch = []
+        for submission in qs.iterator(chunk_size=BATCH_SIZE):
+            answers = submission.answers if isinstance(submission.answers, dict) else {}
+            values = [answers.get(num) or "" for num in numbers]
+            while values and not values[-1]:
+                values.pop()
+            submission.answers = values
+            submission.answers_schema = 2
+            submission.layout_version = hw.questions_version
+            batch.append(submission)
+            if len(batch) >= BATCH_SIZE:
+                StudentSubmission.objects.bulk_update(batch, ["answers", "answers_schema", "layout_version"])
+                batch = []
+        if batch:
+            StudentSubmission.objects.bulk_update(batch, ["answers", "answers_schema", "layout_version"])
+
+
+def to_by_number(apps, schema_editor):
+    HomeworkTemplate = apps.get_model("homework", "HomeworkTemplate")
+    StudentSubmission = apps.get_model("homework", "StudentSubmission")
+
+    for hw in HomeworkTemplate.objects.only("id", "questions").iterator():
+        numbers = [str(q["number"]) for q in (hw.questions or [])]
+        qs = StudentSubmission.objects.filter(homework_template_id=hw.id, answers_schema=2).only("id", "answers")
+        batch = []
+        for submission in qs.iterator(chunk_size=BATCH_SIZE):
+            values = submission.answers or []
+            submission.answers = {num: (values[i] if i < len(values) else "") for i, num in enumerate(numbers)}
+            submission.answers_schema = 1
+            batch.append(submission)
+            if len(batch) >= BATCH_SIZE:
+                StudentSubmission.objects.bulk_update(batch, ["answers", "answers_schema"])
+                batch = []
+        if batch:
+            StudentSubmission.objects.bulk_update(batch, ["answers", "answers_schema"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0013_homeworktemplate_questions_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='answers_schema',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, verbose_name='Формат хранения ответов'),
+        ),
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='layout_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия структуры вопросов'),
+        ),
+        migrations.RunPython(to_positional, to_by_number),
+        migrations.AlterField(
+            model_name='studentsubmission',
+            name='answers_schema',
+            field=models.PositiveSmallIntegerField(default=2, editable=False, verbose_name='Формат хранения ответов'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0014_compact_answers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerformanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Неделя'), ('term', 'Четверть')], max_length=8, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('period_label', models.CharField(max_length=64, verbose_name='Название периода')),
+                ('submissions', models.PositiveIntegerField(default=0, verbose_name='Сдано работ')),
+                ('avg_percent', models.FloatField(blank=True, null=True, verbose_name='Средний процент')),
+                ('on_time_rate', models.FloatField(blank=True, null=True, verbose_name='Доля сданных в срок')),
+                ('grade_counts', models.JSONField(default=dict, verbose_name='Распределение оценок')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Пересчитано')),
+            ],
+            options={
+                'verbose_name': 'Сводка успеваемости',
+                'verbose_name_plural': 'Сводки успеваемости',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True, verbose_name='Название')),
+                ('updated_at', models.DateTimeField(blank=True, null=True, verbose_name='Время изменения последней учтённой сдачи')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='ID последней учтённой сдачи')),
+            ],
+            options={
+                'verbose_name': 'Позиция пересчёта сводок',
+                'verbose_name_plural': 'Позиции пересчёта сводок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='studentsubmission',
+            index=models.Index(fields=['updated_at', 'id'], name='submission_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='performancesnapshot',
+            name='classroom',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='performance_snapshots', to='homework.classroom', verbose_name='Класс'),
+        ),
+        migrations.AddField(
+            model_name='performancesnapshot',
+            name='student',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='performance_snapshots', to=settings.AUTH_USER_MODEL, verbose_name='Ученик'),
+        ),
+        migrations.AddIndex(
+            model_name='performancesnapshot',
+            index=models.Index(fields=['classroom', 'period', 'period_start'], name='homework_pe_classro_2ee584_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0016_homework_classroom_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeworktemplate',
+            name='answer_key_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия ключа ответов'),
+        ),
+        migrations.CreateModel(
+            name='GradingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('auto', 'Автопроверка'), ('review', 'Проверка учителем'), ('bulk', 'Массовая проверка'), ('regrade', 'Перепроверка')], max_length=16, verbose_name='Источник')),
+                ('old_score', models.PositiveIntegerField(blank=True, null=True, verbose_name='Прежний итоговый балл')),
+                ('new_score', models.PositiveIntegerField(verbose_name='Новый итоговый балл')),
+                ('auto_score', models.PositiveIntegerField(verbose_name='Балл автопроверки')),
+                ('answer_key_version', models.PositiveIntegerField(verbose_name='Версия ключа ответов')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Время')),
+                ('partition', models.PositiveIntegerField(editable=False, verbose_name='Раздел (ГГГГММ)')),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Кто изменил')),
+                ('homework_template', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='homework.homeworktemplate', verbose_name='Домашнее задание')),
+                ('student', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Ученик')),
+            ],
+            options={
+                'verbose_name': 'Событие проверки',
+                'verbose_name_plural': 'Журнал проверки',
+                'indexes': [models.Index(fields=['student', 'homework_template', 'created_at'], name='grading_event_history_idx'), models.Index(fields=['partition'], name='grading_event_partition_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:22
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def close_past_homeworks(apps, schema_editor):
+    # Старые ДЗ считаются уже закрытыми: планировщик не должен задним
+    # числом выставлять нули и рассылать уведомления по прошлым годам.
+    HomeworkTemplate = apps.get_model('homework', 'HomeworkTemplate')
+    now = timezone.now()
+    past = HomeworkTemplate.objects.filter(deadline__lt=timezone.localdate())
+    past.update(closed_at=now, reminders_sent_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0017_grading_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeworktemplate',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Приём ответов закрыт'),
+        ),
+        migrations.AddField(
+            model_name='homeworktemplate',
+            name='reminders_sent_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Напоминания отправлены'),
+        ),
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='is_missing',
+            field=models.BooleanField(default=False, verbose_name='Не сдано в срок'),
+        ),
+        migrations.AlterField(
+            model_name='gradingevent',
+            name='source',
+            field=models.CharField(choices=[('auto', 'Автопроверка'), ('review', 'Проверка учителем'), ('bulk', 'Массовая проверка'), ('regrade', 'Перепроверка'), ('deadline', 'Закрытие по сроку')], max_length=16, verbose_name='Источник'),
+        ),
+        migrations.AlterField(
+            model_name='homeworktemplate',
+            name='deadline',
+            field=models.DateField(db_index=True, verbose_name='Дедлайн'),
+        ),
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='kind',
+            field=models.CharField(choices=[('graded', 'Работа проверена'), ('deadline_reminder', 'Напоминание о сроке сдачи'), ('missing', 'Работа не сдана')], max_length=32, verbose_name='Тип'),
+        ),
+        migrations.RunPython(close_past_homeworks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:39
+
+from django.db import migrations, models
+
+
+def search_key(value):
+    return (value or '').strip().lower().replace('ё', 'е')
+
+
+def fill_search_fields(apps, schema_editor):
+    # Профили — в базе, к которой применяется миграция; логины берутся
+    # у пользователей, которые при разнесении школ лежат в общей базе.
+    Profile = apps.get_model('homework', 'Profile')
+    User = apps.get_model('auth', 'User')
+    profiles = list(Profile.objects.using(schema_editor.connection.alias).only('user_id', 'first_name', 'last_name'))
+    usernames = dict(User.objects.filter(pk__in=[p.user_id for p in profiles]).values_list('pk', 'username'))
+    for profile in profiles:
+        profile.search_last_name = search_key(profile.last_name)
+        profile.search_first_name = search_key(profile.first_name)
+        profile.search_username = search_key(usernames.get(profile.user_id))
+    Profile.objects.using(schema_editor.connection.alias).bulk_update(
+        profiles, ['search_last_name', 'search_first_name', 'search_username'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0019_tenant_databases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_first_name',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='search_last_name',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='search_username',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['classroom', 'search_last_name'], name='profile_search_last_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['classroom', 'search_first_name'], name='profile_search_first_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['classroom', 'search_username'], name='profile_search_username_idx'),
+        ),
+    ]
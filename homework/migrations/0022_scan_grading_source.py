@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0021_request_profiles'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gradingevent',
+            name='source',
+            field=models.CharField(choices=[('auto', 'Автопроверка'), ('review', 'Проверка учителем'), ('bulk', 'Массовая проверка'), ('regrade', 'Перепроверка'), ('deadline', 'Закрытие по сроку'), ('scan', 'Бумажный бланк')], max_length=16, verbose_name='Источник'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.1.15 on 2026-10-19 16:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0022_scan_grading_source'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Subject',
+        ),
+    ]
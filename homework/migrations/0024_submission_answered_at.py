@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0023_delete_subject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='answered_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Время получения ответов'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0024_submission_answered_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Неудачных попыток'),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='delivered',
+            field=models.JSONField(blank=True, default=list, verbose_name='Доставлено в каналы'),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка'),
+        ),
+    ]
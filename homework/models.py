@@ -1,13 +1,32 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from homework import tenants
+
+
+def pack_answers(questions, answers):
+    values = [answers.get(str(q["number"])) or answers.get(q["number"]) or "" for q in questions]
+    while values and not values[-1]:
+        values.pop()
+    return values
+
+
+def search_key(value):
+    # Нормализованная форма для поиска по префиксу: без регистра, «ё» как «е».
+    return (value or "").strip().lower().replace("ё", "е")
 
 class Classroom(models.Model):
     name = models.CharField("Имя класса", max_length=64)
+    # Ссылки на пользователя без ограничения в базе: при разнесении школ по
+    # базам (homework.tenants) таблица пользователей лежит в общей базе.
     teacher = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name="teacher_classrooms",
         verbose_name="Учитель")
+    updated_at = models.DateTimeField("Время изменения", auto_now=True)
 
     def __str__(self):
         return self.name
@@ -16,6 +35,23 @@ class Classroom(models.Model):
         verbose_name = "Класс"
         verbose_name_plural = "Классы"
 
+class UserTenant(models.Model):
+    # Школа пользователя; хранится в общей базе вместе с пользователями.
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name="tenant",
+        verbose_name="Пользователь",
+    )
+    tenant = models.CharField("Школа", max_length=64)
+
+    def __str__(self):
+        return f'{self.user.username} - {self.tenant}'
+
+    class Meta:
+        verbose_name = "Школа пользователя"
+        verbose_name_plural = "Школы пользователей"
+
 class Profile(models.Model):
     ROLE_CHOICES = [
         ("teacher", "Учитель"),
@@ -25,6 +61,7 @@ class Profile(models.Model):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name="profile",
         verbose_name="Пользователь",
     )
@@ -40,14 +77,33 @@ class Profile(models.Model):
     last_name = models.CharField("Фамилия", max_length=64, blank=True)
     patronymic = models.CharField("Отчество", max_length=64, blank=True)
     birth_date = models.DateField("Дата рождения", null=True, blank=True)
+    # Копии для поиска учеников (homework.search): нормализованы, логин
+    # продублирован, так как пользователи могут лежать в другой базе.
+    # Индексы начинаются с класса — ищутся ученики без класса.
+    search_last_name = models.CharField(max_length=64, blank=True, editable=False)
+    search_first_name = models.CharField(max_length=64, blank=True, editable=False)
+    search_username = models.CharField(max_length=150, blank=True, editable=False)
 
+    SEARCH_FIELDS = ("search_last_name", "search_first_name", "search_username")
 
     def __str__(self):
         return f'{self.last_name} {self.first_name} ({self.get_role_display()})'
 
+    def save(self, *args, **kwargs):
+        self.search_last_name = search_key(self.last_name)
+        self.search_first_name = search_key(self.first_name)
+        self.search_username = search_key(self.user.username)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], *self.SEARCH_FIELDS}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Профиль"
         verbose_name_plural = "Профили"
+        indexes = [
+            models.Index(fields=["classroom", field], name=f"profile_{field}_idx")
+            for field in ("search_last_name", "search_first_name", "search_username")
+        ]
 
 class GradeScale(models.Model):
     threshold_1 = models.PositiveIntegerField("Порог для 1", default=0)
@@ -76,10 +132,13 @@ class HomeworkTemplate(models.Model):
         blank=True,
         null=True,
     )
+    file_previews = models.JSONField("Превью файла", default=dict, blank=True, editable=False)
     questions = models.JSONField("Структура вопросов")
+    questions_version = models.PositiveIntegerField("Версия структуры вопросов", default=1, editable=False)
     correct_answers = models.JSONField("Правильные ответы")
+    answer_key_version = models.PositiveIntegerField("Версия ключа ответов", default=1, editable=False)
     assigned_date = models.DateField("Дата выдачи")
-    deadline = models.DateField("Дедлайн")
+    deadline = models.DateField("Дедлайн", db_index=True)
     max_score = models.PositiveIntegerField("Максимальный балл", default=0)
     grade_scale = models.ForeignKey(
         GradeScale,
@@ -87,19 +146,89 @@ class HomeworkTemplate(models.Model):
         related_name="homeworks",
         verbose_name="Шкала оценивания",
     )
+    updated_at = models.DateTimeField("Время изменения", auto_now=True)
+    closed_at = models.DateTimeField("Приём ответов закрыт", null=True, blank=True, editable=False)
+    reminders_sent_at = models.DateTimeField("Напоминания отправлены", null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.title
 
+    @property
+    def is_closed(self):
+        # Приём закрывается на следующий день после дедлайна, даже если
+        # планировщик ещё не успел пройти по этому ДЗ.
+        return self.closed_at is not None or self.deadline < timezone.localdate()
+
+    def save(self, *args, **kwargs):
+        old_questions = None
+        if self.pk is not None:
+            old = HomeworkTemplate.objects.filter(pk=self.pk).values("questions", "correct_answers").first()
+            if old is not None:
+                if old["questions"] != self.questions:
+                    old_questions = old["questions"]
+                    self.questions_version += 1
+                if old_questions is not None or old["correct_answers"] != self.correct_answers:
+                    self.answer_key_version += 1
+
+        with tenants.atomic():
+            super().save(*args, **kwargs)
+            if old_questions is not None:
+                self._realign_submissions(old_questions)
+
+    def _realign_submissions(self, old_questions, batch_size=500):
+        # Ответы хранятся позиционно, поэтому при изменении списка вопросов
+        # их нужно переложить под новую раскладку по номерам вопросов.
+        batch = []
+        qs = self.submissions.filter(
+            answers_schema=StudentSubmission.ANSWERS_POSITIONAL,
+            layout_version=self.questions_version - 1,
+        )
+        for submission in qs.only("id", "answers", "layout_version").iterator(chunk_size=batch_size):
+            submission.realign(old_questions, self)
+            batch.append(submission)
+            if len(batch) >= batch_size:
+                StudentSubmission.objects.bulk_update(batch, ["answers", "layout_version"])
+                batch = []
+        if batch:
+            StudentSubmission.objects.bulk_update(batch, ["answers", "layout_version"])
+
+    def _preview_srcset(self, key):
+        variants = (self.file_previews or {}).get("variants", {}).get(key, [])
+        storage = self.homework_file.storage
+        return ", ".join(f"{storage.url(name)} {width}w" for width, name in variants)
+
+    @property
+    def has_previews(self):
+        return bool((self.file_previews or {}).get("variants"))
+
+    @property
+    def preview_srcset_webp(self):
+        return self._preview_srcset("webp")
+
+    @property
+    def preview_srcset_jpeg(self):
+        return self._preview_srcset("jpeg")
+
+    @property
+    def preview_url(self):
+        variants = (self.file_previews or {}).get("variants", {}).get("jpeg", [])
+        if not variants:
+            return ""
+        return self.homework_file.storage.url(variants[0][1])
+
     class Meta:
         verbose_name = "Домашнее задание"
         verbose_name_plural = "Домашние задания"
 
 
 class StudentSubmission(models.Model):
+    ANSWERS_BY_NUMBER = 1
+    ANSWERS_POSITIONAL = 2
+
     student = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name="submissions",
         verbose_name="Ученик",
     )
@@ -110,16 +239,294 @@ class StudentSubmission(models.Model):
         verbose_name="Домашнее задание",
     )
     answers = models.JSONField("Ответы ученика")
+    answers_schema = models.PositiveSmallIntegerField(
+        "Формат хранения ответов", default=ANSWERS_POSITIONAL, editable=False
+    )
+    layout_version = models.PositiveIntegerField("Версия структуры вопросов", default=1, editable=False)
     auto_score = models.PositiveIntegerField("Балл после проверки системы", default=0)
     final_score = models.PositiveIntegerField("Итоговый балл", default=0)
     grade = models.PositiveSmallIntegerField("Оценка", null=True, blank=True)
     graded = models.BooleanField("Проверено", default=False)
     teacher_comment = models.TextField("Комментарий учителя", blank=True)
+    is_missing = models.BooleanField("Не сдано в срок", default=False)
+    # Когда получены сохранённые ответы; по нему пакетная запись
+    # (homework.ingest) отличает устаревшую сдачу от новой.
+    answered_at = models.DateTimeField("Время получения ответов", null=True, blank=True, editable=False)
     submitted_at = models.DateTimeField("Время отправки", auto_now_add=True)
+    updated_at = models.DateTimeField("Время изменения", auto_now=True)
 
     def __str__(self):
         return f'{self.student.username} - {self.homework_template.title}'
 
+    def set_answers(self, hw, answers):
+        self.answers = pack_answers(hw.questions or [], answers)
+        self.answers_schema = self.ANSWERS_POSITIONAL
+        self.layout_version = hw.questions_version
+        self.answered_at = timezone.now()
+
+    def realign(self, old_questions, hw):
+        by_number = {str(q["number"]): v for q, v in zip(old_questions or [], self.answers or [])}
+        self.answers = pack_answers(hw.questions or [], by_number)
+        self.layout_version = hw.questions_version
+
+    def answer_values(self, hw):
+        questions = hw.questions or []
+        if self.answers_schema == self.ANSWERS_POSITIONAL:
+            # Строка, разложенная под другую версию вопросов, прочиталась бы
+            # со сдвигом; такие ответы не показываются и не проверяются.
+            if self.layout_version != hw.questions_version:
+                return [""] * len(questions)
+            values = list(self.answers or [])[:len(questions)]
+        else:
+            values = pack_answers(questions, self.answers or {})
+        return values + [""] * (len(questions) - len(values))
+
+    def answer_map(self, hw):
+        return {str(q["number"]): v for q, v in zip(hw.questions or [], self.answer_values(hw))}
+
     class Meta:
         verbose_name = "Ответ ученика"
         verbose_name_plural = "Ответы учеников"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "homework_template"],
+                name="unique_submission_per_student",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["homework_template", "updated_at", "id"],
+                name="submission_changes_idx",
+            ),
+            models.Index(
+                fields=["updated_at", "id"],
+                name="submission_updated_idx",
+            ),
+        ]
+
+
+class NotificationOutbox(models.Model):
+    KIND_CHOICES = [
+        ("graded", "Работа проверена"),
+        ("deadline_reminder", "Напоминание о сроке сдачи"),
+        ("missing", "Работа не сдана"),
+    ]
+
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name="outbox_messages",
+        verbose_name="Получатель",
+    )
+    kind = models.CharField("Тип", max_length=32, choices=KIND_CHOICES)
+    payload = models.JSONField("Данные", default=dict)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    processed_at = models.DateTimeField("Отправлено", null=True, blank=True)
+    # Каналы (homework.notifications), в которые сообщение уже доставлено:
+    # при повторе после сбоя одного канала остальные не дублируются.
+    delivered = models.JSONField("Доставлено в каналы", default=list, blank=True)
+    attempts = models.PositiveSmallIntegerField("Неудачных попыток", default=0)
+    retry_at = models.DateTimeField("Следующая попытка", null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.recipient.username} - {self.get_kind_display()}'
+
+    class Meta:
+        verbose_name = "Исходящее уведомление"
+        verbose_name_plural = "Очередь уведомлений"
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+
+class Notification(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name="notifications",
+        verbose_name="Пользователь",
+    )
+    title = models.CharField("Заголовок", max_length=128)
+    body = models.TextField("Текст")
+    is_read = models.BooleanField("Прочитано", default=False)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = "Уведомление"
+        verbose_name_plural = "Уведомления"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "is_read"]),
+        ]
+
+
+class PerformanceSnapshot(models.Model):
+    PERIOD_CHOICES = [
+        ("week", "Неделя"),
+        ("term", "Четверть"),
+    ]
+
+    classroom = models.ForeignKey(
+        Classroom,
+        on_delete=models.CASCADE,
+        related_name="performance_snapshots",
+        verbose_name="Класс",
+    )
+    student = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="performance_snapshots",
+        verbose_name="Ученик",
+    )
+    period = models.CharField("Период", max_length=8, choices=PERIOD_CHOICES)
+    period_start = models.DateField("Начало периода")
+    period_label = models.CharField("Название периода", max_length=64)
+    submissions = models.PositiveIntegerField("Сдано работ", default=0)
+    avg_percent = models.FloatField("Средний процент", null=True, blank=True)
+    on_time_rate = models.FloatField("Доля сданных в срок", null=True, blank=True)
+    grade_counts = models.JSONField("Распределение оценок", default=dict)
+    updated_at = models.DateTimeField("Пересчитано", auto_now=True)
+
+    def __str__(self):
+        return f'{self.classroom} - {self.period_label}'
+
+    @property
+    def grades(self):
+        return [(g, self.grade_counts.get(str(g), 0)) for g in (5, 4, 3, 2, 1)]
+
+    class Meta:
+        verbose_name = "Сводка успеваемости"
+        verbose_name_plural = "Сводки успеваемости"
+        indexes = [
+            models.Index(fields=["classroom", "period", "period_start"]),
+        ]
+
+
+class RollupCheckpoint(models.Model):
+    name = models.CharField("Название", max_length=32, unique=True)
+    updated_at = models.DateTimeField("Время изменения последней учтённой сдачи", null=True, blank=True)
+    last_id = models.BigIntegerField("ID последней учтённой сдачи", default=0)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Позиция пересчёта сводок"
+        verbose_name_plural = "Позиции пересчёта сводок"
+
+
+def partition_for(moment):
+    local = timezone.localtime(moment)
+    return local.year * 100 + local.month
+
+
+class GradingEvent(models.Model):
+    # Журнал только на добавление: строки не меняются и не удаляются,
+    # кроме как целыми месячными разделами по сроку хранения.
+    SOURCE_CHOICES = [
+        ("auto", "Автопроверка"),
+        ("review", "Проверка учителем"),
+        ("bulk", "Массовая проверка"),
+        ("regrade", "Перепроверка"),
+        ("deadline", "Закрытие по сроку"),
+        ("scan", "Бумажный бланк"),
+    ]
+
+    student = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+        verbose_name="Ученик",
+    )
+    homework_template = models.ForeignKey(
+        HomeworkTemplate,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+        verbose_name="Домашнее задание",
+    )
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Кто изменил",
+    )
+    source = models.CharField("Источник", max_length=16, choices=SOURCE_CHOICES)
+    old_score = models.PositiveIntegerField("Прежний итоговый балл", null=True, blank=True)
+    new_score = models.PositiveIntegerField("Новый итоговый балл")
+    auto_score = models.PositiveIntegerField("Балл автопроверки")
+    answer_key_version = models.PositiveIntegerField("Версия ключа ответов")
+    created_at = models.DateTimeField("Время", default=timezone.now, editable=False)
+    partition = models.PositiveIntegerField("Раздел (ГГГГММ)", editable=False)
+
+    def __str__(self):
+        return f'{self.get_source_display()}: {self.old_score} → {self.new_score}'
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("События проверки нельзя изменять")
+        if self.partition is None:
+            self.partition = partition_for(self.created_at)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name = "Событие проверки"
+        verbose_name_plural = "Журнал проверки"
+        indexes = [
+            models.Index(
+                fields=["student", "homework_template", "created_at"],
+                name="grading_event_history_idx",
+            ),
+            models.Index(fields=["partition"], name="grading_event_partition_idx"),
+        ]
+
+
+class RequestProfile(models.Model):
+    # Профиль одного запроса сотрудника (homework.profiling). Хранится
+    # в общей базе вместе с пользователями.
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Пользователь",
+    )
+    created_at = models.DateTimeField("Время", default=timezone.now, editable=False)
+    method = models.CharField("Метод", max_length=8)
+    path = models.CharField("Адрес", max_length=2000)
+    view_name = models.CharField("Представление", max_length=200, blank=True)
+    status = models.PositiveSmallIntegerField("Код ответа")
+    duration_ms = models.FloatField("Время, мс")
+    query_count = models.PositiveIntegerField("SQL-запросов")
+    query_ms = models.FloatField("Время SQL, мс")
+    memory_peak_kb = models.FloatField("Пик памяти, КБ")
+    samples = models.PositiveIntegerField("Выборок стека")
+    # Стеки в свёрнутом формате flamegraph.pl/speedscope: «a;b;c число».
+    stacks = models.TextField("Стеки", blank=True)
+    queries = models.JSONField("SQL-запросы", default=list)
+    allocations = models.JSONField("Выделения памяти", default=list)
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} мс)'
+
+    class Meta:
+        verbose_name = "Профиль запроса"
+        verbose_name_plural = "Профили запросов"
+        ordering = ["-created_at"]
@@ -0,0 +1,190 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from homework import tenants
+from homework.grading import max_points
+from homework.models import Notification, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Digest:
+    user: User
+    items: list = field(default_factory=list)
+
+    @property
+    def title(self):
+        kinds = {item.get("kind", "graded") for item in self.items}
+        if len(self.items) == 1:
+            return f"{TITLES[kinds.pop()]}: {self.items[0]['hw_title']}"
+        if kinds == {"graded"}:
+            return f"Проверено работ: {len(self.items)}"
+        return f"Новых уведомлений: {len(self.items)}"
+
+    @property
+    def body(self):
+        return "\n".join(_line(item) for item in self.items)
+
+
+TITLES = {
+    "graded": "Работа проверена",
+    "deadline_reminder": "Скоро срок сдачи",
+    "missing": "Работа не сдана",
+}
+
+
+def _line(item):
+    kind = item.get("kind", "graded")
+    if kind == "deadline_reminder":
+        return f"«{item['hw_title']}»: сдать до {item['deadline']}"
+    if kind == "missing":
+        return f"«{item['hw_title']}»: работа не сдана в срок, выставлено 0 баллов"
+    line = f"«{item['hw_title']}»: {item['final_score']} из {item['max_score']} ({item['percent']}%)"
+    if item.get("grade"):
+        line += f", оценка {item['grade']}"
+    return line
+
+
+class InAppChannel:
+    name = "in_app"
+
+    def deliver(self, digests):
+        with tenants.atomic():
+            Notification.objects.bulk_create([
+                Notification(user=d.user, title=d.title, body=d.body) for d in digests
+            ])
+
+
+class EmailChannel:
+    name = "email"
+
+    def deliver(self, digests):
+        messages = [
+            EmailMessage(d.title, d.body, settings.DEFAULT_FROM_EMAIL, [d.user.email])
+            for d in digests if d.user.email
+        ]
+        if messages:
+            get_connection().send_messages(messages)
+
+
+def get_channels():
+    return [import_string(path)() for path in settings.NOTIFICATION_CHANNELS]
+
+
+def _graded_payload(hw, submission):
+    max_score = max_points(hw)
+    percent = round(submission.final_score * 100 / max_score) if max_score else 0
+    return {
+        "hw_id": hw.id,
+        "hw_title": hw.title,
+        "final_score": submission.final_score,
+        "max_score": max_score,
+        "percent": percent,
+        "grade": submission.grade,
+    }
+
+
+def enqueue_graded(hw, submissions):
+    NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(
+            recipient_id=s.student_id,
+            kind="graded",
+            payload=_graded_payload(hw, s),
+        )
+        for s in submissions
+    ])
+
+
+def enqueue_deadline(kind, hw, student_ids):
+    payload = {"hw_id": hw.id, "hw_title": hw.title, "deadline": f"{hw.deadline:%d.%m.%Y}"}
+    NotificationOutbox.objects.bulk_create(
+        [NotificationOutbox(recipient_id=student_id, kind=kind, payload=payload) for student_id in student_ids],
+        batch_size=settings.NOTIFICATION_BATCH_SIZE,
+    )
+
+
+def _digests(messages, users):
+    digests = {}
+    for message in messages:
+        user = users.get(message.recipient_id)
+        if user is None:
+            continue
+        digest = digests.setdefault(message.recipient_id, Digest(user=user))
+        digest.items.append({**message.payload, "kind": message.kind})
+    return list(digests.values())
+
+
+def _deliver(channel, digests):
+    # Вне транзакции: отправка почты не держит блокировку базы, а сбой
+    # одного канала не мешает остальным.
+    try:
+        channel.deliver(digests)
+    except Exception:
+        logger.exception("Канал уведомлений %s не доставил пачку, повтор позже", channel.name)
+        return False
+    return True
+
+
+def _claim(batch_size, now):
+    # Короткая транзакция: сообщения помечаются retry_at через
+    # NOTIFICATION_CLAIM_TIMEOUT, и другие обработчики их не берут.
+    # Если обработчик упал, не дойдя до отметки, сообщения снова станут
+    # доступны по истечении этого срока (возможен повтор доставки).
+    with tenants.atomic():
+        batch = list(
+            NotificationOutbox.objects
+            .select_for_update(skip_locked=True, of=("self",))
+            .filter(processed_at__isnull=True)
+            .filter(Q(retry_at__isnull=True) | Q(retry_at__lte=now))
+            .order_by("id")[:batch_size]
+        )
+        if batch:
+            NotificationOutbox.objects.filter(pk__in=[m.pk for m in batch]).update(
+                retry_at=now + timedelta(seconds=settings.NOTIFICATION_CLAIM_TIMEOUT)
+            )
+    return batch
+
+
+def drain(batch_size=None, channels=None):
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    channels = get_channels() if channels is None else channels
+    now = timezone.now()
+
+    batch = _claim(batch_size, now)
+    if not batch:
+        return 0
+
+    # Получатели отдельным запросом: пользователи могут лежать в другой
+    # базе, чем очередь (homework.tenants).
+    users = User.objects.in_bulk({message.recipient_id for message in batch})
+    for channel in channels:
+        pending = [m for m in batch if channel.name not in m.delivered]
+        if pending and _deliver(channel, _digests(pending, users)):
+            for message in pending:
+                message.delivered = [*message.delivered, channel.name]
+
+    names = {channel.name for channel in channels}
+    now = timezone.now()
+    for message in batch:
+        if names <= set(message.delivered):
+            message.processed_at = now
+            continue
+        message.attempts += 1
+        if message.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            logger.error("Уведомление %s не доставлено после %s попыток", message.pk, message.attempts)
+            message.processed_at = now
+        else:
+            message.retry_at = now + timedelta(seconds=settings.NOTIFICATION_RETRY_DELAY * message.attempts)
+    with tenants.atomic():
+        NotificationOutbox.objects.bulk_update(batch, ["delivered", "attempts", "retry_at", "processed_at"])
+
+    return len(batch)
@@ -0,0 +1,299 @@
+import logging
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+# Бланки ответов для проверки на бумаге. Модуль без Django: чтение листов
+# идёт в отдельных процессах (homework.scans).
+#
+# Лист A4 при 150 dpi. По углам — четыре чёрных квадрата-метки, по ним
+# находится аффинное преобразование бланка в скан. Под шапкой — полоса
+# из 64 клеток с кодом листа (ДЗ, ученик, страница). Вопрос с текстовым
+# ответом — строка кружков с буквами (выбор варианта), числовой вопрос —
+# сетка: строка на каждый знак числа, столбцы 0–9, «-» и «,».
+
+logger = logging.getLogger(__name__)
+
+PAGE_WIDTH = 1240
+PAGE_HEIGHT = 1754
+DPI = 150
+
+FIDUCIAL = 40
+FIDUCIALS = np.array([(80, 80), (1160, 80), (80, 1674), (1160, 1674)], dtype=float)
+# Метка ищется в окне вокруг ожидаемого места: сдвиг скана до ±SEARCH.
+SEARCH = 120
+
+CODE_Y = 240
+CODE_X = 176
+CODE_CELL = 14
+CODE_HEIGHT = 20
+CODE_FIELDS = (("hw", 24), ("student", 28), ("page", 6))
+CODE_CHECK_BITS = 6
+CODE_BITS = sum(bits for _, bits in CODE_FIELDS) + CODE_CHECK_BITS
+
+AREA_TOP = 300
+AREA_BOTTOM = 1600
+COLUMNS = (110, 660)
+LABEL_WIDTH = 56
+BUBBLE_RADIUS = 9
+PITCH = 26
+HEADER_HEIGHT = 24
+QUESTION_GAP = 18
+
+CHOICES = "АБВГДЕ"
+DIGITS = "0123456789"
+NUMBER_SYMBOLS = {"int": DIGITS + "-", "float": DIGITS + "-,"}
+NUMBER_WIDTH = 6
+
+# Доля тёмных пикселей в кружке: выше FILLED — отмечен. Если отмечено
+# несколько, засчитывается самый тёмный, если он заметно темнее второго
+# (исправление ответа закрашиванием поверх).
+FILLED = 0.45
+CLEAR_MARGIN = 0.25
+
+
+class SheetError(Exception):
+    pass
+
+
+def _question_layout(question):
+    fmt = question.get("answer_format", "text")
+    if fmt in NUMBER_SYMBOLS:
+        symbols = NUMBER_SYMBOLS[fmt]
+        rows = NUMBER_WIDTH
+        height = HEADER_HEIGHT + rows * PITCH
+    else:
+        symbols = CHOICES
+        rows = 1
+        height = PITCH
+    return {"number": str(question["number"]), "format": fmt, "symbols": symbols, "rows": rows, "height": height}
+
+
+def layout(questions):
+    # Раскладка по страницам и столбцам; каждому вопросу — центры кружков
+    # [строка][символ] в координатах бланка.
+    pages = [[]]
+    column, y = 0, AREA_TOP
+    for question in questions or []:
+        block = _question_layout(question)
+        if y + block["height"] > AREA_BOTTOM:
+            column, y = column + 1, AREA_TOP
+            if column == len(COLUMNS):
+                pages.append([])
+                column = 0
+        x0 = COLUMNS[column] + LABEL_WIDTH + BUBBLE_RADIUS
+        top = y + (HEADER_HEIGHT if block["format"] in NUMBER_SYMBOLS else 0) + PITCH // 2
+        block["label"] = (COLUMNS[column], y + (HEADER_HEIGHT if block["format"] in NUMBER_SYMBOLS else 0))
+        block["centers"] = [
+            [(x0 + i * PITCH, top + row * PITCH) for i in range(len(block["symbols"]))]
+            for row in range(block["rows"])
+        ]
+        pages[-1].append(block)
+        y += block["height"] + QUESTION_GAP
+    return pages
+
+
+def _checksum(value):
+    total = 0
+    while value:
+        total += value & ((1 << CODE_CHECK_BITS) - 1)
+        value >>= CODE_CHECK_BITS
+    return total & ((1 << CODE_CHECK_BITS) - 1)
+
+
+def encode(hw, student, page):
+    value = 0
+    for (name, bits), field in zip(CODE_FIELDS, (hw, student, page)):
+        if not 0 <= field < 1 << bits:
+            raise ValueError(f"{name}={field} не помещается в код листа")
+        value = (value << bits) | field
+    value = (value << CODE_CHECK_BITS) | _checksum(value)
+    return [(value >> (CODE_BITS - 1 - i)) & 1 for i in range(CODE_BITS)]
+
+
+def decode(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    check = value & ((1 << CODE_CHECK_BITS) - 1)
+    value >>= CODE_CHECK_BITS
+    if _checksum(value) != check:
+        raise SheetError("Код листа не читается")
+    fields = {}
+    for name, bits in reversed(CODE_FIELDS):
+        fields[name] = value & ((1 << bits) - 1)
+        value >>= bits
+    return fields
+
+
+def _code_centers():
+    return [(CODE_X + i * CODE_CELL + CODE_CELL / 2, CODE_Y + CODE_HEIGHT / 2) for i in range(CODE_BITS)]
+
+
+def _font(size):
+    # Шрифт с кириллицей берётся из matplotlib, он и так в зависимостях.
+    try:
+        import matplotlib
+
+        return ImageFont.truetype(os.path.join(matplotlib.get_data_path(), "fonts", "ttf", "DejaVuSans.ttf"), size)
+    except (ImportError, OSError):
+        return ImageFont.load_default(size)
+
+
+def render(page_layout, bits, header):
+    image = Image.new("L", (PAGE_WIDTH, PAGE_HEIGHT), 255)
+    draw = ImageDraw.Draw(image)
+    half = FIDUCIAL / 2
+    for x, y in FIDUCIALS:
+        draw.rectangle((x - half, y - half, x + half - 1, y + half - 1), fill=0)
+
+    title, small, tiny = _font(26), _font(18), _font(11)
+    for i, line in enumerate(header):
+        draw.text((140, 120 + i * 34), line, fill=0, font=title if i == 0 else small)
+    for bit, (x, y) in zip(bits, _code_centers()):
+        if bit:
+            draw.rectangle((x - CODE_CELL / 2, y - CODE_HEIGHT / 2, x + CODE_CELL / 2 - 1, y + CODE_HEIGHT / 2 - 1), fill=0)
+
+    for block in page_layout:
+        draw.text(block["label"], f"{block['number']}.", fill=0, font=small)
+        if block["format"] in NUMBER_SYMBOLS:
+            for symbol, (x, _) in zip(block["symbols"], block["centers"][0]):
+                draw.text((x, block["centers"][0][0][1] - PITCH + 2), symbol, fill=0, font=small, anchor="mm")
+        for row in block["centers"]:
+            for i, (x, y) in enumerate(row):
+                r = BUBBLE_RADIUS
+                draw.ellipse((x - r, y - r, x + r, y + r), outline=0, width=2)
+                if block["format"] not in NUMBER_SYMBOLS:
+                    draw.text((x, y), block["symbols"][i], fill=150, font=tiny, anchor="mm")
+    return image
+
+
+# Чтение скана
+
+
+def _load(data):
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("L")
+    factor = int(image.width // PAGE_WIDTH)
+    if factor >= 2:
+        image = image.reduce(factor)
+    pixels = np.asarray(image, dtype=np.float32)
+    # Тёмность 0..1 относительно бумаги, а не абсолютной белизны.
+    paper = max(float(np.percentile(pixels, 90)), 1.0)
+    return np.clip(1.0 - pixels / paper, 0.0, 1.0)
+
+
+def _find_fiducial(dark, expected, size):
+    # Сумма тёмных пикселей в окне size×size через интегральное изображение;
+    # метка — окно с максимальной суммой.
+    h, w = dark.shape
+    x0 = int(max(expected[0] - SEARCH * size / FIDUCIAL, 0))
+    y0 = int(max(expected[1] - SEARCH * size / FIDUCIAL, 0))
+    x1 = int(min(expected[0] + SEARCH * size / FIDUCIAL, w))
+    y1 = int(min(expected[1] + SEARCH * size / FIDUCIAL, h))
+    region = dark[y0:y1, x0:x1] > 0.5
+    k = max(int(round(size)), 3)
+    if region.shape[0] <= k or region.shape[1] <= k:
+        raise SheetError("Метки на листе не найдены")
+    integral = np.pad(region, ((1, 0), (1, 0))).cumsum(0, dtype=np.int32).cumsum(1, dtype=np.int32)
+    sums = integral[k:, k:] - integral[:-k, k:] - integral[k:, :-k] + integral[:-k, :-k]
+    best = np.unravel_index(np.argmax(sums), sums.shape)
+    if sums[best] < 0.8 * k * k:
+        raise SheetError("Метки на листе не найдены")
+    # Середина всех окон с почти максимальной суммой — устойчивее одного argmax.
+    ys, xs = np.nonzero(sums >= 0.97 * sums[best])
+    return x0 + xs.mean() + k / 2, y0 + ys.mean() + k / 2
+
+
+def _fit(dark):
+    h, w = dark.shape
+    scale = w / PAGE_WIDTH
+    found = np.array([_find_fiducial(dark, point * scale, FIDUCIAL * scale) for point in FIDUCIALS])
+    source = np.hstack([FIDUCIALS, np.ones((len(FIDUCIALS), 1))])
+    matrix, *_ = np.linalg.lstsq(source, found, rcond=None)
+    error = np.abs(source @ matrix - found).max()
+    if error > 4 * scale:
+        raise SheetError("Лист искажён или метки закрыты")
+    return matrix
+
+
+def _disk(radius):
+    r = int(np.ceil(radius))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx ** 2 + dy ** 2 <= radius ** 2
+    return np.stack([dx[inside], dy[inside]], axis=1)
+
+
+def _sample(dark, matrix, points, radius):
+    # Средняя тёмность в круге вокруг каждой точки бланка; все точки
+    # сразу одним индексированием массива.
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    mapped = np.hstack([points, np.ones((len(points), 1))]) @ matrix
+    scale = np.sqrt(abs(np.linalg.det(matrix[:2])))
+    offsets = _disk(radius * scale)
+    coords = np.rint(mapped[:, None, :] + offsets[None, :, :]).astype(int)
+    xs = np.clip(coords[..., 0], 0, dark.shape[1] - 1)
+    ys = np.clip(coords[..., 1], 0, dark.shape[0] - 1)
+    return dark[ys, xs].mean(axis=1)
+
+
+def _pick(values):
+    marked = np.flatnonzero(values > FILLED)
+    if len(marked) == 0:
+        return None, False
+    if len(marked) == 1:
+        return int(marked[0]), False
+    order = np.argsort(values)[::-1]
+    if values[order[0]] - values[order[1]] >= CLEAR_MARGIN:
+        return int(order[0]), False
+    return None, True
+
+
+def read(data, pages):
+    # data — байты скана одной страницы, pages — layout() бланка этого ДЗ.
+    # Возвращает код листа, ответы по номерам вопросов и замечания.
+    dark = _load(data)
+    matrix = _fit(dark)
+    code = decode(_sample(dark, matrix, _code_centers(), CODE_CELL * 0.3) > 0.5)
+    if not 1 <= code["page"] <= len(pages):
+        raise SheetError("Неизвестная страница бланка")
+
+    blocks = pages[code["page"] - 1]
+    if not blocks:
+        return {**code, "answers": {}, "issues": []}
+    centers = [point for block in blocks for row in block["centers"] for point in row]
+    # Внутренняя часть кружка: контур в выборку не входит.
+    values = _sample(dark, matrix, centers, BUBBLE_RADIUS * 0.6)
+
+    answers, issues = {}, []
+    offset = 0
+    for block in blocks:
+        width = len(block["symbols"])
+        chars = []
+        for _ in range(block["rows"]):
+            index, ambiguous = _pick(values[offset:offset + width])
+            offset += width
+            if ambiguous:
+                issues.append(f"Вопрос {block['number']}: несколько отметок в строке")
+            elif index is not None:
+                chars.append(block["symbols"][index])
+        answers[block["number"]] = "".join(chars)
+    return {**code, "answers": answers, "issues": issues}
+
+
+def read_page(data, pages):
+    # Точка входа для процессов-обработчиков: ошибка листа — результат,
+    # а не исключение, чтобы не прерывать пачку.
+    if data is None:
+        return {"error": "Не изображение"}
+    try:
+        return read(data, pages)
+    except (SheetError, OSError) as exc:
+        return {"error": str(exc)}
+    except Exception:
+        # Непредвиденный сбой на одном листе (битый файл, которого не
+        # ожидал декодер) не должен ронять пачку и пул процессов.
+        logger.exception("Не удалось разобрать лист")
+        return {"error": "Не удалось разобрать лист"}
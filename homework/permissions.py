@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+
+from homework.models import Classroom, HomeworkTemplate, Profile, StudentSubmission
+
+
+def get_profile(user):
+    try:
+        return user.profile
+    except (AttributeError, ObjectDoesNotExist):
+        return None
+
+
+def homework_role(user, profile, hw):
+    # Учитель видит ДЗ своих классов, ученик — ДЗ своего класса.
+    if profile is None:
+        return None
+    if profile.role == "teacher" and hw.classroom.teacher_id == user.id:
+        return "teacher"
+    if profile.role == "student" and profile.classroom_id == hw.classroom_id:
+        return "student"
+    return None
+
+
+def visible_classrooms(user, profile):
+    if profile is None:
+        return Classroom.objects.none()
+    if profile.role == "teacher":
+        return Classroom.objects.filter(teacher_id=user.id)
+    if profile.role == "student":
+        return Classroom.objects.filter(pk=profile.classroom_id)
+    return Classroom.objects.none()
+
+
+def visible_homeworks(user, profile):
+    if profile is None:
+        return HomeworkTemplate.objects.none()
+    if profile.role == "teacher":
+        return HomeworkTemplate.objects.filter(classroom__teacher_id=user.id)
+    if profile.role == "student":
+        return HomeworkTemplate.objects.filter(classroom_id=profile.classroom_id)
+    return HomeworkTemplate.objects.none()
+
+
+def visible_submissions(user, profile):
+    # Ученик видит только свои работы, учитель — все работы по своим ДЗ.
+    if profile is None:
+        return StudentSubmission.objects.none()
+    if profile.role == "teacher":
+        return StudentSubmission.objects.filter(homework_template__classroom__teacher_id=user.id)
+    if profile.role == "student":
+        return StudentSubmission.objects.filter(student_id=user.id)
+    return StudentSubmission.objects.none()
+
+
+def attach_users(rows, field="student"):
+    # Пользователь и его профиль подгружаются двумя запросами по id, а не
+    # select_related: при разнесении школ по базам (homework.tenants)
+    # пользователи лежат в общей базе, а профили — в базе школы.
+    ids = {getattr(row, f"{field}_id") for row in rows} - {None}
+    if not ids:
+        return rows
+    users = User.objects.in_bulk(ids)
+    profiles = Profile.objects.in_bulk(ids, field_name="user_id")
+    for pk, user in users.items():
+        User.profile.related.set_cached_value(user, profiles.get(pk))
+    for row in rows:
+        row._meta.get_field(field).set_cached_value(row, users.get(getattr(row, f"{field}_id")))
+    return rows
+
+
+def profile_name(user):
+    profile = get_profile(user)
+    return (profile.last_name, profile.first_name) if profile is not None else ("", "")
@@ -0,0 +1,152 @@
+import contextvars
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, router, transaction
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+
+PREVIEW_FORMATS = (
+    ("webp", "WEBP", "webp"),
+    ("jpeg", "JPEG", "jpg"),
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.HOMEWORK_PREVIEW_WORKERS,
+    thread_name_prefix="homework-previews",
+)
+
+
+def schedule_previews(hw):
+    if not hw.homework_file:
+        return
+    hw_id = hw.pk
+    # Копия контекста переносит в поток текущую школу (homework.tenants).
+    context = contextvars.copy_context()
+    transaction.on_commit(
+        lambda: _executor.submit(context.run, _build_in_background, hw_id),
+        using=router.db_for_write(type(hw)),
+    )
+
+
+def _build_in_background(hw_id):
+    try:
+        build_previews(hw_id)
+    except Exception:
+        logger.exception("Не удалось построить превью для ДЗ %s", hw_id)
+    finally:
+        connections.close_all()
+
+
+def build_previews(hw_id):
+    from homework.models import HomeworkTemplate
+
+    hw = HomeworkTemplate.objects.filter(pk=hw_id).first()
+    if hw is None or not hw.homework_file:
+        return {}
+
+    # Имена превью (а значит, и их URL в кешах браузеров) зависят от
+    # содержимого файла: замена файла на месте под тем же именем даёт
+    # новые превью, а не старые картинки по тем же адресам.
+    with hw.homework_file.open("rb") as fh:
+        data = fh.read()
+    source = hashlib.sha256(data).hexdigest()[:12]
+    if (hw.file_previews or {}).get("source") == source:
+        return hw.file_previews
+
+    image = _open_source_image(hw.homework_file.name, data)
+    if image is None:
+        return {}
+
+    with image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        storage = hw.homework_file.storage
+        base = os.path.splitext(hw.homework_file.name)[0]
+        widths = sorted({min(w, image.width) for w in settings.HOMEWORK_PREVIEW_WIDTHS})
+
+        variants = {key: [] for key, _, _ in PREVIEW_FORMATS}
+        for width in widths:
+            if width == image.width:
+                resized = image
+            else:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+            for key, fmt, ext in PREVIEW_FORMATS:
+                buf = BytesIO()
+                resized.save(buf, fmt, quality=settings.HOMEWORK_PREVIEW_QUALITY)
+                name = f"{base}.{source}.{width}w.{ext}"
+                if storage.exists(name):
+                    storage.delete(name)
+                variants[key].append([width, storage.save(name, ContentFile(buf.getvalue()))])
+
+        previews = {
+            "source": source,
+            "width": image.width,
+            "height": image.height,
+            "variants": variants,
+        }
+
+    HomeworkTemplate.objects.filter(pk=hw_id).update(file_previews=previews)
+    _delete_stale_variants(storage, hw.file_previews, previews)
+    return previews
+
+
+def _delete_stale_variants(storage, old, new):
+    keep = {name for names in new["variants"].values() for _, name in names}
+    for names in (old or {}).get("variants", {}).values():
+        for _, name in names:
+            if name not in keep and storage.exists(name):
+                storage.delete(name)
+
+
+def _open_source_image(name, data):
+    ext = os.path.splitext(name)[1].lower()
+
+    if ext == ".pdf":
+        return _render_pdf_first_page(name, data)
+    if ext not in IMAGE_EXTENSIONS:
+        return None
+
+    image = Image.open(BytesIO(data))
+    image.load()
+    return image
+
+
+def _render_pdf_first_page(name, data):
+    # Pillow умеет только записывать PDF, поэтому первую страницу
+    # растеризуем через poppler, если он установлен на сервере.
+    pdftoppm = shutil.which("pdftoppm")
+    if pdftoppm is None:
+        logger.info("pdftoppm не найден, превью для %s не построено", name)
+        return None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "source.pdf")
+        with open(src, "wb") as out:
+            out.write(data)
+
+        out_prefix = os.path.join(tmp, "page")
+        subprocess.run(
+            [pdftoppm, "-f", "1", "-l", "1", "-r", "110", "-png", "-singlefile", src, out_prefix],
+            check=True,
+            capture_output=True,
+            timeout=60,
+        )
+        image = Image.open(out_prefix + ".png")
+        image.load()
+    return image
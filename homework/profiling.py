@@ -0,0 +1,231 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from homework import queries
+from homework.models import RequestProfile
+
+# Профилирование по запросу: сотрудник добавляет ?_profile=1 или заголовок
+# X-Profile, запрос выполняется под сэмплирующим профилировщиком и
+# tracemalloc, результат со списком SQL сохраняется в RequestProfile.
+# Одновременно профилируется один запрос: tracemalloc общий для процесса.
+
+QUERY_PARAM = "_profile"
+HEADER = "X-Profile"
+
+# Листовые кадры ждущих потоков: их стеки в профиль не попадают.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("socketserver.py", "serve_forever"),
+    ("thread.py", "_worker"),
+}
+STDLIB = os.path.dirname(os.__file__)
+
+_busy = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def _label(code):
+    path = code.co_filename
+    marker = f"site-packages{os.sep}"
+    if marker in path:
+        path = path.split(marker, 1)[1]
+    elif path.startswith(str(settings.BASE_DIR)):
+        path = os.path.relpath(path, settings.BASE_DIR)
+    elif path.startswith(STDLIB):
+        path = os.path.relpath(path, STDLIB)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    # Раз в interval снимает стеки потоков из threads — множества ident,
+    # которое пополняется по ходу запроса: поток middleware, поток
+    # sync_to_async для синхронного кода под ASGI и каждый поток, из
+    # которого запрос ходил в базу. Стеки других запросов процесса в
+    # профиль не попадают.
+
+    def __init__(self, interval, threads):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.threads = threads
+        self.stacks = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._done.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in IDLE_FRAMES:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def requested(request):
+    if QUERY_PARAM not in request.GET and HEADER not in request.headers:
+        return False
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def _allocations(snapshot):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return [
+        {
+            "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:settings.PROFILING_TOP_ALLOCATIONS]
+    ]
+
+
+class Run:
+    # Один профилируемый запрос. tracemalloc общий для процесса: пик
+    # и места выделения памяти включают то, что одновременно выделяли
+    # другие запросы этого процесса; стеки и SQL — только этого запроса.
+
+    def __init__(self):
+        self.threads = {threading.get_ident()}
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.sampler = Sampler(settings.PROFILING_INTERVAL, self.threads)
+
+    def record_query(self, alias, sql, seconds):
+        self.threads.add(threading.get_ident())
+        self.query_count += 1
+        self.query_seconds += seconds
+        if len(self.queries) < settings.PROFILING_MAX_QUERIES:
+            self.queries.append({"db": alias, "ms": round(seconds * 1000, 2), "sql": sql})
+
+    def start(self):
+        self.tracing = tracemalloc.is_tracing()
+        if not self.tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self):
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+        self.peak = tracemalloc.get_traced_memory()[1] - self.baseline
+        self.allocations = _allocations(tracemalloc.take_snapshot())
+        if not self.tracing:
+            tracemalloc.stop()
+
+    def save(self, request, response):
+        match = getattr(request, "resolver_match", None)
+        saved = RequestProfile.objects.create(
+            user=request.user,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view_name=match.view_name if match else "",
+            status=response.status_code,
+            duration_ms=round(self.duration * 1000, 1),
+            query_count=self.query_count,
+            query_ms=round(self.query_seconds * 1000, 1),
+            memory_peak_kb=round(max(self.peak, 0) / 1024, 1),
+            samples=self.sampler.samples,
+            stacks=self.sampler.folded(),
+            queries=self.queries,
+            allocations=self.allocations,
+        )
+        stale = RequestProfile.objects.order_by("-created_at").values_list("pk", flat=True)[settings.PROFILING_KEEP:]
+        RequestProfile.objects.filter(pk__in=list(stale)).delete()
+        response["X-Profile-Id"] = str(saved.pk)
+        return response
+
+
+def profile(request, get_response):
+    run = Run()
+    run.start()
+    try:
+        with queries.observe(run.record_query):
+            response = get_response(request)
+    finally:
+        run.stop()
+    return run.save(request, response)
+
+
+async def aprofile(request, get_response):
+    run = Run()
+    # Поток, в котором под ASGI выполняется синхронный код этого запроса
+    # (ThreadSensitiveContext запроса).
+    run.threads.add(await sync_to_async(threading.get_ident)())
+    run.start()
+    try:
+        with queries.observe(run.record_query):
+            response = await get_response(request)
+    finally:
+        run.stop()
+    return await sync_to_async(run.save)(request, response)
+
+
+@sync_and_async_middleware
+class ProfilingMiddleware:
+    # Ставится после AuthenticationMiddleware. Выключенное
+    # (PROFILING_ENABLED = False) не участвует в обработке запросов вовсе.
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        queries.install_open()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not requested(request) or not _busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return profile(request, self.get_response)
+        finally:
+            _busy.release()
+
+    async def __acall__(self, request):
+        # request.user ленивый и при первом обращении читает базу.
+        if not await sync_to_async(requested)(request) or not _busy.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            return await aprofile(request, self.get_response)
+        finally:
+            _busy.release()
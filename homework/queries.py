@@ -0,0 +1,48 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+
+# Учёт SQL-запросов текущего запроса по всем базам (школы, реплики) и во
+# всех потоках: соединения в Django свои у каждого потока, а асинхронные
+# представления ходят в базу из потоков sync_to_async. Поэтому обёртка
+# ставится один раз на каждое соединение (сигнал connection_created),
+# а получатели хранятся в contextvar, который sync_to_async переносит
+# в свой поток.
+
+_observers = contextvars.ContextVar("query_observers", default=())
+
+
+@contextmanager
+def observe(callback):
+    # callback(alias, sql, seconds) — после каждого запроса внутри блока.
+    token = _observers.set((*_observers.get(), callback))
+    try:
+        yield
+    finally:
+        _observers.reset(token)
+
+
+def _execute(execute, sql, params, many, context):
+    observers = _observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for callback in observers:
+            callback(context["connection"].alias, sql, elapsed)
+
+
+def install(connection):
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+def install_open():
+    # Соединения, открытые в этом потоке до подключения сигнала.
+    for connection in connections.all(initialized_only=True):
+        install(connection)
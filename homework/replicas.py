@@ -0,0 +1,155 @@
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, router
+from django.utils.decorators import sync_and_async_middleware
+
+# Чтение с реплики (READ_REPLICAS: основная база -> алиас копии) только
+# там, где его явно включили: графики, списки, аналитика. Пользователь,
+# который что-то записал, ещё READ_REPLICA_STICKY_SECONDS читает с основной
+# базы, чтобы сразу видеть свою сдачу. ReplicaRouter должен стоять первым
+# в DATABASE_ROUTERS: основную базу он берёт у следующих роутеров.
+
+_reads = contextvars.ContextVar("replica_reads", default=False)
+# Состояние запроса — изменяемый словарь, а не значения в contextvar:
+# запись в потоке sync_to_async должна быть видна и самому запросу.
+_request = contextvars.ContextVar("replica_request", default=None)
+
+
+@contextmanager
+def reads():
+    token = _reads.set(True)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def replica_reads(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            with reads():
+                return await view(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def active():
+    if not settings.READ_REPLICAS or not _reads.get():
+        return False
+    state = _request.get()
+    return not (state and (state["wrote"] or state["sticky"]))
+
+
+def mark_written():
+    state = _request.get()
+    if state is not None:
+        state["wrote"] = True
+
+
+def cache_timeout(timeout):
+    # Данные с реплики могут отставать: кешировать их надолго под свежим
+    # токеном ДЗ нельзя.
+    if active():
+        return min(timeout, settings.READ_REPLICA_CACHE_TIMEOUT)
+    return timeout
+
+
+def _primary_alias(alias):
+    for primary, replica in settings.READ_REPLICAS.items():
+        if alias == replica:
+            return primary
+    return alias
+
+
+class ReplicaRouter:
+    def _primary(self, model, hints):
+        for other in router.routers:
+            if other is self or not hasattr(other, "db_for_write"):
+                continue
+            db = other.db_for_write(model, **hints)
+            if db:
+                return db
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return _primary_alias(instance._state.db)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not active():
+            return None
+        return settings.READ_REPLICAS.get(self._primary(model, hints))
+
+    def db_for_write(self, model, **hints):
+        mark_written()
+        return self._primary(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if _primary_alias(obj1._state.db) == _primary_alias(obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика — копия основной базы, миграции к ней не применяются.
+        if db in settings.READ_REPLICAS.values():
+            return False
+        return None
+
+
+def _sticky_key(user_id):
+    return f"replica:sticky:{user_id}"
+
+
+@sync_and_async_middleware
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        if not settings.READ_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        user_id = request.session.get(SESSION_KEY)
+        return user_id, {"wrote": False, "sticky": bool(user_id and cache.get(_sticky_key(user_id)))}
+
+    def finish(self, request, user_id, state):
+        user_id = request.session.get(SESSION_KEY) or user_id
+        if state["wrote"] and user_id:
+            cache.set(_sticky_key(user_id), True, settings.READ_REPLICA_STICKY_SECONDS)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        user_id, state = self.start(request)
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        self.finish(request, user_id, state)
+        return response
+
+    async def __acall__(self, request):
+        # Сессия читается из базы, а кеш может быть сетевым — в потоке.
+        user_id, state = await sync_to_async(self.start)(request)
+        token = _request.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request.reset(token)
+        await sync_to_async(self.finish)(request, user_id, state)
+        return response
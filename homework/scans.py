@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import repeat
+
+from PIL import Image, ImageSequence, UnidentifiedImageError
+from django.conf import settings
+
+from homework import audit, omr, tenants
+from homework.caching import bump_homework_data
+from homework.grading import calc_auto_score
+from homework.ingest import upsert
+from homework.models import Profile, StudentSubmission
+
+# Проверка бумажных бланков (homework.omr): печать бланков на класс
+# и разбор пачки сканов в сдачи. Страницы читаются параллельно
+# в отдельных процессах, сдачи записываются одним upsert'ом (homework.ingest).
+
+INSTRUCTION = "Закрашивайте кружок целиком. Число — по одному знаку в строке, сверху вниз."
+
+
+def _students(hw):
+    return list(
+        Profile.objects
+        .filter(role="student", classroom_id=hw.classroom_id)
+        .order_by("last_name", "first_name", "user_id")
+    )
+
+
+def _sheets(hw, students):
+    pages = omr.layout(hw.questions)
+    for profile in students:
+        name = " ".join(x for x in (profile.last_name, profile.first_name) if x) or f"id {profile.user_id}"
+        for number, page in enumerate(pages, start=1):
+            header = [
+                hw.title,
+                f"{name} · {hw.classroom.name}",
+                f"Страница {number} из {len(pages)} · ДЗ {hw.pk}",
+                INSTRUCTION,
+            ]
+            # Одноцветные страницы: в PDF на класс их десятки.
+            yield omr.render(page, omr.encode(hw.pk, profile.user_id, number), header).convert("1")
+
+
+def sheets_pdf(hw, students=None):
+    students = _students(hw) if students is None else students
+    if not students:
+        return None
+    sheets = _sheets(hw, students)
+    buf = BytesIO()
+    next(sheets).save(buf, "PDF", save_all=True, append_images=sheets, resolution=omr.DPI)
+    return buf.getvalue()
+
+
+class ScanError(ValueError):
+    # Загрузку нельзя разобрать целиком: повреждённый архив и т. п.
+    pass
+
+
+class ScanLimitError(ScanError):
+    pass
+
+
+def iter_pages(name, data, budget=None, depth=0):
+    # Страницы загруженного файла: изображение (многостраничный TIFF
+    # разбирается по кадрам) или ZIP с изображениями. Вложенность ZIP,
+    # размер распакованных файлов и число страниц ограничены
+    # (SCAN_MAX_* в настройках): архив-бомба не должна занять всю память.
+    # budget — общий счётчик на всю загрузку (страницы и распакованные байты).
+    if budget is None:
+        budget = {"pages": 0, "bytes": 0}
+    if zipfile.is_zipfile(BytesIO(data)):
+        if depth >= settings.SCAN_MAX_ZIP_DEPTH:
+            raise ScanLimitError(f"{name}: слишком глубоко вложенный архив")
+        try:
+            archive = zipfile.ZipFile(BytesIO(data))
+        except (zipfile.BadZipFile, zlib.error, EOFError) as exc:
+            raise ScanError(f"{name}: архив повреждён ({exc})")
+        with archive:
+            for member in sorted(archive.infolist(), key=lambda info: info.filename):
+                if member.is_dir():
+                    continue
+                member_name = f"{name}/{member.filename}"
+                if member.file_size > settings.SCAN_MAX_FILE_SIZE:
+                    raise ScanLimitError(f"{member_name}: файл больше {settings.SCAN_MAX_FILE_SIZE} байт")
+                budget["bytes"] += member.file_size
+                if budget["bytes"] > settings.SCAN_MAX_TOTAL_SIZE:
+                    raise ScanLimitError(f"{name}: распакованные файлы больше {settings.SCAN_MAX_TOTAL_SIZE} байт")
+                # Битый, обрезанный или зашифрованный файл в архиве — ошибка
+                # этой страницы, как у нечитаемого изображения.
+                try:
+                    member_data = archive.read(member)
+                except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError):
+                    yield member_name, None
+                    continue
+                yield from iter_pages(member_name, member_data, budget, depth + 1)
+        return
+    try:
+        with Image.open(BytesIO(data)) as image:
+            frames = getattr(image, "n_frames", 1)
+            budget["pages"] += frames
+            if budget["pages"] > settings.SCAN_MAX_PAGES:
+                raise ScanLimitError(f"Больше {settings.SCAN_MAX_PAGES} страниц за раз")
+            if frames == 1:
+                yield name, data
+                return
+            for number, frame in enumerate(ImageSequence.Iterator(image), start=1):
+                buf = BytesIO()
+                frame.convert("L").save(buf, "PNG")
+                yield f"{name}#{number}", buf.getvalue()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        yield name, None
+
+
+def _pool():
+    # Не fork: в процессе сервера есть потоки (ingest, превью, аудит).
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=settings.OMR_WORKERS or os.cpu_count(), mp_context=context)
+
+
+def read_pages(hw, named_pages):
+    names, datas = zip(*named_pages) if named_pages else ((), ())
+    pages = omr.layout(hw.questions)
+    if len(datas) < settings.OMR_PARALLEL_MIN_PAGES:
+        return list(zip(names, map(omr.read_page, datas, repeat(pages))))
+    with _pool() as pool:
+        return list(zip(names, pool.map(omr.read_page, datas, repeat(pages), chunksize=4)))
+
+
+def grade(hw, named_pages, actor=None):
+    students = {p.user_id: p for p in _students(hw)}
+    expected = len(omr.layout(hw.questions))
+    report = {"pages": len(named_pages), "saved": [], "skipped": [], "errors": [], "issues": []}
+
+    answers, seen = {}, {}
+    for name, result in read_pages(hw, named_pages):
+        if "error" in result:
+            report["errors"].append((name, result["error"]))
+        elif result["hw"] != hw.pk:
+            report["errors"].append((name, f"Бланк другого задания (ДЗ {result['hw']})"))
+        elif result["student"] not in students:
+            report["errors"].append((name, f"Ученик id {result['student']} не из этого класса"))
+        else:
+            student_id = result["student"]
+            pages = seen.setdefault(student_id, set())
+            if result["page"] in pages:
+                report["issues"].append((name, f"Страница {result['page']} отсканирована повторно"))
+            pages.add(result["page"])
+            answers.setdefault(student_id, {}).update(result["answers"])
+            report["issues"].extend((name, issue) for issue in result["issues"])
+
+    for student_id, pages in seen.items():
+        if len(pages) < expected:
+            report["issues"].append((
+                str(students[student_id]),
+                f"Нет страниц: {', '.join(str(n) for n in range(1, expected + 1) if n not in pages)}",
+            ))
+
+    if not answers:
+        return report
+    with tenants.atomic():
+        # Проверка «уже проверено учителем» и запись — в одной транзакции
+        # под блокировкой строк; условие в upsert() держит то же правило
+        # и там, где SELECT ... FOR UPDATE не поддерживается (SQLite).
+        existing = {
+            s.student_id: s
+            for s in StudentSubmission.objects.select_for_update()
+            .filter(homework_template=hw, student_id__in=answers)
+            .only("student_id", "final_score", "graded")
+        }
+        submissions = []
+        for student_id, values in answers.items():
+            old = existing.get(student_id)
+            # Работу, уже проверенную учителем, скан не перезаписывает.
+            if old is not None and old.graded:
+                report["skipped"].append(students[student_id])
+                continue
+            auto_score = calc_auto_score(hw, values)
+            submission = StudentSubmission(
+                student_id=student_id,
+                homework_template=hw,
+                auto_score=auto_score,
+                final_score=auto_score,
+                graded=False,
+                is_missing=False,
+            )
+            submission.set_answers(hw, values)
+            submissions.append((submission, old.final_score if old is not None else None))
+            report["saved"].append((students[student_id], auto_score))
+
+        upsert([s for s, _ in submissions], keep_graded=True)
+        for submission, old_score in submissions:
+            audit.record("scan", hw, submission.student_id, submission.final_score, submission.auto_score,
+                         old_score=old_score, actor=actor)
+    if submissions:
+        bump_homework_data([hw.pk])
+        audit.flush()
+    return report
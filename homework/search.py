@@ -0,0 +1,60 @@
+import math
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from homework.models import Profile, search_key
+
+# Поиск учеников для форм записи в класс. Каждое слово запроса — префикс
+# фамилии, имени или логина. Префикс ищется диапазоном [p, p + U+10FFFF)
+# по нормализованным столбцам профиля: так индекс используется в любой
+# базе, в отличие от LIKE 'p%', который в SQLite индекс по обычному
+# столбцу не задействует.
+
+PREFIX_END = "\U0010ffff"
+MAX_TERMS = 3
+
+
+def _prefix(field, term):
+    return Q(**{f"{field}__gte": term, f"{field}__lt": term + PREFIX_END})
+
+
+def free_students():
+    return Profile.objects.filter(role="student", classroom__isnull=True)
+
+
+def students(query, page=1):
+    qs = free_students()
+    for term in search_key(query).split()[:MAX_TERMS]:
+        condition = Q()
+        for field in Profile.SEARCH_FIELDS:
+            condition |= _prefix(field, term)
+        qs = qs.filter(condition)
+
+    size = settings.STUDENT_SEARCH_PAGE_SIZE
+    if page > 1:
+        # Номер страницы приходит от клиента: без ограничения огромный
+        # OFFSET не помещается в целое базы.
+        page = min(page, max(math.ceil(qs.count() / size), 1))
+    offset = (page - 1) * size
+    ids = list(
+        qs.order_by("search_last_name", "search_first_name", "user_id")
+        .values_list("user_id", flat=True)[offset:offset + size + 1]
+    )
+    return describe(ids[:size]), page + 1 if len(ids) > size else None
+
+
+def describe(user_ids):
+    # Профили и пользователи могут лежать в разных базах (homework.tenants),
+    # поэтому два запроса по id вместо JOIN.
+    profiles = Profile.objects.filter(user_id__in=user_ids).in_bulk(field_name="user_id")
+    usernames = dict(User.objects.filter(pk__in=user_ids).values_list("pk", "username"))
+    rows = []
+    for pk in user_ids:
+        if pk not in profiles or pk not in usernames:
+            continue
+        p = profiles[pk]
+        name = " ".join(x for x in (p.last_name.strip(), p.first_name.strip(), p.patronymic.strip()) if x)
+        rows.append({"id": pk, "name": name, "username": usernames[pk]})
+    return rows
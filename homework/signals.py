@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from homework import audit, queries, tenants
+from homework.auth import forget_cached_users
+from homework.caching import bump_homework_data
+from homework.models import Classroom, HomeworkTemplate, Profile, StudentSubmission, UserTenant, search_key
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user(sender, instance, **kwargs):
+    forget_cached_users([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def sync_profile_username(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    key = search_key(instance.username)
+    with tenants.use_tenant(tenants.for_user(instance.pk)):
+        Profile.objects.filter(user_id=instance.pk).exclude(search_username=key).update(search_username=key)
+
+
+@receiver(pre_delete, sender=User)
+def delete_tenant_user_data(sender, instance, **kwargs):
+    if settings.TENANTS:
+        tenants.delete_user_data(instance)
+
+
+@receiver([post_save, post_delete], sender=UserTenant)
+def forget_user_tenant(sender, instance, **kwargs):
+    # Сначала — в старой школе (она ещё в кеше), затем в новой.
+    forget_cached_users([instance.user_id])
+    tenants.forget_user(instance.user_id)
+    forget_cached_users([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def forget_profile_user(sender, instance, **kwargs):
+    forget_cached_users([instance.user_id], using=instance._state.db)
+
+
+@receiver(post_save, sender=Classroom)
+def forget_classroom_students(sender, instance, **kwargs):
+    user_ids = Profile.objects.using(instance._state.db).filter(classroom_id=instance.pk).values_list("user_id", flat=True)
+    forget_cached_users(user_ids, using=instance._state.db)
+
+
+@receiver(pre_delete, sender=Classroom)
+def forget_deleted_classroom_students(sender, instance, **kwargs):
+    # После удаления у профилей уже classroom = NULL, поэтому учеников
+    # нужно найти до него, а сбросить кеш — когда удаление зафиксировано.
+    using = instance._state.db
+    user_ids = list(Profile.objects.using(using).filter(classroom_id=instance.pk).values_list("user_id", flat=True))
+    if user_ids:
+        tenants.on_commit(lambda: forget_cached_users(user_ids, using=using))
+
+
+@receiver([post_save, post_delete], sender=StudentSubmission)
+def bump_submission_homework(sender, instance, **kwargs):
+    bump_homework_data([instance.homework_template_id])
+
+
+@receiver(post_save, sender=HomeworkTemplate)
+def bump_homework(sender, instance, created, **kwargs):
+    if not created:
+        bump_homework_data([instance.pk])
+
+
+@receiver(request_finished)
+def flush_grading_events(sender, **kwargs):
+    audit.flush_if_due()
+
+
+@receiver(connection_created)
+def observe_queries(sender, connection, **kwargs):
+    queries.install(connection)
@@ -0,0 +1,109 @@
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from homework import metrics, replicas
+from homework.caching import homework_data_token
+from homework.item_analysis import answer_columns, answer_matrix
+from homework.models import StudentSubmission
+
+BLOCK_BYTES = 16 * 1024 * 1024
+
+
+def _pairwise_popcount(packed, op):
+    # Попарный popcount(op(a, b)) для всех строк упакованной битовой матрицы.
+    # Считается блоками строк, чтобы промежуточный массив n × n × байты
+    # не разрастался на больших параллелях.
+    n, width = packed.shape
+    out = np.empty((n, n), dtype=np.int32)
+    step = max(1, BLOCK_BYTES // max(1, n * width))
+    for start in range(0, n, step):
+        block = op(packed[start:start + step, None, :], packed[None, :, :])
+        out[start:start + step] = np.bitwise_count(block).sum(axis=2, dtype=np.int32)
+    return out
+
+
+def analyze(hw, student_ids, rows):
+    answers = answer_matrix(hw, rows)
+    n_students, n_questions = answers.shape
+    if n_students < 2:
+        return {"students": n_students, "pairs": []}
+
+    # Каждый вариант ответа на вопрос — отдельный бит (токен): у ученика
+    # взведены биты его ответов. Правильность ответов — отдельная матрица.
+    correct = np.zeros((n_students, n_questions), dtype=bool)
+    columns, blank, wrong, counts, labels = [], [], [], [], []
+    offset = 0
+    for j, (values, inverse, value_counts, ok) in enumerate(answer_columns(hw, answers)):
+        correct[:, j] = ok[inverse]
+        columns.append(inverse + offset)
+        offset += len(values)
+        blank.append(values == "")
+        wrong.append(~ok)
+        counts.append(value_counts)
+        labels += [(hw.questions[j]["number"], str(v)) for v in values]
+
+    tokens = np.zeros((n_students, offset), dtype=bool)
+    for codes in columns:
+        tokens[np.arange(n_students), codes] = True
+    blank = np.concatenate(blank)
+    wrong = np.concatenate(wrong) & ~blank
+    counts = np.concatenate(counts)
+
+    answered = np.packbits(tokens[:, ~blank], axis=1)
+    shared = _pairwise_popcount(answered, np.bitwise_and)
+    sizes = np.diag(shared)
+    union = sizes[:, None] + sizes[None, :] - shared
+    with np.errstate(invalid="ignore", divide="ignore"):
+        jaccard = np.where(union > 0, shared / union, 0.0)
+
+    hamming = _pairwise_popcount(np.packbits(correct, axis=1), np.bitwise_xor)
+
+    wrong_tokens = tokens[:, wrong]
+    shared_wrong = _pairwise_popcount(np.packbits(wrong_tokens, axis=1), np.bitwise_and)
+
+    # Совпадение редкой ошибки весит больше, чем совпадение распространённой:
+    # вес токена — собственная информация -log(доля учеников с таким ответом).
+    weights = -np.log(counts[wrong] / n_students).astype(np.float32)
+    weighted = wrong_tokens.astype(np.float32)
+    score = (weighted * weights) @ weighted.T
+
+    upper = np.triu(np.ones((n_students, n_students), dtype=bool), k=1)
+    flagged = (
+        upper
+        & (shared_wrong >= settings.SIMILARITY_MIN_SHARED_WRONG)
+        & (score >= settings.SIMILARITY_MIN_SCORE)
+    )
+    first, second = np.nonzero(flagged)
+    order = np.argsort(-score[first, second], kind="stable")[:settings.SIMILARITY_MAX_PAIRS]
+
+    wrong_labels = [label for label, is_wrong in zip(labels, wrong) if is_wrong]
+    pairs = []
+    for i, j in zip(first[order], second[order]):
+        common = np.nonzero(wrong_tokens[i] & wrong_tokens[j])[0]
+        pairs.append({
+            "first": student_ids[i],
+            "second": student_ids[j],
+            "score": round(float(score[i, j]), 1),
+            "shared_wrong": int(shared_wrong[i, j]),
+            "jaccard": round(float(jaccard[i, j]) * 100),
+            "hamming": int(hamming[i, j]),
+            "answers": [wrong_labels[k] for k in common],
+        })
+
+    return {"students": n_students, "pairs": pairs}
+
+
+def similarity_report(hw):
+    key = f"similarity:{hw.pk}:{hw.questions_version}:{homework_data_token(hw.pk)}"
+    report = cache.get(key)
+    metrics.cache_lookup("similarity", report is not None)
+    if report is None:
+        rows = list(
+            StudentSubmission.objects
+            .filter(homework_template=hw, is_missing=False, layout_version=hw.questions_version)
+            .values_list("student_id", "answers")
+        )
+        report = analyze(hw, [r[0] for r in rows], [r[1] for r in rows])
+        cache.set(key, report, replicas.cache_timeout(settings.ITEM_ANALYSIS_CACHE_TIMEOUT))
+    return report
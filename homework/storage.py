@@ -0,0 +1,40 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".map", ".txt", ".html", ".xml", ".ico"}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Кроме хешированных имён из манифеста, рядом с каждым текстовым файлом
+    # кладутся .gz и .br версии, чтобы middleware отдавала их без сжатия на лету.
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not dry_run and isinstance(hashed_name, str):
+                for target in {name, hashed_name}:
+                    self._compress(target)
+            yield name, hashed_name, processed
+
+    def _compress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+
+        path = self.path(name)
+        with open(path, "rb") as fh:
+            data = fh.read()
+
+        variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(data, quality=11)))
+
+        for suffix, compressed in variants:
+            if len(compressed) < len(data):
+                with open(path + suffix, "wb") as out:
+                    out.write(compressed)
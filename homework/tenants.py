@@ -0,0 +1,182 @@
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX as SESSION_CACHE_PREFIX
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import models, transaction
+from django.http import HttpResponseForbidden, HttpResponseRedirect
+from django.http.request import split_domain_port
+from django.utils.decorators import sync_and_async_middleware
+
+# Несколько школ на одной установке: данные каждой школы (классы, профили,
+# ДЗ, сдачи и всё производное) лежат в своей базе — алиас в DATABASES
+# совпадает с именем школы в TENANTS. Пользователи, сессии и права остаются
+# в общей базе default. Текущая школа хранится в contextvar и выбирается
+# middleware по хосту или по пользователю; без TENANTS всё работает
+# с одной базой default, как раньше.
+
+CENTRAL_APPS = {"admin", "auth", "contenttypes", "sessions"}
+CENTRAL_MODELS = {"usertenant", "requestprofile"}
+USER_KEY_PREFIX = "tenant:user:"
+
+_current = contextvars.ContextVar("tenant", default=None)
+
+
+def current():
+    return _current.get()
+
+
+def current_db():
+    return _current.get() or "default"
+
+
+@contextmanager
+def use_tenant(name):
+    if name is not None and name not in settings.TENANTS:
+        raise ValueError(f"Неизвестная школа: {name}")
+    token = _current.set(name)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def atomic():
+    return transaction.atomic(using=current_db())
+
+
+def on_commit(func):
+    transaction.on_commit(func, using=current_db())
+
+
+def for_host(host):
+    domain, _ = split_domain_port(host)
+    for name, options in settings.TENANTS.items():
+        if domain in options.get("hosts", ()):
+            return name
+    return None
+
+
+def _user_key(user_id):
+    return f"{USER_KEY_PREFIX}{user_id}"
+
+
+def for_user(user_id):
+    from homework.models import UserTenant
+
+    if user_id is None:
+        return None
+    key = _user_key(user_id)
+    tenant = cache.get(key)
+    if tenant is None:
+        tenant = UserTenant.objects.filter(user_id=user_id).values_list("tenant", flat=True).first() or ""
+        cache.set(key, tenant, settings.AUTH_USER_CACHE_TIMEOUT)
+    return tenant or None
+
+
+def forget_user(user_id):
+    cache.delete(_user_key(user_id))
+
+
+def is_central(model):
+    opts = model._meta
+    return opts.app_label in CENTRAL_APPS or opts.model_name in CENTRAL_MODELS
+
+
+class TenantRouter:
+    def db_for_read(self, model, **hints):
+        return "default" if is_central(model) else current_db()
+
+    def db_for_write(self, model, **hints):
+        return "default" if is_central(model) else current_db()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Внешние ключи на пользователя из базы школы — без ограничения
+        # в самой базе (db_constraint=False), поэтому связь допустима.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # В default есть и (пустые) таблицы школ: каскадное удаление
+        # пользователя проходит по ним без ошибок, а строки в базе его
+        # школы удаляет delete_user_data.
+        if db == "default":
+            return True
+        if db in settings.TENANTS:
+            return not (app_label in CENTRAL_APPS or model_name in CENTRAL_MODELS)
+        return None
+
+
+@sync_and_async_middleware
+class TenantMiddleware:
+    # Ставится после SessionMiddleware и до AuthenticationMiddleware:
+    # пользователь с профилем грузится уже из базы его школы. Если хост
+    # принадлежит одной школе, а вошедший пользователь — другой, данные
+    # чужой школы ему не показываются: GET уводит на хост его школы,
+    # остальные запросы отклоняются.
+
+    def __init__(self, get_response):
+        if not settings.TENANTS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def resolve(self, request):
+        host_tenant = for_host(request.get_host())
+        user_tenant = for_user(request.session.get(SESSION_KEY))
+        if host_tenant and user_tenant and host_tenant != user_tenant:
+            return None, self.mismatch(request, user_tenant)
+        return host_tenant or user_tenant, None
+
+    def mismatch(self, request, tenant):
+        hosts = settings.TENANTS[tenant].get("hosts", ())
+        if request.method in ("GET", "HEAD") and hosts:
+            _, port = split_domain_port(request.get_host())
+            host = f"{hosts[0]}:{port}" if port else hosts[0]
+            return HttpResponseRedirect(f"{request.scheme}://{host}{request.get_full_path()}")
+        return HttpResponseForbidden("Вы вошли в другую школу")
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        tenant, response = self.resolve(request)
+        if response is not None:
+            return response
+        request.tenant = tenant
+        with use_tenant(tenant):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Сессия и школа пользователя читаются из базы — в потоке.
+        tenant, response = await sync_to_async(self.resolve)(request)
+        if response is not None:
+            return response
+        request.tenant = tenant
+        with use_tenant(tenant):
+            return await self.get_response(request)
+
+
+def delete_user_data(user):
+    # Каскад по внешним ключам на пользователя в базе его школы: сам
+    # Collector удаляет связанные строки только в той базе, где пользователь.
+    tenant = for_user(user.pk)
+    if tenant is None:
+        return
+    with use_tenant(tenant), atomic():
+        for rel in type(user)._meta.related_objects:
+            if rel.on_delete is models.CASCADE and not is_central(rel.related_model):
+                rel.related_model._base_manager.filter(**{rel.field.name: user.pk}).delete()
+
+
+def make_cache_key(key, key_prefix, version):
+    # id в разных школах совпадают, поэтому ключи кеша разводятся по школе.
+    # Сессии и школа пользователя общие и от текущей школы не зависят.
+    tenant = _current.get()
+    if tenant and not key.startswith((SESSION_CACHE_PREFIX, USER_KEY_PREFIX)):
+        key = f"{tenant}:{key}"
+    return f"{key_prefix}:{version}:{key}"
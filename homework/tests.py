@@ -1,3 +1,1328 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from PIL import Image, ImageDraw
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.contrib.auth import SESSION_KEY
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from homework import (
+    analytics, answer_sheet, archive, audit, deadlines, ingest, metrics, notifications, omr, previews, profiling,
+    queries, replicas, scans, search, tenants,
+)
+from homework.auth import ProfileModelBackend
+from homework.forms import AnswerFormSet
+from homework.grading import grade_for, grade_for_score, grades_for
+from homework.item_analysis import item_analysis
+from homework.similarity import similarity_report
+from homework.middleware import StaticFilesMiddleware
+from homework.models import (
+    Classroom, GradeScale, GradingEvent, HomeworkTemplate, Notification, NotificationOutbox, PerformanceSnapshot,
+    Profile, RequestProfile, StudentSubmission, UserTenant,
+)
+
+
+def make_user(username, role, classroom=None, **fields):
+    user = User.objects.create_user(username=username, **fields)
+    Profile.objects.create(user=user, role=role, classroom=classroom, last_name=username, first_name="Тест")
+    return user
+
+
+def make_homework(classroom, answers, formats=None, **fields):
+    questions = [
+        {"number": i, "answer_format": (formats or {}).get(i, "text")}
+        for i in range(1, len(answers) + 1)
+    ]
+    today = timezone.localdate()
+    fields.setdefault("assigned_date", today)
+    fields.setdefault("deadline", today + timedelta(days=7))
+    return HomeworkTemplate.objects.create(
+        title=fields.pop("title", "ДЗ"),
+        description="",
+        classroom=classroom,
+        questions=questions,
+        correct_answers={str(i): a for i, a in enumerate(answers, start=1)},
+        max_score=len(answers),
+        grade_scale=GradeScale.objects.first() or GradeScale.objects.create(),
+        **fields,
+    )
+
+
+def submit(student, hw, answers, **fields):
+    submission = StudentSubmission(student=student, homework_template=hw, **fields)
+    submission.set_answers(hw, {str(i): a for i, a in enumerate(answers, start=1)})
+    submission.save()
+    return submission
+
+
+class HomeworkTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = make_user("teacher", "teacher")
+        self.classroom = Classroom.objects.create(name="5А", teacher=self.teacher)
+        self.students = [make_user(f"student{i}", "student", self.classroom) for i in range(1, 4)]
+        self.hw = make_homework(self.classroom, ["4", "Париж", "python"])
+
+
+class PreviewTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media, HOMEWORK_PREVIEW_WIDTHS=(100, 400)))
+
+    def test_builds_variants_no_wider_than_source(self):
+        buf = BytesIO()
+        Image.new("RGB", (200, 100), "white").save(buf, "PNG")
+        self.hw.homework_file.save("task.png", ContentFile(buf.getvalue()))
+
+        result = previews.build_previews(self.hw.pk)
+
+        self.hw.refresh_from_db()
+        self.assertEqual(self.hw.file_previews, result)
+        self.assertEqual([w for w, _ in result["variants"]["webp"]], [100, 200])
+        self.assertIn("100w", self.hw.preview_srcset_jpeg)
+
+    def test_file_replaced_in_place_gets_new_preview_names(self):
+        storage = self.hw.homework_file.storage
+        for color in ("white", "black"):
+            buf = BytesIO()
+            Image.new("RGB", (200, 100), color).save(buf, "PNG")
+            if storage.exists("homeworks/task.png"):
+                storage.delete("homeworks/task.png")
+            self.hw.homework_file.save("task.png", ContentFile(buf.getvalue()))
+            self.assertEqual(self.hw.homework_file.name, "homeworks/task.png")
+            if color == "white":
+                old = previews.build_previews(self.hw.pk)
+                self.hw.refresh_from_db()
+
+        new = previews.build_previews(self.hw.pk)
+
+        old_names = [name for _, name in old["variants"]["jpeg"]]
+        self.assertNotEqual(old_names, [name for _, name in new["variants"]["jpeg"]])
+        self.assertFalse(any(storage.exists(name) for name in old_names))
+        self.assertEqual(previews.build_previews(self.hw.pk), new)
+
+    def test_skips_unsupported_files(self):
+        self.hw.homework_file.save("task.docx", ContentFile(b"not an image"))
+        self.assertEqual(previews.build_previews(self.hw.pk), {})
+
+
+class AsyncViewTests(HomeworkTestCase):
+    def test_teacher_detail_lists_every_student(self):
+        submit(self.students[0], self.hw, ["4", "Париж", ""], auto_score=2, final_score=2)
+        self.client.force_login(self.teacher)
+
+        response = self.client.get(reverse("homework_detail", args=[self.hw.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        rows = response.context["rows"]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([r["submitted"] for r in rows], [True, False, False])
+
+    def test_student_list_and_progress_chart(self):
+        submit(self.students[0], self.hw, ["4", "", ""], auto_score=1, final_score=1)
+        self.client.force_login(self.students[0])
+
+        response = self.client.get(reverse("homework_list"))
+        self.assertEqual(list(response.context["homeworks"]), [self.hw])
+
+        response = self.client.get(reverse("my_progress_png"))
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+
+    def test_other_teacher_is_forbidden(self):
+        self.client.force_login(make_user("other", "teacher"))
+        response = self.client.get(reverse("homework_detail", args=[self.hw.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+def answer_post(hw, answers, prefix="a"):
+    data = {f"{prefix}-TOTAL_FORMS": str(len(hw.questions)), f"{prefix}-INITIAL_FORMS": str(len(hw.questions))}
+    for i, (q, answer) in enumerate(zip(hw.questions, answers)):
+        data[f"{prefix}-{i}-number"] = str(q["number"])
+        data[f"{prefix}-{i}-answer"] = answer
+    return data
+
+
+class IngestTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        # Долгий интервал: фоновый поток буфера не должен сбрасывать его
+        # вперёд теста из своего соединения.
+        self.buffer = ingest.SubmissionBuffer(max_rows=1000, interval=3600)
+        self.enterContext(mock.patch.object(ingest, "_buffer", self.buffer))
+
+    def pending(self, student, answers):
+        submission = StudentSubmission(
+            student=student, homework_template=self.hw, auto_score=0, final_score=0, graded=False,
+        )
+        submission.set_answers(self.hw, {str(i): a for i, a in enumerate(answers, start=1)})
+        return submission
+
+    def stored(self, student):
+        return StudentSubmission.objects.get(student=student, homework_template=self.hw).answer_values(self.hw)
+
+    @override_settings(SUBMISSION_INGEST_MODE="batched")
+    def test_batched_submit_is_visible_before_and_after_flush(self):
+        self.client.force_login(self.students[0])
+        url = reverse("homework_submit", args=[self.hw.pk])
+
+        response = self.client.post(url, answer_post(self.hw, ["4", "Париж", "c"]))
+
+        self.assertRedirects(response, reverse("homework_list"), fetch_redirect_response=False)
+        self.assertFalse(StudentSubmission.objects.exists())
+        self.assertEqual(self.client.get(url).context["submission"].auto_score, 2)
+        self.assertEqual(ingest.flush(), 1)
+        self.assertEqual(self.stored(self.students[0]), ["4", "Париж", "c"])
+
+    def test_concurrent_resubmissions_keep_last_round(self):
+        students = self.students + [make_user(f"extra{i}", "student", self.classroom) for i in range(20)]
+        rounds = 25
+
+        def resubmit(student):
+            for round_no in range(rounds):
+                self.buffer.put(self.pending(student, [str(round_no)]))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(resubmit, students))
+
+        self.assertEqual(self.buffer.flush(), len(students))
+        self.assertEqual(
+            {tuple(a) for a in StudentSubmission.objects.values_list("answers", flat=True)},
+            {(str(rounds - 1),)},
+        )
+
+    def test_stale_row_from_another_worker_is_not_written(self):
+        other_worker = ingest.SubmissionBuffer(max_rows=1000, interval=3600)
+        other_worker.put(self.pending(self.students[0], ["old"]))
+        self.buffer.put(self.pending(self.students[0], ["new"]))
+
+        self.buffer.flush()
+        other_worker.flush()
+
+        self.assertEqual(self.stored(self.students[0])[0], "new")
+
+    def test_buffered_row_does_not_overwrite_later_review(self):
+        stale = self.pending(self.students[0], ["4"])
+        reviewed = submit(self.students[0], self.hw, ["4", "Париж"], final_score=3, graded=True)
+
+        ingest.upsert([stale])
+        reviewed.refresh_from_db()
+        self.assertEqual((reviewed.final_score, reviewed.graded), (3, True))
+
+        ingest.upsert([self.pending(self.students[0], ["5"])])
+        self.assertEqual(self.stored(self.students[0])[0], "5")
+
+    def test_only_rows_written_by_flush_are_audited(self):
+        self.addCleanup(audit.flush)
+        stale = self.pending(self.students[0], ["4"])
+        submit(self.students[0], self.hw, ["4"], final_score=3, graded=True)
+        self.buffer.put(stale)
+        self.buffer.put(self.pending(self.students[1], ["4"]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.flush()
+        audit.flush()
+
+        self.assertEqual(
+            list(GradingEvent.objects.values_list("student_id", "source")), [(self.students[1].pk, "auto")],
+        )
+
+    def test_failed_save_is_not_audited(self):
+        self.client.force_login(self.students[0])
+        url = reverse("homework_submit", args=[self.hw.pk])
+
+        with mock.patch.object(StudentSubmission, "save", side_effect=RuntimeError("нет места")):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+                self.client.post(url, answer_post(self.hw, ["4", "Париж", "c"]))
+        self.assertEqual(audit.flush(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, answer_post(self.hw, ["4", "Париж", "c"]))
+        self.assertEqual(audit.flush(), 1)
+
+
+class FailingChannel:
+    name = "email"
+
+    def deliver(self, digests):
+        raise ConnectionRefusedError("SMTP недоступен")
+
+
+class NotificationTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.students[0].email = "student1@example.com"
+        self.students[0].save()
+        subs = [submit(s, self.hw, ["4"], final_score=1, graded=True) for s in self.students[:2]]
+        notifications.enqueue_graded(self.hw, subs)
+        notifications.enqueue_deadline("deadline_reminder", self.hw, [self.students[0].pk])
+
+    def test_drain_sends_one_digest_per_recipient(self):
+        self.assertEqual(notifications.drain(), 3)
+
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(Notification.objects.get(user=self.students[0]).title, "Новых уведомлений: 2")
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(NotificationOutbox.objects.filter(processed_at__isnull=True).exists())
+
+    def test_failing_channel_does_not_block_other_channels(self):
+        channels = [notifications.InAppChannel(), FailingChannel()]
+
+        with self.assertLogs("homework.notifications", "ERROR"):
+            self.assertEqual(notifications.drain(channels=channels), 3)
+        self.assertEqual(Notification.objects.count(), 2)
+        message = NotificationOutbox.objects.first()
+        self.assertEqual((message.delivered, message.attempts), (["in_app"], 1))
+        self.assertIsNone(message.processed_at)
+        # До срока повтора сообщения не выбираются, и очередь не стоит.
+        self.assertEqual(notifications.drain(channels=channels), 0)
+
+        NotificationOutbox.objects.update(retry_at=timezone.now())
+        self.assertEqual(notifications.drain(), 3)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(NotificationOutbox.objects.filter(processed_at__isnull=True).exists())
+
+    def test_delivery_runs_outside_transactions_on_claimed_rows(self):
+        outside = len(connection.atomic_blocks)
+        seen = []
+
+        class ProbeChannel:
+            name = "email"
+
+            def deliver(self, digests):
+                # Другой обработчик уже взятые сообщения не получает.
+                seen.append((len(connection.atomic_blocks), notifications.drain(channels=[])))
+
+        self.assertEqual(notifications.drain(channels=[notifications.InAppChannel(), ProbeChannel()]), 3)
+        self.assertEqual(seen, [(outside, 0)])
+        self.assertFalse(NotificationOutbox.objects.filter(processed_at__isnull=True).exists())
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=1)
+    def test_gives_up_after_max_attempts(self):
+        with self.assertLogs("homework.notifications", "ERROR"):
+            notifications.drain(channels=[notifications.InAppChannel(), FailingChannel()])
+        self.assertFalse(NotificationOutbox.objects.filter(processed_at__isnull=True).exists())
+
+
+class ChangeFeedTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.teacher)
+        self.url = reverse("homework_changes", args=[self.hw.pk])
+
+    def test_returns_changes_after_cursor(self):
+        submit(self.students[0], self.hw, ["4"], auto_score=1, final_score=1)
+        first = self.client.get(self.url).json()
+        self.assertEqual([c["student_id"] for c in first["changes"]], [self.students[0].pk])
+
+        submit(self.students[1], self.hw, ["5"])
+        second = self.client.get(self.url, {"cursor": first["cursor"]}).json()
+        self.assertEqual([c["student_id"] for c in second["changes"]][-1], self.students[1].pk)
+        self.assertNotEqual(second["cursor"], first["cursor"])
+
+        again = self.client.get(self.url, {"cursor": second["cursor"]}).json()
+        self.assertEqual(again["cursor"], second["cursor"])
+
+    def test_resends_rows_committed_late_behind_the_cursor(self):
+        submit(self.students[0], self.hw, ["4"])
+        cursor = self.client.get(self.url).json()["cursor"]
+
+        # Транзакция получила updated_at раньше, но закоммитилась позже.
+        late = submit(self.students[1], self.hw, ["5"])
+        earlier = StudentSubmission.objects.get(student=self.students[0]).updated_at - timedelta(seconds=1)
+        StudentSubmission.objects.filter(pk=late.pk).update(updated_at=earlier)
+
+        response = self.client.get(self.url, {"cursor": cursor}).json()
+        self.assertIn(self.students[1].pk, [c["student_id"] for c in response["changes"]])
+        self.assertEqual(response["cursor"], cursor)
+
+    @override_settings(CHANGE_FEED_WSGI_MAX_WAIT=0, CHANGE_FEED_WSGI_POLL_DELAY=10, CHANGE_FEED_POLL_INTERVAL=5)
+    def test_wsgi_requests_do_not_wait(self):
+        started = time.monotonic()
+        response = self.client.get(self.url, {"wait": "25"}).json()
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((response["changes"], response["poll_after"]), ([], 10))
+
+    def test_rejects_malformed_wait_and_cursor(self):
+        for params in ({"wait": "nan"}, {"wait": "inf"}, {"wait": "soon"}, {"cursor": "x.y"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    @override_settings(CHANGE_FEED_POLL_INTERVAL=0.01)
+    def test_negative_wait_returns_immediately(self):
+        self.assertEqual(self.client.get(self.url, {"wait": "-5"}).json()["changes"], [])
+
+
+class CachedUserTests(HomeworkTestCase):
+    def test_user_is_loaded_with_profile_and_cached(self):
+        backend = ProfileModelBackend()
+        student = self.students[0]
+        self.assertEqual(backend.get_user(student.pk).profile.classroom, self.classroom)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(student.pk).profile.classroom.name, "5А")
+
+    def test_deleting_classroom_forgets_its_students(self):
+        backend = ProfileModelBackend()
+        backend.get_user(self.students[0].pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classroom.delete()
+
+        self.assertIsNone(backend.get_user(self.students[0].pk).profile.classroom)
+
+    def test_sessions_of_the_plain_model_backend_stay_valid(self):
+        session = self.client.session
+        session.update({
+            "_auth_user_id": str(self.teacher.pk),
+            "_auth_user_backend": "django.contrib.auth.backends.ModelBackend",
+            "_auth_user_hash": self.teacher.get_session_auth_hash(),
+        })
+        session.save()
+
+        self.assertEqual(self.client.get(reverse("profile")).status_code, 200)
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        for name, body in (("app.0123456789ab.css", b"body{}"), ("app.0123456789ab.css.br", b"br"), ("plain.js", b"1")):
+            with open(f"{root}/{name}", "wb") as fh:
+                fh.write(body)
+        self.enterContext(override_settings(STATIC_ROOT=root, STATIC_URL="static/"))
+        self.factory = RequestFactory()
+
+    def test_serves_precompressed_hashed_file_as_immutable(self):
+        middleware = StaticFilesMiddleware(lambda request: HttpResponse("app"))
+        response = middleware(self.factory.get("/static/app.0123456789ab.css", HTTP_ACCEPT_ENCODING="gzip, br"))
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(b"".join(response.streaming_content), b"br")
+        response.close()
+
+        etag = response["ETag"]
+        self.assertTrue(etag.endswith('-br"'))
+        response = middleware(
+            self.factory.get("/static/app.0123456789ab.css", HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING="br")
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+        # Несжатый вариант — другой ETag: тег br-варианта к нему не подходит.
+        response = middleware(self.factory.get("/static/app.0123456789ab.css", HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual((response.status_code, b"".join(response.streaming_content)), (200, b"body{}"))
+        response.close()
+
+    def test_async_chain_stays_async(self):
+        async def view(request):
+            return HttpResponse("app")
+
+        middleware = StaticFilesMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        response = async_to_sync(middleware)(self.factory.get("/static/plain.js"))
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        response.close()
+        self.assertEqual(async_to_sync(middleware)(self.factory.get("/profile/")).content, b"app")
+
+
+class AnswerSheetFragmentTests(HomeworkTestCase):
+    def test_rows_are_rendered_once_per_questions_version(self):
+        first = answer_sheet.render_rows(self.hw, "a", ["<b>4</b>", "Париж"], {1: "Ошибка"})
+        self.assertIn("&lt;b&gt;4&lt;/b&gt;", first)
+        self.assertIn('<div class="form__error">Ошибка</div>', first)
+
+        with mock.patch.object(answer_sheet, "render_to_string") as render:
+            answer_sheet.render_rows(self.hw, "a", ["5"])
+        render.assert_not_called()
+
+        self.hw.questions = self.hw.questions + [{"number": 4, "answer_format": "int"}]
+        self.hw.save()
+        self.assertEqual(answer_sheet.render_rows(self.hw, "a", []).count('name="a-3-answer"'), 1)
+
+
+class AnswerSheetParserTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hw.questions = [{"number": i, "answer_format": "int"} for i in range(1, 151)]
+        self.hw.save()
+
+    def test_fast_path_matches_formset_path(self):
+        data = answer_post(self.hw, [str(i) for i in range(150)])
+        data["a-3-answer"] = "три"
+        fast = answer_sheet.clean(self.hw, data, "a", AnswerFormSet)
+        slow = answer_sheet.clean_formset(self.hw, AnswerFormSet(data, prefix="a"))
+
+        self.assertEqual(fast, slow)
+        self.assertEqual(fast[1], {3: "Введите целое число."})
+
+    def test_rejects_tampered_management_form(self):
+        data = answer_post(self.hw, ["1"] * 150)
+        data["a-TOTAL_FORMS"] = "100000"
+        self.assertEqual(answer_sheet.parse(self.hw, data, "a"), ({}, {None: answer_sheet.MANAGEMENT_FORM_ERROR}))
+
+
+class AnswerLayoutTests(HomeworkTestCase):
+    def reorder(self):
+        self.hw.questions = [{"number": 3, "answer_format": "text"}, {"number": 1, "answer_format": "text"}]
+        self.hw.save()
+
+    def test_changing_questions_realigns_stored_rows(self):
+        submission = submit(self.students[0], self.hw, ["4", "Париж", "python"])
+        self.reorder()
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.answers, ["python", "4"])
+        self.assertEqual(submission.answer_map(self.hw), {"3": "python", "1": "4"})
+
+    def test_rows_of_another_layout_are_not_read(self):
+        submission = submit(self.students[0], self.hw, ["4", "Париж", "python"])
+        submission.layout_version = self.hw.questions_version + 1
+
+        self.assertEqual(submission.answer_values(self.hw), ["", "", ""])
+
+    def test_ingest_flush_repacks_rows_buffered_before_the_change(self):
+        buffer = ingest.SubmissionBuffer(max_rows=1000, interval=3600)
+        with mock.patch.object(ingest, "_buffer", buffer):
+            hw = HomeworkTemplate.objects.get(pk=self.hw.pk)
+            ingest.enqueue(self.students[0], hw, {"1": "4", "2": "Париж", "3": "python"}, 3)
+            self.reorder()
+            buffer.flush()
+
+        stored = StudentSubmission.objects.get(student=self.students[0])
+        self.assertEqual((stored.answers, stored.layout_version), (["python", "4"], self.hw.questions_version))
+
+
+class ItemAnalysisTests(HomeworkTestCase):
+    def test_difficulty_blanks_and_distractors(self):
+        submit(self.students[0], self.hw, ["4", "париж", "python"])
+        submit(self.students[1], self.hw, ["5", "Лондон", ""])
+        submit(self.students[2], self.hw, ["5", "Париж", "python"])
+
+        report = item_analysis(self.hw)
+
+        self.assertEqual(report["students"], 3)
+        first, second, third = report["items"]
+        self.assertEqual(first["difficulty"], 33.3)
+        self.assertEqual(first["distractors"], [{"answer": "5", "count": 2, "percent": 67}])
+        self.assertEqual(second["difficulty"], 66.7)
+        self.assertEqual(third["blanks"], 1)
+
+    def test_report_is_recomputed_after_a_submission(self):
+        submit(self.students[0], self.hw, ["4"])
+        self.assertEqual(item_analysis(self.hw)["students"], 1)
+
+        submit(self.students[1], self.hw, ["4"])
+        self.assertEqual(item_analysis(self.hw)["students"], 2)
+
+
+class RollupTests(HomeworkTestCase):
+    def test_rollup_grades_match_the_grading_scale(self):
+        for student, score in zip(self.students, (3, 2, 0)):
+            submit(student, self.hw, [], final_score=score)
+        graded = submit(make_user("graded", "student", self.classroom), self.hw, [], final_score=0, grade=5)
+
+        analytics.refresh(full=True)
+
+        term = PerformanceSnapshot.objects.get(classroom=self.classroom, student=None, period="term")
+        expected = {}
+        for score in (3, 2, 0):
+            key = str(grade_for_score(self.hw, score))
+            expected[key] = expected.get(key, 0) + 1
+        expected["5"] = expected.get("5", 0) + 1
+        self.assertEqual(term.grade_counts, expected)
+        self.assertEqual(term.submissions, 4)
+        self.assertEqual(
+            PerformanceSnapshot.objects.get(student=graded.student, period="term").grade_counts, {"5": 1},
+        )
+
+    def test_incremental_refresh_only_picks_up_changes(self):
+        submit(self.students[0], self.hw, [], final_score=3)
+        analytics.refresh(full=True)
+        self.assertEqual(analytics.refresh(), 0)
+
+        submit(self.students[1], self.hw, [], final_score=1)
+        analytics.refresh()
+        term = PerformanceSnapshot.objects.get(classroom=self.classroom, student=None, period="term")
+        self.assertEqual(term.submissions, 2)
+
+    def test_scalar_and_vectorized_grades_agree(self):
+        scale = GradeScale(threshold_2=30, threshold_3=51, threshold_4=71, threshold_5=89)
+        percents = [0, 30, 50.9, 71, 100]
+        thresholds = {2: 30, 3: 51, 4: 71, 5: 89}
+        self.assertEqual([grade_for(scale, p) for p in percents], [1, 2, 2, 4, 5])
+        self.assertEqual(grades_for(np.array(percents), thresholds).tolist(), [1, 2, 2, 4, 5])
+
+
+class SimilarityTests(HomeworkTestCase):
+    def test_flags_pair_sharing_rare_wrong_answers(self):
+        hw = make_homework(self.classroom, ["1", "2", "3", "4", "5"])
+        students = self.students + [make_user(f"extra{i}", "student", self.classroom) for i in range(3)]
+        for student in students[2:]:
+            submit(student, hw, ["1", "2", "3", "4", "5"])
+        for student in students[:2]:
+            submit(student, hw, ["9", "8", "7", "6", "5"])
+
+        report = similarity_report(hw)
+
+        self.assertEqual(report["students"], 6)
+        [pair] = report["pairs"]
+        self.assertEqual({pair["first"], pair["second"]}, {students[0].pk, students[1].pk})
+        self.assertEqual(pair["shared_wrong"], 4)
+        self.assertEqual(pair["hamming"], 0)
+        self.assertEqual(pair["answers"], [(1, "9"), (2, "8"), (3, "7"), (4, "6")])
+
+    def test_common_mistakes_are_not_flagged(self):
+        for student in self.students:
+            submit(student, self.hw, ["5", "Лондон", "python"])
+        self.assertEqual(similarity_report(self.hw)["pairs"], [])
+
+
+class ScoreBandTests(HomeworkTestCase):
+    def test_nearest_rank_percentiles_per_homework(self):
+        students = self.students + [make_user("extra", "student", self.classroom)]
+        for student, score in zip(students, (4, 1, 3, 2)):
+            submit(student, self.hw, [], final_score=score)
+        empty = make_homework(self.classroom, ["1"])
+
+        bands = async_to_sync(analytics.ascore_bands)([self.hw.pk, empty.pk])
+
+        self.assertEqual(bands, {self.hw.pk: (1, 2, 3), empty.pk: (None, None, None)})
+
+    def test_bands_follow_new_submissions(self):
+        submit(self.students[0], self.hw, [], final_score=1)
+        self.assertEqual(async_to_sync(analytics.ascore_bands)([self.hw.pk])[self.hw.pk], (1, 1, 1))
+
+        submit(self.students[1], self.hw, [], final_score=3)
+        self.assertEqual(async_to_sync(analytics.ascore_bands)([self.hw.pk])[self.hw.pk], (1, 1, 3))
+
+
+class ApiTests(HomeworkTestCase):
+    def test_projection_paging_and_conditional_get(self):
+        for student in self.students:
+            submit(student, self.hw, ["4"], final_score=1)
+        self.client.force_login(self.teacher)
+        url = reverse("api:homework_submissions", args=[self.hw.pk])
+
+        page = self.client.get(url, {"fields": "student_id,final_score", "limit": 2})
+        body = page.json()
+        self.assertEqual(body["results"][0], {"student_id": self.students[0].pk, "final_score": 1})
+        self.assertEqual(len(body["results"]), 2)
+        rest = self.client.get(url, {"fields": "student_id", "limit": 2, "cursor": body["next_cursor"]}).json()
+        self.assertEqual((rest["results"], rest["next_cursor"]), ([{"student_id": self.students[2].pk}], None))
+
+        again = self.client.get(url, {"fields": "student_id,final_score", "limit": 2},
+                                HTTP_IF_NONE_MATCH=page["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_students_see_only_their_own_grades_and_no_answer_key(self):
+        for student in self.students[:2]:
+            submit(student, self.hw, ["4"], final_score=1)
+        self.client.force_login(self.students[0])
+
+        grades = self.client.get(reverse("api:grade_list")).json()["results"]
+        self.assertEqual([g["student_id"] for g in grades], [self.students[0].pk])
+        response = self.client.get(reverse("api:homework_detail", args=[self.hw.pk]), {"fields": "correct_answers"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_answers_are_keyed_by_question_number(self):
+        positional = submit(self.students[0], self.hw, ["4", "", "python"])
+        self.assertEqual(positional.answers_schema, StudentSubmission.ANSWERS_POSITIONAL)
+        StudentSubmission.objects.create(
+            student=self.students[1], homework_template=self.hw,
+            answers={"2": "Париж"}, answers_schema=StudentSubmission.ANSWERS_BY_NUMBER,
+        )
+        self.client.force_login(self.teacher)
+
+        response = self.client.get(
+            reverse("api:homework_submissions", args=[self.hw.pk]), {"fields": "student_id,answers"},
+        )
+        self.assertEqual(response.json()["results"], [
+            {"student_id": self.students[0].pk, "answers": {"1": "4", "2": "", "3": "python"}},
+            {"student_id": self.students[1].pk, "answers": {"1": "", "2": "Париж", "3": ""}},
+        ])
+
+    def test_anonymous_requests_are_rejected(self):
+        self.assertEqual(self.client.get(reverse("api:classroom_list")).status_code, 401)
+
+
+class BulkReviewTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.subs = [submit(s, self.hw, [], auto_score=score, final_score=score) for s, score in zip(self.students, (3, 2, 1))]
+        self.client.force_login(self.teacher)
+        self.url = reverse("homework_bulk_review", args=[self.hw.pk])
+
+    def test_accept_auto_grades_every_pending_submission(self):
+        self.subs[0].graded, self.subs[0].final_score = True, 1
+        self.subs[0].save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {"action": "accept_auto"})
+        audit.flush()
+
+        rows = StudentSubmission.objects.order_by("student__username").values_list("final_score", "grade", "graded")
+        self.assertEqual(list(rows), [(1, None, True), (2, 3, True), (1, 2, True)])
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+        self.assertEqual(GradingEvent.objects.filter(source="bulk").count(), 2)
+
+    def test_formset_saves_only_changed_rows(self):
+        data = {"form-TOTAL_FORMS": "3", "form-INITIAL_FORMS": "3"}
+        for i, sub in enumerate(self.subs):
+            data.update({
+                f"form-{i}-student_id": str(sub.student_id),
+                f"form-{i}-final_score": str(sub.final_score),
+                f"form-{i}-grade": "",
+                f"form-{i}-teacher_comment": "",
+            })
+        data["form-1-final_score"] = "3"
+        data["form-1-teacher_comment"] = "Молодец"
+
+        response = self.client.post(self.url, data)
+
+        self.assertRedirects(response, reverse("homework_detail", args=[self.hw.pk]), fetch_redirect_response=False)
+        changed = StudentSubmission.objects.get(student=self.students[1])
+        self.assertEqual((changed.final_score, changed.grade, changed.teacher_comment), (3, 5, "Молодец"))
+        self.assertEqual(StudentSubmission.objects.filter(graded=True).count(), 3)
+
+
+class MetricsTests(HomeworkTestCase):
+    def queries_observed(self, view):
+        state = metrics.REQUEST_QUERIES.values.get((view,))
+        return (state[-1], state[-2]) if state else (0, 0)
+
+    def test_counts_queries_of_async_view_under_wsgi(self):
+        self.client.force_login(self.teacher)
+        before = self.queries_observed("homework_detail")
+
+        self.client.get(reverse("homework_detail", args=[self.hw.pk]))
+
+        after = self.queries_observed("homework_detail")
+        self.assertEqual(after[0], before[0] + 1)
+        # Сессия, пользователь с профилем, ДЗ, сдачи, ученики.
+        self.assertGreaterEqual(after[1] - before[1], 4)
+
+    async def test_counts_queries_of_async_view_under_asgi(self):
+        await self.async_client.aforce_login(self.teacher)
+        before = self.queries_observed("homework_detail")
+
+        await self.async_client.get(reverse("homework_detail", args=[self.hw.pk]))
+
+        after = self.queries_observed("homework_detail")
+        self.assertEqual(after[0], before[0] + 1)
+        self.assertGreaterEqual(after[1] - before[1], 4)
+
+    def test_observes_queries_made_in_other_threads(self):
+        def query_in_worker():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            finally:
+                connections.close_all()
+
+        seen = []
+        with queries.observe(lambda alias, sql, seconds: seen.append((alias, sql))):
+            async_to_sync(sync_to_async(query_in_worker, thread_sensitive=False))()
+
+        self.assertEqual(seen, [("default", "SELECT 1")])
+
+    def test_endpoint_is_limited_to_allowed_addresses(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        self.assertIn(b"homework_http_request_db_queries_bucket", self.client.get("/metrics").content)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.1").status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=("192.0.2.7",), METRICS_TRUSTED_PROXIES=("10.0.0.1",))
+    def test_client_behind_trusted_proxy_is_taken_from_forwarded_for(self):
+        for forwarded, status in (("192.0.2.7", 200), ("192.0.2.7, 198.51.100.1", 403), ("", 403)):
+            with self.subTest(forwarded=forwarded):
+                response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=forwarded)
+                self.assertEqual(response.status_code, status)
+        response = self.client.get("/metrics", REMOTE_ADDR="198.51.100.1", HTTP_X_FORWARDED_FOR="192.0.2.7")
+        self.assertEqual(response.status_code, 403)
+
+
+class GradingAuditTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(audit.flush)
+
+    def test_review_is_logged_after_commit(self):
+        submit(self.students[0], self.hw, ["4"], auto_score=1, final_score=1)
+        self.client.force_login(self.teacher)
+        data = {**answer_post(self.hw, ["4", "Париж", ""], prefix="r"), "final_score": "3"}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("submission_review", args=[self.hw.pk, self.students[0].pk]), data)
+        audit.flush()
+
+        event = GradingEvent.objects.get()
+        self.assertEqual(
+            (event.source, event.old_score, event.new_score, event.auto_score, event.actor_id),
+            ("review", 1, 3, 2, self.teacher.pk),
+        )
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_rolled_back_change_is_not_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    audit.record("review", self.hw, self.students[0].pk, 3, 3)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(audit.flush(), 0)
+
+    def test_prune_drops_whole_old_partitions(self):
+        old = timezone.now() - timedelta(days=40 * 31)
+        for created_at in (old, timezone.now()):
+            GradingEvent.objects.create(
+                student=self.students[0], homework_template=self.hw, source="auto",
+                new_score=1, auto_score=1, answer_key_version=1, created_at=created_at,
+            )
+        call_command("prune_grading_events", stdout=StringIO())
+        self.assertEqual(GradingEvent.objects.count(), 1)
+
+
+class ArchiveTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(ARCHIVE_ROOT=root, ARCHIVE_CHUNK_SIZE=2, ARCHIVE_CHUNK_PAUSE=0))
+        self.year = analytics.school_year(timezone.localdate()) - 1
+        self.start, self.end = analytics.school_year_bounds(self.year)
+        self.hw.deadline = self.start + timedelta(days=30)
+        self.hw.save()
+
+    def test_archive_and_restore_round_trip(self):
+        submitted = [submit(student, self.hw, ["4"], auto_score=1, final_score=1) for student in self.students]
+        GradingEvent.objects.create(
+            student=self.students[0], homework_template=self.hw, source="auto",
+            new_score=1, auto_score=1, answer_key_version=1,
+        )
+        call_command("archive_year", str(self.year), stdout=StringIO())
+
+        self.assertFalse(HomeworkTemplate.objects.exists())
+        self.assertFalse(StudentSubmission.objects.exists())
+        self.assertFalse(GradingEvent.objects.exists())
+
+        call_command("restore_archive", str(archive.year_directory(self.year)), stdout=StringIO())
+
+        self.assertEqual(HomeworkTemplate.objects.get().pk, self.hw.pk)
+        self.assertEqual(GradingEvent.objects.count(), 1)
+        self.assertEqual(
+            dict(StudentSubmission.objects.values_list("pk", "submitted_at")),
+            # JSON хранит время с точностью до миллисекунд.
+            {s.pk: s.submitted_at.replace(microsecond=s.submitted_at.microsecond // 1000 * 1000) for s in submitted},
+        )
+
+    def test_rows_written_during_export_are_kept(self):
+        submit(self.students[0], self.hw, ["4"])
+        export = archive.export_classroom
+
+        def export_then_submit(*args):
+            exported = export(*args)
+            submit(self.students[1], self.hw, ["4"])
+            return exported
+
+        with mock.patch.object(archive, "export_classroom", export_then_submit):
+            result = archive.archive_classroom(self.classroom, self.start, self.end)
+
+        self.assertEqual(result["submissions"], 1)
+        self.assertEqual(StudentSubmission.objects.get().student, self.students[1])
+        self.assertTrue(HomeworkTemplate.objects.filter(pk=self.hw.pk).exists())
+
+    def test_empty_classroom_is_dropped_with_its_snapshots(self):
+        Profile.objects.filter(classroom=self.classroom).update(classroom=None)
+        for i in range(5):
+            PerformanceSnapshot.objects.create(
+                classroom=self.classroom, period="week",
+                period_start=self.start + timedelta(weeks=i), period_label=str(i),
+            )
+
+        with mock.patch.object(archive, "purge", wraps=archive.purge) as purge:
+            result = archive.archive_classroom(self.classroom, self.start, self.end)
+
+        self.assertTrue(result["classroom_deleted"])
+        self.assertFalse(PerformanceSnapshot.objects.exists())
+        self.assertIn(PerformanceSnapshot, [c.args[0] for c in purge.call_args_list])
+
+
+class DeadlineTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(audit.flush)
+        self.today = timezone.localdate()
+
+    def test_close_due_zero_fills_missing_students_once(self):
+        submit(self.students[0], self.hw, ["4"])
+        self.hw.deadline = self.today - timedelta(days=1)
+        self.hw.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            closed = deadlines.close_due(self.today)
+        audit.flush()
+
+        self.assertEqual([(hw.pk, missing) for hw, missing in closed], [(self.hw.pk, 2)])
+        zero = StudentSubmission.objects.filter(homework_template=self.hw, is_missing=True)
+        self.assertEqual({s.student_id for s in zero}, {s.pk for s in self.students[1:]})
+        self.assertTrue(all(s.layout_version == self.hw.questions_version for s in zero))
+        self.assertEqual(NotificationOutbox.objects.filter(kind="missing").count(), 2)
+        self.assertEqual(GradingEvent.objects.filter(source="deadline").count(), 2)
+        self.assertEqual(deadlines.close_due(self.today), [])
+
+    def test_student_who_submits_during_closing_is_not_reported(self):
+        self.hw.deadline = self.today - timedelta(days=1)
+        self.hw.save()
+        find = deadlines._students_without_submission
+
+        def submit_meanwhile(hw):
+            candidates = find(hw)
+            submit(self.students[0], hw, ["4"])
+            return candidates
+
+        with mock.patch.object(deadlines, "_students_without_submission", submit_meanwhile):
+            with self.captureOnCommitCallbacks(execute=True):
+                closed = deadlines.close_due(self.today)
+        audit.flush()
+
+        expected = {s.pk for s in self.students[1:]}
+        self.assertEqual(closed[0][1], 2)
+        self.assertEqual(
+            set(NotificationOutbox.objects.filter(kind="missing").values_list("recipient_id", flat=True)), expected,
+        )
+        self.assertEqual(
+            set(GradingEvent.objects.filter(source="deadline").values_list("student_id", flat=True)), expected,
+        )
+
+    def test_zero_filled_students_are_shown_as_missing(self):
+        submit(self.students[0], self.hw, ["4"], auto_score=1, final_score=1)
+        self.hw.deadline = self.today - timedelta(days=1)
+        self.hw.save()
+        deadlines.close_due(self.today)
+        self.client.force_login(self.teacher)
+
+        response = self.client.get(reverse("homework_detail", args=[self.hw.pk]))
+        rows = {r["student_profile"].user_id: r["submitted"] for r in response.context["rows"]}
+        self.assertEqual(rows, {self.students[0].pk: True, self.students[1].pk: False, self.students[2].pk: False})
+        self.assertContains(response, reverse("submission_review", args=[self.hw.pk, self.students[0].pk]))
+        self.assertNotContains(response, reverse("submission_review", args=[self.hw.pk, self.students[1].pk]))
+
+        changes = self.client.get(reverse("homework_changes", args=[self.hw.pk])).json()["changes"]
+        self.assertEqual(
+            {c["student_id"]: c["is_missing"] for c in changes},
+            {self.students[0].pk: False, self.students[1].pk: True, self.students[2].pk: True},
+        )
+
+    def test_close_due_skips_homework_claimed_elsewhere(self):
+        self.hw.deadline = self.today - timedelta(days=1)
+        self.hw.save()
+        HomeworkTemplate.objects.filter(pk=self.hw.pk).update(closed_at=timezone.now())
+
+        self.assertEqual(deadlines.close_due(self.today), [])
+        self.assertFalse(StudentSubmission.objects.exists())
+
+    def test_reminders_go_to_students_without_submission(self):
+        submit(self.students[0], self.hw, ["4"])
+        self.hw.deadline = self.today + timedelta(days=1)
+        self.hw.save()
+        later = make_homework(self.classroom, ["1"], deadline=self.today + timedelta(days=10))
+
+        sent = deadlines.send_reminders(self.today)
+
+        self.assertEqual([(hw.pk, count) for hw, count in sent], [(self.hw.pk, 2)])
+        self.assertEqual(
+            set(NotificationOutbox.objects.filter(kind="deadline_reminder").values_list("recipient_id", flat=True)),
+            {s.pk for s in self.students[1:]},
+        )
+        self.assertFalse(NotificationOutbox.objects.filter(payload__hw_id=later.pk).exists())
+        self.assertEqual(deadlines.send_reminders(self.today), [])
+
+
+@skipUnless(settings.TENANTS, "нужны настройки homework_checker.settings_tenants")
+class TenantTests(TestCase):
+    databases = {"default", *settings.TENANTS}
+
+    def setUp(self):
+        cache.clear()
+        self.teachers = {}
+        self.classrooms = {}
+        for name in ("school1", "school2"):
+            teacher = User.objects.create_user(username=f"teacher-{name}")
+            UserTenant.objects.create(user=teacher, tenant=name)
+            with tenants.use_tenant(name):
+                Profile.objects.create(user=teacher, role="teacher", last_name=name, first_name="Тест")
+                self.classrooms[name] = Classroom.objects.create(name=f"Класс {name}", teacher=teacher)
+            self.teachers[name] = teacher
+
+    def url(self, name):
+        return reverse("classroom_detail", args=[self.classrooms[name].pk])
+
+    def test_school_is_chosen_by_host_and_by_user(self):
+        self.client.force_login(self.teachers["school1"])
+        for host in ("school1.localhost", "testserver"):
+            response = self.client.get(self.url("school1"), HTTP_HOST=host)
+            self.assertContains(response, "Класс school1")
+            self.assertNotContains(response, "Класс school2")
+
+    def test_schools_do_not_see_each_others_rows(self):
+        for name, other in (("school1", "school2"), ("school2", "school1")):
+            with tenants.use_tenant(name):
+                self.assertEqual(list(Classroom.objects.values_list("name", flat=True)), [f"Класс {name}"])
+                self.assertFalse(Profile.objects.filter(user=self.teachers[other]).exists())
+
+    def test_user_of_another_school_is_sent_to_own_host(self):
+        self.client.force_login(self.teachers["school1"])
+        response = self.client.get(self.url("school1") + "?x=1", HTTP_HOST="school2.localhost")
+        self.assertRedirects(
+            response, f"http://school1.localhost{self.url('school1')}?x=1", fetch_redirect_response=False,
+        )
+        response = self.client.post(self.url("school1"), {}, HTTP_HOST="school2.localhost")
+        self.assertEqual(response.status_code, 403)
+
+    def test_cached_user_is_forgotten_from_another_schools_context(self):
+        backend = ProfileModelBackend()
+        teacher = self.teachers["school1"]
+        with tenants.use_tenant("school1"):
+            self.assertEqual(backend.get_user(teacher.pk).profile.last_name, "school1")
+
+        teacher.last_name = "Новая"
+        with tenants.use_tenant("school2"):
+            teacher.save()
+        with tenants.use_tenant("school1"):
+            self.assertEqual(backend.get_user(teacher.pk).last_name, "Новая")
+
+    async def test_async_requests_are_routed_too(self):
+        async def view(request):
+            names = [name async for name in Classroom.objects.values_list("name", flat=True)]
+            return HttpResponse(", ".join(names))
+
+        middleware = tenants.TenantMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        await self.async_client.aforce_login(self.teachers["school2"])
+        session = await self.async_client.asession()
+        for host, status, body in (("school2.localhost", 200, "Класс school2"), ("school1.localhost", 302, "")):
+            request = RequestFactory().get("/", HTTP_HOST=host)
+            request.session = session
+            response = await middleware(request)
+            self.assertEqual((response.status_code, response.content.decode()), (status, body))
+
+
+@skipUnless(settings.READ_REPLICAS, "нужны настройки homework_checker.settings_replica")
+class ReplicaTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def request(self, user_id=1):
+        request = RequestFactory().get("/")
+        request.session = {SESSION_KEY: str(user_id)}
+        return request
+
+    def read_db(self, request):
+        with replicas.reads():
+            request.read_db = router.db_for_read(Classroom)
+        return HttpResponse()
+
+    def write(self, request):
+        router.db_for_write(Classroom)
+        return self.read_db(request)
+
+    def test_reads_go_to_replica_only_where_enabled(self):
+        self.assertEqual(router.db_for_read(Classroom), "default")
+        with replicas.reads():
+            self.assertEqual(router.db_for_read(Classroom), "replica")
+            self.assertEqual(router.db_for_write(Classroom), "default")
+
+    def test_writer_sticks_to_primary(self):
+        requests = [self.request() for _ in range(3)]
+        replicas.ReplicaMiddleware(self.read_db)(requests[0])
+        replicas.ReplicaMiddleware(self.write)(requests[1])
+        replicas.ReplicaMiddleware(self.read_db)(requests[2])
+        self.assertEqual([r.read_db for r in requests], ["replica", "default", "default"])
+
+        other = self.request(user_id=2)
+        replicas.ReplicaMiddleware(self.read_db)(other)
+        self.assertEqual(other.read_db, "replica")
+
+    async def test_async_writer_sticks_to_primary(self):
+        async def write(request):
+            # Запись из потока sync_to_async видна запросу.
+            return await sync_to_async(self.write)(request)
+
+        async def read(request):
+            return self.read_db(request)
+
+        middleware = replicas.ReplicaMiddleware(write)
+        self.assertTrue(iscoroutinefunction(middleware))
+        first, second = self.request(), self.request()
+        await middleware(first)
+        await replicas.ReplicaMiddleware(read)(second)
+        self.assertEqual((first.read_db, second.read_db), ("default", "default"))
+
+
+class StudentSearchTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        for username, last_name, first_name in (
+            ("fedorov", "Фёдоров", "Иван"), ("fedotova", "Федотова", "Анна"), ("ivanov", "Иванов", "Пётр"),
+        ):
+            user = User.objects.create_user(username=username)
+            Profile.objects.create(user=user, role="student", last_name=last_name, first_name=first_name)
+
+    def usernames(self, query, page=1):
+        return [row["username"] for row in search.students(query, page)[0]]
+
+    def test_every_word_is_a_prefix_of_some_name(self):
+        self.assertEqual(self.usernames("фед"), ["fedorov", "fedotova"])
+        self.assertEqual(self.usernames("ФЁДОР"), ["fedorov"])
+        self.assertEqual(self.usernames("федо ив"), ["fedorov"])
+        self.assertEqual(self.usernames("iva"), ["ivanov"])
+        # Ученики, уже записанные в класс, не предлагаются.
+        self.assertEqual(self.usernames("student"), [])
+
+    def test_username_change_updates_the_search_key(self):
+        user = User.objects.get(username="ivanov")
+        user.username = "petrov"
+        user.save()
+        self.assertEqual(self.usernames("petr"), ["petrov"])
+
+    @override_settings(STUDENT_SEARCH_PAGE_SIZE=2)
+    def test_view_pages_results_for_teachers_only(self):
+        url = reverse("student_search")
+        self.client.force_login(self.teacher)
+        first = self.client.get(url, {"q": ""}).json()
+        second = self.client.get(url, {"q": "", "page": first["next"]}).json()
+        self.assertEqual([r["name"] for r in first["results"]], ["Иванов Пётр", "Фёдоров Иван"])
+        self.assertEqual((len(second["results"]), second["next"]), (1, None))
+        self.assertEqual(self.client.get(url, {"page": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"q": "", "page": 10**30}).json(), second)
+
+        self.client.force_login(self.students[0])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+def spin(seconds=0.1):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def spin_in_view():
+    spin()
+
+
+def spin_in_worker():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    finally:
+        connections.close_all()
+    spin()
+
+
+def spin_in_other_request(stop):
+    while not stop.is_set():
+        pass
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_INTERVAL=0.002)
+class ProfilingTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher.is_staff = True
+        self.teacher.save()
+
+    def request(self, user=None):
+        request = RequestFactory().get("/", {"_profile": "1"})
+        request.user = user or self.teacher
+        return request
+
+    def test_samples_only_threads_of_the_request(self):
+        def view(request):
+            Classroom.objects.count()
+            spin_in_view()
+            # Поток, из которого запрос ходил в базу, тоже сэмплируется.
+            async_to_sync(sync_to_async(spin_in_worker, thread_sensitive=False))()
+            return HttpResponse()
+
+        stop = threading.Event()
+        other = threading.Thread(target=spin_in_other_request, args=(stop,))
+        other.start()
+        try:
+            response = profiling.ProfilingMiddleware(view)(self.request())
+        finally:
+            stop.set()
+            other.join()
+
+        saved = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertIn("spin_in_view", saved.stacks)
+        self.assertIn("spin_in_worker", saved.stacks)
+        self.assertNotIn("spin_in_other_request", saved.stacks)
+        self.assertEqual(saved.query_count, 2)
+
+    def test_other_users_are_not_profiled(self):
+        response = profiling.ProfilingMiddleware(lambda request: HttpResponse())(self.request(self.students[0]))
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    async def test_async_request_samples_its_sync_worker(self):
+        async def view(request):
+            await sync_to_async(spin_in_view)()
+            return HttpResponse()
+
+        middleware = profiling.ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(self.request())
+
+        saved = await RequestProfile.objects.aget(pk=response["X-Profile-Id"])
+        self.assertIn("spin_in_view", saved.stacks)
+
+
+def filled_sheet(hw, student, marks):
+    # PNG первой страницы бланка с закрашенными кружками: marks — номер
+    # вопроса -> символ на каждую строку.
+    page = omr.layout(hw.questions)[0]
+    image = omr.render(page, omr.encode(hw.pk, student.pk, 1), [])
+    draw = ImageDraw.Draw(image)
+    r = omr.BUBBLE_RADIUS
+    for block in page:
+        for row, symbol in zip(block["centers"], marks.get(block["number"], "")):
+            x, y = row[block["symbols"].index(symbol)]
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=0)
+    buf = BytesIO()
+    image.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def zipped(files):
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buf.getvalue()
+
+
+class ScanTests(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(audit.flush)
+        self.hw = make_homework(self.classroom, ["Б", "42"], formats={2: "int"})
+
+    def sheet(self, student, choice="Б", number="42"):
+        return filled_sheet(self.hw, student, {"1": choice, "2": number})
+
+    def test_reads_code_and_marks(self):
+        result = omr.read_page(self.sheet(self.students[0]), omr.layout(self.hw.questions))
+        self.assertEqual(
+            (result["hw"], result["student"], result["page"], result["answers"]),
+            (self.hw.pk, self.students[0].pk, 1, {"1": "Б", "2": "42"}),
+        )
+
+    def test_unexpected_error_fails_only_its_page(self):
+        pages = [("bad.png", self.sheet(self.students[0])), ("good.png", self.sheet(self.students[1], "А"))]
+        read = omr.read
+
+        def fail_first(data, layout):
+            if data == pages[0][1]:
+                raise ZeroDivisionError
+            return read(data, layout)
+
+        with mock.patch.object(omr, "read", fail_first), self.assertLogs("homework.omr", "ERROR"):
+            report = scans.grade(self.hw, pages)
+
+        self.assertEqual(report["errors"], [("bad.png", "Не удалось разобрать лист")])
+        self.assertEqual(StudentSubmission.objects.get().student, self.students[1])
+
+    def test_grade_keeps_reviewed_work(self):
+        submit(self.students[0], self.hw, ["В", "1"], auto_score=0, final_score=2, graded=True)
+        pages = [(f"{s.pk}.png", self.sheet(s)) for s in self.students[:2]]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = scans.grade(self.hw, pages)
+
+        self.assertEqual([p.user_id for p in report["skipped"]], [self.students[0].pk])
+        self.assertEqual([(p.user_id, score) for p, score in report["saved"]], [(self.students[1].pk, 2)])
+        scores = dict(StudentSubmission.objects.values_list("student_id", "final_score"))
+        self.assertEqual(scores, {self.students[0].pk: 2, self.students[1].pk: 2})
+
+    def test_upsert_never_replaces_graded_row(self):
+        submit(self.students[0], self.hw, ["В", "1"], final_score=2, graded=True)
+        scan = StudentSubmission(student=self.students[0], homework_template=self.hw, final_score=0)
+        scan.set_answers(self.hw, {"1": "Б"})
+
+        self.assertEqual(ingest.upsert([scan], keep_graded=True), 0)
+        self.assertEqual(StudentSubmission.objects.get().final_score, 2)
+
+    @override_settings(SCAN_MAX_ZIP_DEPTH=2, SCAN_MAX_PAGES=2, SCAN_MAX_FILE_SIZE=10 ** 6)
+    def test_uploads_are_bounded(self):
+        page = self.sheet(self.students[0])
+        nested = zipped({"inner.zip": zipped({"a.png": page, "b.png": page})})
+        self.assertEqual(
+            [name for name, _ in scans.iter_pages("up.zip", nested)],
+            ["up.zip/inner.zip/a.png", "up.zip/inner.zip/b.png"],
+        )
+
+        limits = {
+            "глубоко": zipped({"1.zip": zipped({"2.zip": zipped({"a.png": page})})}),
+            "страниц": zipped({"a.png": page, "b.png": page, "c.png": page}),
+            "файл больше": zipped({"a.png": b"0" * (10 ** 6 + 1)}),
+        }
+        for message, data in limits.items():
+            with self.subTest(message), self.assertRaisesMessage(scans.ScanLimitError, message):
+                list(scans.iter_pages("up.zip", data))
+
+    def test_corrupt_member_is_a_page_error(self):
+        page = self.sheet(self.students[0])
+        data = bytearray(zipped({"a.png": page, "b.png": page}))
+        # Порча байта внутри данных первого файла: CRC не сойдётся.
+        start = data.index(page)
+        data[start + 100] ^= 0xFF
+        self.client.force_login(self.teacher)
+
+        upload = ContentFile(bytes(data), name="scans.zip")
+        response = self.client.post(reverse("homework_scans", args=[self.hw.pk]), {"scans": upload})
+
+        self.assertContains(response, "scans.zip/a.png")
+        self.assertContains(response, "Не изображение")
+        self.assertEqual(StudentSubmission.objects.get().student, self.students[0])
+
+        # Испорченное оглавление: архив не открывается целиком.
+        central = data.index(b"PK\x01\x02")
+        data[central:central + 4] = b"XXXX"
+        broken = ContentFile(bytes(data), name="broken.zip")
+        response = self.client.post(reverse("homework_scans", args=[self.hw.pk]), {"scans": broken})
+        self.assertContains(response, "архив повреждён")
+
+    def test_view_reports_limit_as_form_error(self):
+        self.client.force_login(self.teacher)
+        upload = ContentFile(zipped({"1.zip": zipped({"2.zip": zipped({"a.png": b""})})}), name="scans.zip")
+        with override_settings(SCAN_MAX_ZIP_DEPTH=1):
+            response = self.client.post(reverse("homework_scans", args=[self.hw.pk]), {"scans": upload})
+        self.assertContains(response, "слишком глубоко вложенный архив")
+        self.assertFalse(StudentSubmission.objects.exists())
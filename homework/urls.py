@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import include, path
 
 from . import views
 from .views import register_view, profile_view, login_view, logout_view, home_view, homework_demo_view, \
@@ -15,13 +15,24 @@ urlpatterns = [
     path("homework_list/", homework_list_view, name="homework_list"),
     path("profiles/<int:user_id>/", views.profile_detail, name="profile_detail"),
     path("classrooms/create/", views.classroom_create, name="classroom_create"),
+    path("students/search/", views.student_search_view, name="student_search"),
+    path("classroom/<int:pk>/analytics/", views.classroom_analytics_view, name="classroom_analytics"),
     path("classroom/<int:pk>/add_students/", views.classroom_add_students_view, name="classroom_add_students"),
     path("classroom/<int:classroom_id>/homework/create/", views.homework_create_view, name="homework_create"),
 
     path("homework/<int:hw_id>/", views.homework_detail_view, name="homework_detail"),
+    path("homework/<int:hw_id>/changes/", views.homework_changes_view, name="homework_changes"),
+    path("homework/<int:hw_id>/items/", views.homework_item_analysis_view, name="homework_item_analysis"),
+    path("homework/<int:hw_id>/similarity/", views.homework_similarity_view, name="homework_similarity"),
+    path("homework/<int:hw_id>/sheets.pdf", views.homework_sheets_pdf, name="homework_sheets_pdf"),
+    path("homework/<int:hw_id>/scans/", views.homework_scans_view, name="homework_scans"),
+    path("homework/<int:hw_id>/review/", views.homework_bulk_review_view, name="homework_bulk_review"),
     path("homework/<int:hw_id>/submit/", views.homework_submit_view, name="homework_submit"),
     path("homework/<int:hw_id>/submissions/<int:user_id>/", views.submission_review_view, name="submission_review"),
     path("profile/progress.png", my_progress_png, name="my_progress_png"),
     path("profiles/<int:user_id>/progress.png", views.student_progress_png, name="student_progress_png"),
     path("homeworks/<int:hw_id>/stats.png", views.homework_stats_png, name="homework_stats_png"),
+
+    path("api/v1/", include("homework.api_urls")),
+    path("metrics", views.metrics_view, name="metrics"),
 ]
\ No newline at end of file
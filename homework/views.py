@@ -1,19 +1,36 @@
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib import pyplot as plt
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
-from django.db import transaction
-from django.http import HttpResponseForbidden, HttpResponse
-from django.shortcuts import render, redirect, get_object_or_404
-
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import Http404, HttpResponseForbidden, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.utils import timezone
+
+from homework import analytics, answer_sheet, audit, charts, ingest, metrics, notifications, scans, search, tenants
+from homework.item_analysis import item_analysis
+from homework.caching import bump_homework_data
+from homework.replicas import replica_reads
+from homework.permissions import attach_users, get_profile, homework_role, profile_name
+from homework.similarity import similarity_report
+from homework.auth import forget_cached_users
 from homework.forms import (
     RegisterForm, DemoHomeworkForm, ClassroomCreateForm, AddStudentsToClassForm,
-    HomeworkTemplateCreateForm, QuestionFormSet, AnswerFormSet, ReviewAnswerFormSet, SubmissionScoreForm
+    HomeworkTemplateCreateForm, QuestionFormSet, AnswerFormSet, ReviewAnswerFormSet, SubmissionScoreForm,
+    BulkReviewFormSet, ScanUploadForm
+)
+from homework.grading import calc_auto_score, grade_for_score
+from homework.models import (
+    Profile, Classroom, HomeworkTemplate, GradeScale, StudentSubmission, Notification, PerformanceSnapshot,
+    NotificationOutbox, UserTenant,
 )
-from homework.models import Profile, Classroom, HomeworkTemplate, GradeScale, StudentSubmission
+from homework.previews import schedule_previews
 
 
 DEMO_QUESTIONS = [
@@ -24,6 +41,8 @@ DEMO_QUESTIONS = [
 
 BASE_ROLE = "student"
 
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
 
 def home_view(request):
     if request.method == "POST":
@@ -48,6 +67,8 @@ def register_view(request):
         form = RegisterForm(request.POST)
         if form.is_valid():
             user = form.save()
+            if tenants.current():
+                UserTenant.objects.create(user=user, tenant=tenants.current())
             Profile.objects.create(
                 user=user,
                 role=BASE_ROLE,
@@ -84,7 +105,6 @@ def logout_view(request):
 
 
 @login_required
-@transaction.atomic
 def classroom_create(request):
     if request.user.profile.role != "teacher":
         return redirect("home")
@@ -92,13 +112,15 @@ def classroom_create(request):
     if request.method == "POST":
         form = ClassroomCreateForm(request.POST)
         if form.is_valid():
-            classroom = form.save(commit=False)
-            classroom.teacher = request.user
-            classroom.save()
+            with tenants.atomic():
+                classroom = form.save(commit=False)
+                classroom.teacher = request.user
+                classroom.save()
 
-            selected_students = form.cleaned_data.get("students")
-            if selected_students:
-                Profile.objects.filter(user__in=selected_students, role="student").update(classroom=classroom)
+                student_ids = [u.pk for u in form.cleaned_data.get("students") or []]
+                if student_ids:
+                    Profile.objects.filter(user_id__in=student_ids, role="student").update(classroom=classroom)
+                    forget_cached_users(student_ids)
 
             return redirect("profile")
     else:
@@ -107,6 +129,19 @@ def classroom_create(request):
     return render(request, "homework/classroom_create.html", {"form": form})
 
 
+@login_required
+def student_search_view(request):
+    if request.user.profile.role != "teacher":
+        return HttpResponseForbidden()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    results, next_page = search.students(request.GET.get("q", ""), page)
+    return JsonResponse({"results": results, "next": next_page})
+
+
 @login_required
 def classroom_detail_view(request, pk):
     classroom = get_object_or_404(Classroom, pk=pk)
@@ -114,16 +149,15 @@ def classroom_detail_view(request, pk):
     if request.method == "POST":
         form = AddStudentsToClassForm(request.POST)
         if form.is_valid():
-            users = form.cleaned_data["students"]
-            for u in users:
-                u.profile.classroom = classroom
-                u.profile.save()
+            student_ids = [u.pk for u in form.cleaned_data["students"]]
+            Profile.objects.filter(user_id__in=student_ids, classroom__isnull=True).update(classroom=classroom)
+            forget_cached_users(student_ids)
             return redirect("classroom_detail", pk=classroom.pk)
     else:
         form = AddStudentsToClassForm()
 
     students = Profile.objects.filter(role="student", classroom=classroom).order_by("last_name", "first_name")
-    teacher_profile = Profile.objects.filter(user=classroom.teacher).first()
+    teacher_profile = Profile.objects.filter(user_id=classroom.teacher_id).first()
 
     return render(request, "homework/classroom_detail.html", {
         "classroom": classroom,
@@ -133,6 +167,37 @@ def classroom_detail_view(request, pk):
     })
 
 
+@login_required
+@replica_reads
+def classroom_analytics_view(request, pk):
+    classroom = get_object_or_404(Classroom, pk=pk)
+
+    if classroom.teacher_id != request.user.id:
+        return HttpResponseForbidden()
+
+    snapshots = PerformanceSnapshot.objects.filter(classroom=classroom)
+    terms = list(snapshots.filter(student=None, period="term").order_by("-period_start"))
+    weeks = list(
+        snapshots.filter(student=None, period="week").order_by("-period_start")[:settings.ANALYTICS_WEEKS_SHOWN]
+    )
+
+    selected_term = None
+    if terms:
+        selected_term = next((t for t in terms if t.period_start.isoformat() == request.GET.get("term")), terms[0])
+    term_start = getattr(selected_term, "period_start", None)
+    students = attach_users(list(snapshots.filter(student__isnull=False, period="term", period_start=term_start)))
+    students.sort(key=lambda row: profile_name(row.student))
+
+    return render(request, "homework/classroom_analytics.html", {
+        "classroom": classroom,
+        "terms": terms,
+        "weeks": weeks,
+        "selected_term": selected_term,
+        "students": students,
+        "updated_at": max((t.updated_at for t in terms), default=None),
+    })
+
+
 @login_required
 def classroom_add_students_view(request, pk):
     classroom = get_object_or_404(Classroom, pk=pk)
@@ -140,10 +205,9 @@ def classroom_add_students_view(request, pk):
     if request.method == "POST":
         form = AddStudentsToClassForm(request.POST)
         if form.is_valid():
-            users = form.cleaned_data["students"]
-            for u in users:
-                u.profile.classroom = classroom
-                u.profile.save()
+            student_ids = [u.pk for u in form.cleaned_data["students"]]
+            Profile.objects.filter(user_id__in=student_ids, classroom__isnull=True).update(classroom=classroom)
+            forget_cached_users(student_ids)
             return redirect("classroom_detail", pk=classroom.pk)
     else:
         form = AddStudentsToClassForm()
@@ -159,11 +223,17 @@ def profile_view(request):
     profile = request.user.profile
     teacher_classes = request.user.teacher_classrooms.all()
     student_class = profile.classroom
+    user_notifications = list(request.user.notifications.all()[:10])
+
+    unread = [n.pk for n in user_notifications if not n.is_read]
+    if unread:
+        Notification.objects.filter(pk__in=unread).update(is_read=True)
 
     return render(request, "homework/profile.html", {
         "profile": profile,
         "teacher_classes": teacher_classes,
         "student_class": student_class,
+        "notifications": user_notifications,
     })
 
 
@@ -177,17 +247,31 @@ def profile_detail(request, user_id):
     })
 
 
+async def _auser_profile(request):
+    user = await request.auser()
+    request.user = user
+    if User.profile.related.is_cached(user):
+        return user, getattr(user, "profile", None)
+    profile = await Profile.objects.select_related("classroom").filter(user=user).afirst()
+    return user, profile
+
+
 @login_required
-def homework_list_view(request):
-    user = request.user
-    profile = user.profile
+@replica_reads
+async def homework_list_view(request):
+    user, profile = await _auser_profile(request)
+    if profile is None:
+        return HttpResponseForbidden()
 
     if profile.role == "teacher":
         classrooms = Classroom.objects.filter(teacher=user)
     else:
         classrooms = Classroom.objects.filter(pk=profile.classroom_id) if profile.classroom_id else Classroom.objects.none()
 
-    homeworks = HomeworkTemplate.objects.filter(classroom__in=classrooms).distinct()
+    homeworks = [
+        hw async for hw in
+        HomeworkTemplate.objects.filter(classroom__in=classrooms).select_related("classroom").distinct()
+    ]
 
     return render(request, "homework/homework_list.html", {
         "homeworks": homeworks,
@@ -236,6 +320,7 @@ def homework_create_view(request, classroom_id):
                 hw.questions = questions
                 hw.correct_answers = correct
                 hw.save()
+                schedule_previews(hw)
 
                 return redirect("classroom_detail", pk=classroom.id)
     else:
@@ -250,138 +335,263 @@ def homework_create_view(request, classroom_id):
 
 
 @login_required
-def homework_detail_view(request, hw_id):
-    hw = get_object_or_404(HomeworkTemplate, pk=hw_id)
+async def homework_detail_view(request, hw_id):
+    hw = await aget_object_or_404(HomeworkTemplate.objects.select_related("classroom"), pk=hw_id)
 
-    profile = getattr(request.user, "profile", None)
-    if profile is None:
-        return HttpResponseForbidden()
-
-    if profile.role == "teacher":
-        if hw.classroom.teacher_id != request.user.id:
-            return HttpResponseForbidden()
+    user, profile = await _auser_profile(request)
+    role = homework_role(user, profile, hw)
 
+    if role == "teacher":
         students = (
             Profile.objects
             .filter(role="student", classroom=hw.classroom)
-            .select_related("user")
             .order_by("last_name", "first_name")
         )
 
-        submissions = StudentSubmission.objects.filter(homework_template=hw).select_related("student")
-        sub_by_user_id = {s.student_id: s for s in submissions}
+        submissions = StudentSubmission.objects.filter(homework_template=hw)
+        sub_by_user_id = {s.student_id: s async for s in submissions}
+        latest = max(sub_by_user_id.values(), key=lambda s: (s.updated_at, s.id), default=None)
 
         rows = []
-        for st in students:
+        async for st in students:
             sub = sub_by_user_id.get(st.user_id)
             rows.append({
                 "student_profile": st,
-                "submitted": sub is not None,
+                # Нулевая сдача после дедлайна (deadlines.close_due) — не сдал.
+                "submitted": sub is not None and not sub.is_missing,
                 "submission": sub,
             })
 
         return render(request, "homework/homework_detail_teacher.html", {
             "hw": hw,
             "rows": rows,
+            "changes_cursor": _encode_cursor(latest),
         })
 
-    if profile.role == "student":
-        if profile.classroom_id != hw.classroom_id:
-            return HttpResponseForbidden()
+    if role == "student":
         return redirect("homework_submit", hw_id=hw.id)
 
     return HttpResponseForbidden()
 
 
+def _encode_cursor(submission):
+    if submission is None:
+        return "0.0"
+    micros = (submission.updated_at - CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}.{submission.id}"
+
+
+def _decode_cursor(value):
+    micros, _, pk = value.partition(".")
+    return CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(pk)
+
+
 @login_required
-def homework_submit_view(request, hw_id):
-    hw = get_object_or_404(HomeworkTemplate, pk=hw_id)
+async def homework_changes_view(request, hw_id):
+    hw = await aget_object_or_404(HomeworkTemplate.objects.select_related("classroom"), pk=hw_id)
 
-    if not hasattr(request.user, "profile") or request.user.profile.role != "student":
+    user, profile = await _auser_profile(request)
+    if homework_role(user, profile, hw) != "teacher":
         return HttpResponseForbidden()
-    if request.user.profile.classroom_id != hw.classroom_id:
+
+    cursor = request.GET.get("cursor", "0.0")
+    try:
+        since, since_id = _decode_cursor(cursor)
+        wait = float(request.GET.get("wait", 0))
+    except (ValueError, OverflowError):
+        return HttpResponseBadRequest()
+    if not math.isfinite(wait):
+        return HttpResponseBadRequest()
+    # Под WSGI ожидание держит поток воркера на весь запрос: долгий опрос
+    # только в ASGI-развёртывании, под WSGI клиент опрашивает реже.
+    asgi = isinstance(request, ASGIRequest)
+    wait = min(max(wait, 0), settings.CHANGE_FEED_MAX_WAIT if asgi else settings.CHANGE_FEED_WSGI_MAX_WAIT)
+
+    submissions = (
+        StudentSubmission.objects
+        .filter(homework_template=hw)
+        .only("id", "student_id", "auto_score", "final_score", "graded", "is_missing", "updated_at")
+        .order_by("updated_at", "id")
+    )
+    after_cursor = Q(updated_at__gt=since) | Q(updated_at=since, id__gt=since_id)
+    qs = submissions.filter(after_cursor)[:settings.CHANGE_FEED_PAGE_SIZE]
+    # updated_at ставится до коммита: транзакция, закоммиченная позже
+    # с более ранним временем, оказалась бы позади курсора. Поэтому строки
+    # за последние CHANGE_FEED_OVERLAP с перед курсором отдаются повторно,
+    # клиент отбрасывает уже виденные по (id, updated).
+    overlap = submissions.filter(
+        ~after_cursor, updated_at__gt=since - timedelta(seconds=settings.CHANGE_FEED_OVERLAP),
+    )[:settings.CHANGE_FEED_PAGE_SIZE]
+
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + wait
+    while True:
+        changes = [s async for s in qs]
+        if changes or loop.time() >= give_up_at:
+            break
+        await asyncio.sleep(settings.CHANGE_FEED_POLL_INTERVAL)
+    repeated = [s async for s in overlap]
+
+    return JsonResponse({
+        "cursor": _encode_cursor(changes[-1]) if changes else cursor,
+        "poll_after": 0 if asgi else settings.CHANGE_FEED_WSGI_POLL_DELAY,
+        "changes": [
+            {
+                "id": s.id,
+                "updated": _encode_cursor(s),
+                "student_id": s.student_id,
+                "auto_score": s.auto_score,
+                "final_score": s.final_score,
+                "graded": s.graded,
+                "is_missing": s.is_missing,
+            }
+            for s in repeated + changes
+        ],
+    })
+
+
+@login_required
+@replica_reads
+def homework_item_analysis_view(request, hw_id):
+    hw = get_object_or_404(HomeworkTemplate.objects.select_related("classroom"), pk=hw_id)
+
+    if hw.classroom.teacher_id != request.user.id:
         return HttpResponseForbidden()
 
-    submission = StudentSubmission.objects.filter(
-        homework_template=hw, student=request.user
-    ).first()
+    return render(request, "homework/homework_item_analysis.html", {
+        "hw": hw,
+        "report": item_analysis(hw),
+    })
+
+
+@login_required
+def homework_sheets_pdf(request, hw_id):
+    hw = get_object_or_404(HomeworkTemplate.objects.select_related("classroom"), pk=hw_id)
+
+    if hw.classroom.teacher_id != request.user.id:
+        return HttpResponseForbidden()
+
+    pdf = scans.sheets_pdf(hw)
+    if pdf is None:
+        raise Http404("В классе нет учеников")
+    response = HttpResponse(pdf, content_type="application/pdf")
+    response["Content-Disposition"] = f'attachment; filename="sheets-{hw.pk}.pdf"'
+    return response
 
-    initial = [{"number": q["number"]} for q in (hw.questions or [])]
 
+@login_required
+def homework_scans_view(request, hw_id):
+    hw = get_object_or_404(HomeworkTemplate.objects.select_related("classroom"), pk=hw_id)
+
+    if hw.classroom.teacher_id != request.user.id:
+        return HttpResponseForbidden()
+
+    report = None
     if request.method == "POST":
-        formset = AnswerFormSet(request.POST, prefix="a", initial=initial)
-        if formset.is_valid():
-            answers = {}
-            for row in formset.cleaned_data:
-                num = row["number"]
-                answers[str(num)] = (row["answer"] or "").strip()
-
-            correct_map = hw.correct_answers or {}
-            auto_score = 0
-
-            def get_correct(num):
-                if isinstance(correct_map, dict):
-                    return correct_map.get(str(num)) or correct_map.get(num) or ""
-                return ""
-
-            for q in (hw.questions or []):
-                num = q["number"]
-                fmt = q.get("answer_format", "text")
-
-                stud = (answers.get(str(num)) or answers.get(num) or "").strip()
-                corr = (get_correct(num) or "").strip()
-
-                if fmt == "text":
-                    if stud.casefold() == corr.casefold():
-                        auto_score += 1
-                elif fmt == "int":
-                    try:
-                        if int(stud) == int(corr):
-                            auto_score += 1
-                    except (TypeError, ValueError):
-                        pass
-                elif fmt == "float":
-                    try:
-                        s = float(stud.replace(",", "."))
-                        c = float(corr.replace(",", "."))
-                        if abs(s - c) < 1e-6:
-                            auto_score += 1
-                    except (TypeError, ValueError):
-                        pass
-
-            if submission is None:
-                submission = StudentSubmission.objects.create(
-                    student=request.user,
-                    homework_template=hw,
-                    answers=answers,
-                    auto_score=auto_score,
-                    final_score=auto_score,
-                    graded=False,
-                )
+        form = ScanUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            budget = {"pages": 0, "bytes": 0}
+            try:
+                pages = [
+                    page
+                    for upload in form.cleaned_data["scans"]
+                    for page in scans.iter_pages(upload.name, upload.read(), budget)
+                ]
+            except scans.ScanError as exc:
+                form.add_error("scans", str(exc))
+            else:
+                report = scans.grade(hw, pages, actor=request.user)
+                form = ScanUploadForm()
+    else:
+        form = ScanUploadForm()
+
+    return render(request, "homework/homework_scans.html", {
+        "hw": hw,
+        "form": form,
+        "report": report,
+    })
+
+
+@login_required
+@replica_reads
+def homework_similarity_view(request, hw_id):
+    hw = get_object_or_404(HomeworkTemplate.objects.select_related("classroom"), pk=hw_id)
+
+    if hw.classroom.teacher_id != request.user.id:
+        return HttpResponseForbidden()
+
+    report = similarity_report(hw)
+    student_ids = {p["first"] for p in report["pairs"]} | {p["second"] for p in report["pairs"]}
+    profiles = Profile.objects.in_bulk(student_ids, field_name="user_id")
+
+    pairs = [
+        {**pair, "first_profile": profiles.get(pair["first"]), "second_profile": profiles.get(pair["second"])}
+        for pair in report["pairs"]
+    ]
+
+    return render(request, "homework/homework_similarity.html", {
+        "hw": hw,
+        "students": report["students"],
+        "pairs": pairs,
+    })
+
+
+@login_required
+def homework_submit_view(request, hw_id):
+    hw = get_object_or_404(HomeworkTemplate.objects.select_related("classroom"), pk=hw_id)
+
+    if not hasattr(request.user, "profile") or request.user.profile.role != "student":
+        return HttpResponseForbidden()
+    if request.user.profile.classroom_id != hw.classroom_id:
+        return HttpResponseForbidden()
+
+    batched = settings.SUBMISSION_INGEST_MODE == "batched"
+    submission = ingest.pending(request.user.id, hw.id) if batched else None
+    if submission is None:
+        submission = StudentSubmission.objects.filter(
+            homework_template=hw, student=request.user
+        ).first()
+
+    closed = hw.is_closed
+    errors = None
+    if request.method == "POST" and not closed:
+        answers, errors = answer_sheet.clean(hw, request.POST, "a", AnswerFormSet)
+        if not errors:
+            auto_score = calc_auto_score(hw, answers)
+
+            if batched:
+                # Событие журнала пишет сброс буфера — для строк, которые
+                # upsert действительно записал.
+                ingest.enqueue(request.user, hw, answers, auto_score)
             else:
-                submission.answers = answers
+                old_score = submission.final_score if submission is not None else None
+                if submission is None:
+                    submission = StudentSubmission(student=request.user, homework_template=hw)
+                submission.set_answers(hw, answers)
                 submission.auto_score = auto_score
                 submission.final_score = auto_score
                 submission.graded = False
-                submission.save()
+                submission.is_missing = False
+                with tenants.atomic():
+                    submission.save()
+                    audit.record("auto", hw, request.user.id, auto_score, auto_score, old_score=old_score)
 
             return redirect("homework_list")
+        values = answer_sheet.posted_values(hw, request.POST, "a")
     else:
-        if submission:
-            initial = [{"number": q["number"], "answer": (submission.answers or {}).get(str(q["number"]), "")}
-                       for q in (hw.questions or [])]
-        formset = AnswerFormSet(prefix="a", initial=initial)
+        values = answer_sheet.stored_values(hw, submission)
 
     return render(request, "homework/homework_submit.html", {
         "hw": hw,
-        "formset": formset,
+        "sheet": answer_sheet.build(hw, "a", values, errors),
         "submission": submission,
+        "closed": closed,
     })
 
 
 @login_required
 def submission_review_view(request, hw_id, user_id):
-    hw = get_object_or_404(HomeworkTemplate, pk=hw_id)
+    hw = get_object_or_404(HomeworkTemplate.objects.select_related("classroom", "grade_scale"), pk=hw_id)
 
     if hw.classroom.teacher_id != request.user.id:
         return HttpResponseForbidden()
@@ -399,222 +609,224 @@ def submission_review_view(request, hw_id, user_id):
         submission = StudentSubmission(
             homework_template=hw,
             student=student_profile.user,
-            answers={},
+            answers=[],
             auto_score=0,
             final_score=0,
             graded=False,
         )
 
-    initial_rows = [
-        {
-            "number": q["number"],
-            "answer": (submission.answers or {}).get(str(q["number"]), ""),
-        }
-        for q in (hw.questions or [])
-    ]
-
+    errors = None
     if request.method == "POST":
-        formset = ReviewAnswerFormSet(request.POST, prefix="r", initial=initial_rows)
+        answers, errors = answer_sheet.clean(hw, request.POST, "r", ReviewAnswerFormSet, validate=False)
         score_form = SubmissionScoreForm(request.POST)
 
-        if formset.is_valid() and score_form.is_valid():
-            answers = {}
-            for row in formset.cleaned_data:
-                num = row["number"]
-                answers[str(num)] = (row["answer"] or "").strip()
-
-            auto_score = _calc_auto_score(hw, answers)
+        if not errors and score_form.is_valid():
+            auto_score = calc_auto_score(hw, answers)
             final_score = score_form.cleaned_data["final_score"]
 
-            if submission.pk is None:
-                submission = StudentSubmission.objects.create(
-                    homework_template=hw,
-                    student=student_profile.user,
-                    answers=answers,
-                    auto_score=auto_score,
-                    final_score=final_score,
-                    graded=True,
+            with tenants.atomic():
+                audit.record(
+                    "review", hw, submission.student_id, final_score, auto_score,
+                    old_score=submission.final_score if submission.pk else None,
+                    actor=request.user,
                 )
-            else:
-                submission.answers = answers
+                submission.set_answers(hw, answers)
                 submission.auto_score = auto_score
                 submission.final_score = final_score
+                submission.grade = grade_for_score(hw, final_score)
                 submission.graded = True
                 submission.save()
 
+                notifications.enqueue_graded(hw, [submission])
+
             return redirect("homework_detail", hw_id=hw.id)
+        values = answer_sheet.posted_values(hw, request.POST, "r")
     else:
-        formset = ReviewAnswerFormSet(prefix="r", initial=initial_rows)
         score_form = SubmissionScoreForm(initial={"final_score": submission.final_score})
+        values = answer_sheet.stored_values(hw, submission)
 
     return render(request, "homework/submission_review.html", {
         "hw": hw,
         "student_profile": student_profile,
         "submission": submission,
-        "formset": formset,
+        "sheet": answer_sheet.build(hw, "r", values, errors),
         "score_form": score_form,
+        "history": audit.history(hw, submission.student_id) if submission.pk else [],
     })
 
 
-def _calc_auto_score(hw, answers):
-    correct_map = hw.correct_answers or {}
-    auto_score = 0
+BULK_REVIEW_FIELDS = ["final_score", "grade", "teacher_comment", "graded", "updated_at"]
 
-    def get_correct(num):
-        if isinstance(correct_map, dict):
-            return correct_map.get(str(num)) or correct_map.get(num) or ""
-        return ""
 
-    for q in (hw.questions or []):
-        num = q["number"]
-        fmt = q.get("answer_format", "text")
+@login_required
+def homework_bulk_review_view(request, hw_id):
+    hw = get_object_or_404(HomeworkTemplate.objects.select_related("classroom", "grade_scale"), pk=hw_id)
 
-        stud = (answers.get(str(num)) or answers.get(num) or "").strip()
-        corr = (get_correct(num) or "").strip()
+    if homework_role(request.user, get_profile(request.user), hw) != "teacher":
+        return HttpResponseForbidden()
 
-        if fmt == "text":
-            if stud.casefold() == corr.casefold():
-                auto_score += 1
-        elif fmt == "int":
-            try:
-                if int(stud) == int(corr):
-                    auto_score += 1
-            except (TypeError, ValueError):
-                pass
-        elif fmt == "float":
-            try:
-                s = float(stud.replace(",", "."))
-                c = float(corr.replace(",", "."))
-                if abs(s - c) < 1e-6:
-                    auto_score += 1
-            except (TypeError, ValueError):
-                pass
+    submissions = attach_users(list(StudentSubmission.objects.filter(homework_template=hw).defer("answers")))
+    submissions.sort(key=lambda s: profile_name(s.student))
+    by_student = {s.student_id: s for s in submissions}
+    initial = [
+        {
+            "student_id": s.student_id,
+            "final_score": s.final_score,
+            "grade": s.grade,
+            "teacher_comment": s.teacher_comment,
+        }
+        for s in submissions
+    ]
+    form_kwargs = {"max_score": hw.max_score}
 
-    return auto_score
+    if request.method == "POST":
+        formset = BulkReviewFormSet(request.POST, initial=initial, form_kwargs=form_kwargs)
+        action = request.POST.get("action")
+
+        changed = []
+        old_scores = {s.pk: s.final_score for s in submissions}
+        if action == "accept_auto":
+            for s in submissions:
+                if not s.graded:
+                    s.final_score = s.auto_score
+                    s.grade = grade_for_score(hw, s.auto_score)
+                    s.graded = True
+                    changed.append(s)
+        elif formset.is_valid():
+            for form in formset:
+                s = by_student.get(form.cleaned_data["student_id"])
+                if s is None:
+                    return HttpResponseBadRequest()
+                data = form.cleaned_data
+                grade = data["grade"] or grade_for_score(hw, data["final_score"])
+                if s.graded and (s.final_score, s.grade, s.teacher_comment) == (
+                    data["final_score"], grade, data["teacher_comment"]
+                ):
+                    continue
+                s.final_score = data["final_score"]
+                s.grade = grade
+                s.teacher_comment = data["teacher_comment"]
+                s.graded = True
+                changed.append(s)
+        else:
+            changed = None
+
+        if changed is not None:
+            if changed:
+                # bulk_update не вызывает save(), поэтому auto_now и сигналы
+                # приходится отрабатывать вручную.
+                now = timezone.now()
+                for s in changed:
+                    s.updated_at = now
+                with tenants.atomic():
+                    StudentSubmission.objects.bulk_update(changed, BULK_REVIEW_FIELDS)
+                    notifications.enqueue_graded(hw, changed)
+                    for s in changed:
+                        audit.record(
+                            "bulk", hw, s.student_id, s.final_score, s.auto_score,
+                            old_score=old_scores[s.pk], actor=request.user,
+                        )
+                bump_homework_data([hw.id])
+            return redirect("homework_detail", hw_id=hw.id)
+    else:
+        formset = BulkReviewFormSet(initial=initial, form_kwargs=form_kwargs)
 
+    return render(request, "homework/homework_bulk_review.html", {
+        "hw": hw,
+        "rows": list(zip(submissions, formset.forms)),
+        "formset": formset,
+        "ungraded": sum(1 for s in submissions if not s.graded),
+    })
 
-@login_required
-def student_progress_png(request, user_id: int):
-    student = get_object_or_404(User, pk=user_id)
 
+async def _progress_rows(student):
     qs = (
         StudentSubmission.objects
         .filter(student=student)
         .select_related("homework_template")
         .order_by("homework_template__deadline")
     )
-
-    labels = [s.homework_template.title for s in qs]
-    scores = [s.final_score for s in qs]
-    max_scores = [s.homework_template.max_score for s in qs]
-
-    fig, ax = plt.subplots(figsize=(10, 3))
-
-    if scores:
-        ax.plot(range(len(scores)), scores, marker="o", label="Итог")
-        ax.plot(range(len(max_scores)), max_scores, linestyle="--", label="Макс.")
-        ax.set_xticks(range(len(labels)))
-        ax.set_xticklabels(labels, rotation=20, ha="right")
-    else:
-        ax.text(0.5, 0.5, "Нет сданных работ", ha="center", va="center")
-        ax.set_xticks([])
-        ax.set_yticks([])
-
-    ax.set_title(f"Успеваемость ученика: {student.last_name} {student.first_name}")
-    ax.set_ylabel("Баллы")
-    ax.grid(True, alpha=0.3)
-    ax.legend()
-
-    response = HttpResponse(content_type="image/png")
-    fig.tight_layout()
-    fig.savefig(response, format="png")
-    plt.close(fig)
-    return response
+    return [s async for s in qs]
+
+
+async def _progress_png(student, subs):
+    bands = await analytics.ascore_bands([s.homework_template_id for s in subs])
+    return await charts.render(
+        charts.progress_png,
+        f"Успеваемость ученика: {student.last_name} {student.first_name}",
+        [s.homework_template.title for s in subs],
+        [s.final_score for s in subs],
+        [s.homework_template.max_score for s in subs],
+        [bands[s.homework_template_id] for s in subs],
+    )
 
 
 @login_required
-def my_progress_png(request):
-    qs = (
-        StudentSubmission.objects
-        .filter(student=request.user)
-        .select_related("homework_template")
-        .order_by("homework_template__deadline")
-    )
-
-    labels = [s.homework_template.title for s in qs]
-    scores = [s.final_score for s in qs]
-    max_scores = [s.homework_template.max_score for s in qs]
+@replica_reads
+async def student_progress_png(request, user_id: int):
+    student = await aget_object_or_404(User, pk=user_id)
+    subs = await _progress_rows(student)
+    png = await _progress_png(student, subs)
+    return HttpResponse(png, content_type="image/png")
 
-    fig, ax = plt.subplots(figsize=(10, 3))
 
-    if scores:
-        ax.plot(range(len(scores)), scores, marker="o", label="Итог")
-        ax.plot(range(len(max_scores)), max_scores, linestyle="--", label="Макс.")
-        ax.set_xticks(range(len(labels)))
-        ax.set_xticklabels(labels, rotation=20, ha="right")
-    else:
-        ax.text(0.5, 0.5, "Нет сданных работ", ha="center", va="center")
-        ax.set_xticks([])
-        ax.set_yticks([])
-
-    ax.set_title(f"Успеваемость ученика: {request.user.last_name} {request.user.first_name}")
-    ax.set_ylabel("Баллы")
-    ax.grid(True, alpha=0.3)
-    ax.legend()
-
-    response = HttpResponse(content_type="image/png")
-    fig.tight_layout()
-    fig.savefig(response, format="png")
-    plt.close(fig)
-    return response
+@login_required
+@replica_reads
+async def my_progress_png(request):
+    user = await request.auser()
+    subs = await _progress_rows(user)
+    png = await _progress_png(user, subs)
+    return HttpResponse(png, content_type="image/png")
 
 
 @login_required
-def homework_stats_png(request, hw_id: int):
-    hw = get_object_or_404(HomeworkTemplate, pk=hw_id)
+@replica_reads
+async def homework_stats_png(request, hw_id: int):
+    hw = await aget_object_or_404(HomeworkTemplate, pk=hw_id)
 
     mode = request.GET.get("mode", "bar")
 
-    qs = (
-        StudentSubmission.objects
-        .filter(homework_template=hw)
-        .select_related("student__profile")
-        .order_by("-final_score")
+    subs = [s async for s in StudentSubmission.objects.filter(homework_template=hw).order_by("-final_score")]
+    profiles = {
+        p.user_id: p async for p in Profile.objects.filter(user_id__in=[s.student_id for s in subs])
+    }
+
+    png = await charts.render(
+        charts.homework_stats_png,
+        hw.title,
+        hw.max_score,
+        mode,
+        [s.final_score for s in subs],
+        [
+            f"{profiles[s.student_id].last_name} {profiles[s.student_id].first_name}" if s.student_id in profiles else ""
+            for s in subs
+        ],
     )
+    return HttpResponse(png, content_type="image/png")
 
-    fig, ax = plt.subplots(figsize=(10, 3.5))
 
-    if not qs.exists():
-        ax.text(0.5, 0.5, "Нет сданных работ", ha="center", va="center")
-        ax.set_xticks([])
-        ax.set_yticks([])
-    else:
-        scores = [s.final_score for s in qs]
-
-        if mode == "hist":
-            bins = min(10, max(3, hw.max_score or 10))
-            ax.hist(scores, bins=bins)
-            ax.set_title(f"Распределение итоговых баллов: {hw.title}")
-            ax.set_xlabel("Итоговый балл")
-            ax.set_ylabel("Количество работ")
-        else:
-            names = [
-                f"{s.student.profile.last_name} {s.student.profile.first_name}"
-                for s in qs
-            ]
-            ax.bar(range(len(scores)), scores)
-            ax.set_title(f"Кто сколько набрал: {hw.title}")
-            ax.set_ylabel("Итоговый балл")
-            ax.set_xticks(range(len(names)))
-            ax.set_xticklabels(names, rotation=25, ha="right")
-
-        ax.grid(True, axis="y", alpha=0.25)
-
-    response = HttpResponse(content_type="image/png")
-    fig.tight_layout()
-    fig.savefig(response, format="png")
-    plt.close(fig)
-    return response
+def _client_ip(request):
+    # Прокси дописывает адрес клиента в конец X-Forwarded-For; всё левее
+    # последнего недоверенного адреса клиент мог подставить сам.
+    addr = request.META.get("REMOTE_ADDR")
+    if addr not in settings.METRICS_TRUSTED_PROXIES:
+        return addr
+    forwarded = [a.strip() for a in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if a.strip()]
+    for addr in reversed(forwarded):
+        if addr not in settings.METRICS_TRUSTED_PROXIES:
+            return addr
+    return None
+
+
+def metrics_view(request):
+    if _client_ip(request) not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+
+    backlog = NotificationOutbox.objects.filter(processed_at__isnull=True).count()
+    body = metrics.render() + metrics.gauge_lines(
+        "homework_notification_outbox_backlog", "Неотправленные уведомления", backlog
+    )
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 def homework_demo_view():
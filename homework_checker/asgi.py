@@ -3,6 +3,13 @@ ASGI config for homework_checker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The read-heavy pages and PNG charts are async views, so a few worker
+processes can serve many concurrent students, e.g.:
+
+    uvicorn homework_checker.asgi:application --workers 4
+
+Compare against the WSGI path with ``manage.py loadtest``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -50,11 +50,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'homework.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'homework.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'homework.tenants.TenantMiddleware',
+    'homework.replicas.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'homework.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +96,50 @@ DATABASES = {
 }
 
 
+# Schools with separate databases: {"name": {"hosts": [...]}}, each name also
+# being an alias in DATABASES. Empty means a single database; see
+# settings_tenants.py for a multi-database setup.
+
+TENANTS = {}
+
+
+# Read replicas: {"primary alias": "replica alias"}. Only views marked with
+# replica_reads (charts, lists, analytics) and the rollup refresh read from
+# them; see settings_replica.py. A user who wrote something keeps reading
+# from the primary for READ_REPLICA_STICKY_SECONDS, and reports built from
+# replica data are cached for at most READ_REPLICA_CACHE_TIMEOUT.
+
+READ_REPLICAS = {}
+READ_REPLICA_STICKY_SECONDS = 10
+READ_REPLICA_CACHE_TIMEOUT = 60
+
+
+# Cache
+# LocMemCache is per process: with several workers point this at a shared
+# backend (Memcached/Redis) so user cache invalidation reaches every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# Sessions and authentication
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# ModelBackend stays as a fallback: sessions created before the cached
+# backend store its path and would otherwise be logged out
+
+AUTHENTICATION_BACKENDS = [
+    'homework.auth.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+AUTH_USER_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -127,6 +176,190 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# `collectstatic` writes fingerprinted names plus .gz/.br copies; the
+# static middleware serves them with a year-long immutable Cache-Control
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'homework.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+
+# Homework attachment previews
+
+HOMEWORK_PREVIEW_WIDTHS = (320, 640, 1280)
+HOMEWORK_PREVIEW_QUALITY = 80
+HOMEWORK_PREVIEW_WORKERS = 2
+
+# Charts are rendered off the event loop in a bounded thread pool
+
+CHART_RENDER_WORKERS = 2
+
+# Submission ingestion: "sync" writes each submission inside the request,
+# "batched" acknowledges immediately and upserts buffered rows in batches.
+# Buffered rows live only in the worker's memory: a graceful shutdown
+# flushes them, but a killed worker (SIGKILL, OOM) loses up to
+# SUBMISSION_FLUSH_INTERVAL_MS of acknowledged submissions. Rows from
+# several workers never overwrite newer answers or a teacher's review.
+
+SUBMISSION_INGEST_MODE = "sync"
+SUBMISSION_BATCH_SIZE = 200
+SUBMISSION_FLUSH_INTERVAL_MS = 20
+
+# Notifications are written to an outbox table and delivered by
+# `manage.py send_notifications`. For local development run an SMTP
+# stand-in, e.g. `python -m aiosmtpd -n -l localhost:1025`
+
+NOTIFICATION_CHANNELS = [
+    "homework.notifications.InAppChannel",
+    "homework.notifications.EmailChannel",
+]
+NOTIFICATION_BATCH_SIZE = 500
+
+# A channel that fails is retried for the affected messages only, after
+# NOTIFICATION_RETRY_DELAY s times the attempt number; after
+# NOTIFICATION_MAX_ATTEMPTS the message is dropped and logged.
+# A batch is claimed for NOTIFICATION_CLAIM_TIMEOUT s in a short
+# transaction and delivered outside of it, so SMTP never holds a database
+# lock. A worker that dies mid-batch leaves it to be retried after the
+# claim expires, which can deliver those messages twice.
+
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_DELAY = 60
+NOTIFICATION_CLAIM_TIMEOUT = 300
+
+EMAIL_HOST = "localhost"
+EMAIL_PORT = 1025
+DEFAULT_FROM_EMAIL = "Homework Template Checker <noreply@homework-checker.local>"
+
+# Teacher dashboard change feed (long polling). A request waits up to
+# CHANGE_FEED_MAX_WAIT s only under ASGI: under WSGI every waiting tab
+# would pin a worker thread, so the wait is capped at
+# CHANGE_FEED_WSGI_MAX_WAIT and clients poll again after
+# CHANGE_FEED_WSGI_POLL_DELAY s. Rows changed within CHANGE_FEED_OVERLAP s
+# before the cursor are sent again, so a transaction that commits late
+# with an earlier updated_at is not skipped.
+
+CHANGE_FEED_MAX_WAIT = 25
+CHANGE_FEED_WSGI_MAX_WAIT = 0
+CHANGE_FEED_WSGI_POLL_DELAY = 10
+CHANGE_FEED_POLL_INTERVAL = 1.0
+CHANGE_FEED_PAGE_SIZE = 200
+CHANGE_FEED_OVERLAP = 5
+
+# Rendered answer-sheet fragments, keyed by homework questions_version
+
+ANSWER_SHEET_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Sheets with at least this many questions are parsed straight from POST
+# instead of building one Form per question
+
+ANSWER_SHEET_FAST_PATH_THRESHOLD = 100
+ANSWER_SHEET_MAX_ROWS = 1000
+
+# Student search for the enrollment forms (students/search/)
+
+STUDENT_SEARCH_PAGE_SIZE = 20
+
+# Item analysis, similarity reports and classroom percentile bands; also
+# invalidated by any submission to the homework
+
+ITEM_ANALYSIS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# A pair of students is flagged when they share at least this many wrong
+# answers and the shared answers are rare enough (sum of -ln(share of class))
+
+SIMILARITY_MIN_SHARED_WRONG = 2
+SIMILARITY_MIN_SCORE = 4.0
+SIMILARITY_MAX_PAIRS = 50
+
+# Performance rollups: (month, day) each school term starts on, in
+# school-year order starting from September
+
+SCHOOL_TERM_STARTS = ((9, 1), (11, 5), (1, 9), (4, 1))
+ANALYTICS_WEEKS_SHOWN = 12
+
+# Read-only JSON API (api/v1/)
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# Grading audit log: buffered events are written after a response once this
+# many have accumulated or the oldest is this many seconds old. Monthly
+# partitions older than the retention period are removed by
+# prune_grading_events.
+
+GRADING_EVENT_BATCH_SIZE = 500
+GRADING_EVENT_FLUSH_INTERVAL = 2.0
+GRADING_EVENT_RETENTION_MONTHS = 36
+
+# Prometheus metrics (/metrics). With several worker processes point
+# METRICS_DIR at a directory shared by them and empty it on deploy; each
+# process writes its counters there at most every METRICS_FLUSH_INTERVAL s.
+# Access is limited to METRICS_ALLOWED_IPS. Behind a reverse proxy list the
+# proxy addresses in METRICS_TRUSTED_PROXIES: for requests from them the
+# client address is taken from X-Forwarded-For (the rightmost entry not
+# added by a trusted proxy). Otherwise every request comes from the proxy.
+
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_TRUSTED_PROXIES = ()
+
+# Deadline scheduler (process_deadlines): homeworks are closed the day after
+# their deadline, missing students get a zero-score submission; reminders go
+# out DEADLINE_REMINDER_DAYS before the deadline. At most DEADLINE_BATCH_SIZE
+# homeworks are handled per pass.
+
+DEADLINE_REMINDER_DAYS = 1
+DEADLINE_BATCH_SIZE = 100
+
+# Archives of closed school years (archive_year / restore_archive): one
+# gzipped JSON Lines file per classroom; rows are deleted in transactions of
+# ARCHIVE_CHUNK_SIZE with a short pause so other writers are not blocked
+
+ARCHIVE_ROOT = BASE_DIR / "archive"
+ARCHIVE_CHUNK_SIZE = 500
+ARCHIVE_CHUNK_PAUSE = 0.05
+
+# Paper answer sheets (homework.omr): scanned pages are read in a process
+# pool of OMR_WORKERS (None = one per CPU); smaller batches are read in the
+# request process.
+
+OMR_WORKERS = None
+OMR_PARALLEL_MIN_PAGES = 8
+
+# Limits for one scan upload (homework.scans.iter_pages): ZIP nesting depth,
+# uncompressed size of a single member and of all members together, and the
+# number of pages including TIFF frames. Exceeding any rejects the upload.
+
+SCAN_MAX_ZIP_DEPTH = 2
+SCAN_MAX_FILE_SIZE = 50 * 1024 * 1024
+SCAN_MAX_TOTAL_SIZE = 500 * 1024 * 1024
+SCAN_MAX_PAGES = 1000
+
+# On-demand profiling of staff requests: add ?_profile=1 or the X-Profile
+# header. The request's own threads (the request thread, its sync_to_async
+# worker and every thread it queried the database from) are sampled every
+# PROFILING_INTERVAL s; memory is traced with tracemalloc, which is process
+# wide, so concurrent requests show up in the allocation figures. The result
+# is stored with its SQL queries as a RequestProfile (see the admin). With
+# PROFILING_ENABLED off the middleware is not installed.
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILING_INTERVAL = 0.005
+PROFILING_MAX_QUERIES = 500
+PROFILING_TOP_ALLOCATIONS = 30
+PROFILING_KEEP = 200
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,27 @@
+# Primary database with a read-only copy for charts and analytics. The copy
+# is refreshed by `python manage.py sync_replica --loop`; on PostgreSQL/MySQL
+# point 'replica' at a streaming replica instead.
+#
+#   DJANGO_SETTINGS_MODULE=homework_checker.settings_replica python manage.py migrate
+#
+# Together with schools (settings_tenants.py) add a replica per school and
+# put ReplicaRouter first:
+#
+#   READ_REPLICAS = {'school1': 'school1_replica', ...}
+#   DATABASE_ROUTERS = ['homework.replicas.ReplicaRouter', 'homework.tenants.TenantRouter']
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    **DATABASES,
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+READ_REPLICAS = {'default': 'replica'}
+
+DATABASE_ROUTERS = ['homework.replicas.ReplicaRouter']
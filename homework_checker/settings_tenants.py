@@ -0,0 +1,34 @@
+# Several schools on one deployment, each with its own SQLite file. Shared
+# tables (users, sessions, permissions) stay in db.sqlite3.
+#
+#   DJANGO_SETTINGS_MODULE=homework_checker.settings_tenants python manage.py migrate_tenants
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CACHES, DATABASES
+
+TENANT_DB_DIR = BASE_DIR / 'tenants'
+
+TENANTS = {
+    'school1': {'hosts': ['school1.localhost']},
+    'school2': {'hosts': ['school2.localhost']},
+}
+
+DATABASES = {
+    **DATABASES,
+    **{
+        name: {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': TENANT_DB_DIR / f'{name}.sqlite3',
+        }
+        for name in TENANTS
+    },
+}
+
+DATABASE_ROUTERS = ['homework.tenants.TenantRouter']
+
+CACHES = {
+    name: {**options, 'KEY_FUNCTION': 'homework.tenants.make_cache_key'}
+    for name, options in CACHES.items()
+}
+
+ALLOWED_HOSTS = [*ALLOWED_HOSTS, *(host for options in TENANTS.values() for host in options['hosts'])]